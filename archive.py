@@ -0,0 +1,184 @@
+import codecs
+import json
+import os
+from typing import Callable, Iterable, Iterator, Optional
+
+from db import BulkResult, Database, FilterType, Prompt
+
+# progress(已处理量, 总量): 导入按字节, 导出按记录数
+ProgressCallback = Callable[[int, int], None]
+
+CHUNK_SIZE = 1 << 16
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+
+def is_jsonl(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in JSONL_EXTENSIONS
+
+
+def iter_json_array(f, progress: Optional[ProgressCallback] = None,
+                    total: int = 0, chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """增量解析顶层为数组的JSON文件(二进制模式打开), 逐个产出数组元素
+
+    内存占用只与单条记录大小有关, 与文件大小无关.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ''
+    pos = 0
+    read = 0
+    eof = False
+    expect = '['  # 下一个期望的语法元素: '[' / 'value' / ','
+
+    def fill(size: int) -> bool:
+        nonlocal buf, pos, read, eof
+        data = f.read(size)
+        read += len(data)
+        eof = not data
+        buf = buf[pos:] + text_decoder.decode(data, final=eof)
+        pos = 0
+        if progress:
+            progress(read, total)
+        return not eof
+
+    while True:
+        # 跳过空白
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buf):
+            if eof or not fill(chunk_size):
+                raise ValueError("unexpected end of JSON array")
+            continue
+
+        char = buf[pos]
+        if expect == '[':
+            if char != '[':
+                raise ValueError("JSON root must be an array")
+            pos += 1
+            expect = 'first'
+        elif char == ']' and expect in ('first', ','):
+            return
+        elif expect == ',':
+            if char != ',':
+                raise ValueError("expected ',' or ']' between array items")
+            pos += 1
+            expect = 'value'
+        else:
+            size = chunk_size
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # 值恰好在缓冲区末尾时可能被截断(例如数字), 读入更多再确认
+                    if end < len(buf) or eof:
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # 单条记录跨越多个块时逐步加大读取量, 避免反复解析
+                fill(size)
+                size *= 2
+            pos = end
+            expect = ','
+            yield value
+
+
+def iter_jsonl(f, progress: Optional[ProgressCallback] = None, total: int = 0) -> Iterator:
+    """逐行解析JSONL文件(二进制模式打开), 无法解析的行产出ValueError交给bulk_upsert记录"""
+    read = 0
+    for line_no, line in enumerate(f, 1):
+        read += len(line)
+        if progress and line_no % 256 == 0:
+            progress(read, total)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"line {line_no}: {e}")
+    if progress:
+        progress(read, total)
+
+
+def iter_records(path: str, progress: Optional[ProgressCallback] = None) -> Iterator:
+    """按扩展名选择JSON数组或JSONL解析方式, 流式产出记录"""
+    total = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if is_jsonl(path):
+            yield from iter_jsonl(f, progress, total)
+        else:
+            yield from iter_json_array(f, progress, total)
+
+
+def import_file(db: Database, path: str, progress: Optional[ProgressCallback] = None,
+                batch_size: int = 500, is_builtin: Optional[bool] = False,
+                dedup_threshold: Optional[float] = None) -> BulkResult:
+    """流式导入JSON/JSONL文件, 记录直接进入批量写入流程
+
+    给出dedup_threshold时跳过与已有prompt近似重复的新记录, 记入result.skipped.
+    """
+    return import_records(db, iter_records(path, progress), batch_size, is_builtin, dedup_threshold)
+
+
+def import_records(db: Database, records: Iterable, batch_size: int = 500,
+                   is_builtin: Optional[bool] = False,
+                   dedup_threshold: Optional[float] = None) -> BulkResult:
+    skipped = []
+    if dedup_threshold is not None:
+        from dedup import skip_near_duplicates
+        records = skip_near_duplicates(db, records, dedup_threshold, skipped)
+    result = db.bulk_upsert(records, batch_size=batch_size, is_builtin=is_builtin)
+    result.skipped.extend(skipped)
+    return result
+
+
+def prompt_to_dict(p: Prompt) -> dict:
+    return {
+        'uuid': p.uuid,
+        'title': p.title,
+        'content': p.content,
+        'category': p.category,
+        'is_builtin': p.is_builtin,
+        **({'tags': p.tags} if p.tags else {})
+    }
+
+
+def write_json(f, prompts: Iterable[Prompt], progress: Optional[ProgressCallback] = None,
+               total: int = 0) -> int:
+    """逐条写出JSON数组, 格式与json.dump(indent=4)一致"""
+    count = 0
+    for p in prompts:
+        item = json.dumps(prompt_to_dict(p), ensure_ascii=False, indent=4)
+        f.write('[\n    ' if count == 0 else ',\n    ')
+        f.write(item.replace('\n', '\n    '))
+        count += 1
+        if progress and count % 256 == 0:
+            progress(count, total)
+    f.write('\n]' if count else '[]')
+    if progress:
+        progress(count, total)
+    return count
+
+
+def write_jsonl(f, prompts: Iterable[Prompt], progress: Optional[ProgressCallback] = None,
+                total: int = 0) -> int:
+    """每行一条记录写出JSONL"""
+    count = 0
+    for p in prompts:
+        f.write(json.dumps(prompt_to_dict(p), ensure_ascii=False))
+        f.write('\n')
+        count += 1
+        if progress and count % 256 == 0:
+            progress(count, total)
+    if progress:
+        progress(count, total)
+    return count
+
+
+def export_file(db: Database, path: str, filter_type: FilterType = "所有Prompt",
+                progress: Optional[ProgressCallback] = None) -> int:
+    """遍历数据库游标流式导出, 按扩展名选择JSON或JSONL格式"""
+    total = db.count_prompts(filter_type) if progress else 0
+    writer = write_jsonl if is_jsonl(path) else write_json
+    with open(path, 'w', encoding='utf-8') as f:
+        return writer(f, db.iter_prompts(filter_type), progress, total)
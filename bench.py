@@ -0,0 +1,304 @@
+"""db.Database 性能基准
+
+不依赖Tk界面. 生成指定规模的合成prompt库(中英文正文, 长度分布参考
+builtin_prompts.json), 测量写入、搜索、过滤、导入导出和启动耗时,
+结果以JSON写出, 可与之前版本的结果比较找出性能回退.
+--startup 改为在子进程中启动桌面程序, 分阶段测量冷启动耗时(没有图形界面时
+只测量导入和打开数据库).
+
+    python bench.py --sizes 1000,10000 --output bench.json
+    python bench.py --sizes 1000 --compare bench.json
+    python bench.py --startup --sizes 10000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Iterator, List
+
+import archive
+from db import KEYSET_ORDERS, Database, Prompt, PromptFilter
+
+BUILTIN_FILE = os.path.join(os.path.dirname(__file__), 'builtin_prompts.json')
+CATEGORIES = ['通用', '代码', '翻译', '写作', '分析', '教育', 'Marketing', 'Research']
+CJK_WORDS = ['请', '将', '以下', '内容', '翻译', '成', '专业', '自然', '生成', '技术', '文档',
+             '包括', '功能', '说明', '使用', '方法', '注意', '事项', '代码', '审查', '分析',
+             '思考', '协议', '问题', '回答', '用户', '需求', '总结', '优化', '结构', '示例']
+EN_WORDS = ['the', 'prompt', 'should', 'think', 'through', 'each', 'message', 'with', 'complexity',
+            'review', 'code', 'translate', 'document', 'response', 'context', 'analysis', 'human',
+            'natural', 'flow', 'consider', 'multiple', 'dimensions', 'problem', 'before', 'answer']
+# 冷启动目标: 进程启动到窗口首次绘制
+STARTUP_TARGET_MS = 300
+# main.py 记录的启动阶段, 依次为: 模块导入完成, 窗口框架创建完成, 首次绘制, 数据库打开, 列表显示
+STARTUP_PHASES = ('imports', 'shell', 'first_paint', 'database', 'list')
+# 没有图形界面时按桌面程序相同的顺序导入并打开数据库
+HEADLESS_STARTUP = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+phases = {'imports': (time.perf_counter() - start) * 1000}
+db, model = main.open_database(sys.argv[1])
+phases['database'] = (time.perf_counter() - start) * 1000
+print(json.dumps(phases))
+'''
+# 测试用搜索词: 短中文走LIKE, 三字及以上走FTS, 以及不存在的词
+SEARCH_KEYWORDS = ['翻译', '技术文档', 'review', 'code review', 'thinking protocol', 'zzzqqq']
+# 标签按长尾分布使用: tag0最常见, 编号越大越少见
+TAGS = [f'tag{i}' for i in range(200)]
+FACET_FILTERS = [
+    PromptFilter(tags=['tag0']),
+    PromptFilter(tags=['tag150']),
+    PromptFilter(tags=['tag0', 'tag1']),
+    PromptFilter(category='代码', tags=['tag2']),
+    PromptFilter(category='写作', is_builtin=False),
+    PromptFilter(tags=['tag3'], keyword='review'),
+]
+
+
+def load_seed_bodies() -> List[str]:
+    try:
+        with open(BUILTIN_FILE, 'r', encoding='utf-8') as f:
+            return [p['content'] for p in json.load(f) if p.get('content')]
+    except (OSError, ValueError):
+        return []
+
+
+def synthetic_prompts(count: int, seed: int = 42) -> Iterator[Prompt]:
+    """生成可复现的合成prompt: 多数为几百字, 少数为内置协议那样的长文"""
+    rng = random.Random(seed)
+    tag_rng = random.Random(seed + 1)   # 标签单独取随机数, 正文等与没有标签时相同
+    seeds = load_seed_bodies()
+    for i in range(count):
+        if seeds and rng.random() < 0.02:
+            content = rng.choice(seeds)  # 2% 直接使用内置长文
+        else:
+            length = int(min(rng.lognormvariate(5.5, 1.0), 20000))
+            parts = []
+            size = 0
+            while size < length:
+                if rng.random() < 0.5:
+                    words = ''.join(rng.choice(CJK_WORDS) for _ in range(rng.randint(4, 16))) + '。'
+                else:
+                    words = ' '.join(rng.choice(EN_WORDS) for _ in range(rng.randint(4, 16))) + '. '
+                parts.append(words)
+                size += len(words)
+            content = ''.join(parts)
+        title_words = CJK_WORDS if i % 2 else EN_WORDS
+        title = ' '.join(rng.choice(title_words) for _ in range(rng.randint(2, 4))) + f' {i}'
+        yield Prompt(
+            id=None,
+            uuid=str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            title=title,
+            content=content,
+            category=rng.choice(CATEGORIES),
+            is_builtin=False,
+            tags=[TAGS[min(int(tag_rng.paretovariate(0.8)) - 1, len(TAGS) - 1)]
+                  for _ in range(tag_rng.randint(0, 3))]
+        )
+
+
+def measure(fn: Callable, repeat: int = 1) -> dict:
+    """执行repeat次, 返回中位数/最小/最大耗时(秒)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        'seconds': statistics.median(times),
+        'min': min(times),
+        'max': max(times),
+        'repeat': repeat,
+    }
+
+
+def bench_size(size: int, workdir: str, repeat: int) -> List[dict]:
+    results = []
+
+    def record(op: str, stats: dict, **extra):
+        row = {'size': size, 'op': op, **stats, **extra}
+        results.append(row)
+        print(f"{size:>9} {op:<32} {stats['seconds'] * 1000:>10.2f} ms")
+
+    db_path = os.path.join(workdir, f'bench_{size}.db')
+    db = Database(db_path, sync_builtins=False)
+    # bulk_upsert边生成边写入; 单独测量生成耗时以便扣除
+    record('generate', measure(lambda: sum(1 for _ in synthetic_prompts(size))), records=size)
+    record('bulk_upsert', measure(lambda: db.bulk_upsert(synthetic_prompts(size))), records=size)
+    record('startup', measure(lambda: Database(db_path).close(), repeat))
+
+    extra = list(synthetic_prompts(200, seed=size + 1))
+    stats = measure(lambda: [db.save_prompt(p) for p in extra])
+    record('save_prompt', {k: (v / len(extra) if k != 'repeat' else v) for k, v in stats.items()},
+           per='call')
+
+    for keyword in SEARCH_KEYWORDS:
+        record(f'search_prompts[{keyword}]', measure(lambda: db.search_prompts(keyword), repeat))
+        record(f'search_summaries[{keyword}]', measure(lambda: db.search_summaries(keyword), repeat))
+        record(f'page_search_summaries[{keyword}]',
+               measure(lambda: db.page_search_summaries(keyword, 50), repeat))
+
+    for filter_type in ("所有Prompt", "内置Prompt", "自定义Prompt"):
+        record(f'get_filtered_prompts[{filter_type}]',
+               measure(lambda: db.get_filtered_prompts(filter_type), repeat))
+        record(f'get_filtered_summaries[{filter_type}]',
+               measure(lambda: db.get_filtered_summaries(filter_type), repeat))
+    for order_by in KEYSET_ORDERS:
+        # 翻到第二页: 首页读取加上一次按游标续读
+        record(f'page_summaries[{order_by}]', measure(lambda: db.page_summaries(
+            order_by=order_by, cursor=db.page_summaries(order_by=order_by).next_cursor), repeat))
+
+    record('category_counts', measure(db.category_counts, repeat))
+    record('tag_counts', measure(db.tag_counts, repeat))
+    for query in FACET_FILTERS:
+        label = ','.join(f'{k}={v}' for k, v in vars(query).items()
+                         if v is not None and v != () and (k != 'match_any_tag' or v))
+        record(f'count[{label}]', measure(lambda: db.count_prompts(query), repeat))
+        record(f'page[{label}]', measure(lambda: db.get_summaries_page(query, 50), repeat))
+        record(f'facets[{label}]', measure(lambda: db.facets(query), repeat))
+
+    for ext in ('json', 'jsonl'):
+        export_path = os.path.join(workdir, f'export_{size}.{ext}')
+        stats = measure(lambda: archive.export_file(db, export_path))
+        record(f'export_{ext}', stats, bytes=os.path.getsize(export_path))
+        import_db = Database(os.path.join(workdir, f'import_{size}_{ext}.db'), sync_builtins=False)
+        record(f'import_{ext}', measure(lambda: archive.import_file(import_db, export_path)))
+        import_db.close()
+
+    results.append({'size': size, 'op': 'db_file_bytes', 'seconds': 0,
+                    'bytes': os.path.getsize(db_path)})
+    db.close()
+    return results
+
+
+def has_display() -> bool:
+    if os.name == 'nt' or sys.platform == 'darwin':
+        return True
+    return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def run_startup(db_path: str, gui: bool) -> dict:
+    """在新进程中启动一次, 返回各阶段距启动的毫秒数和进程总耗时"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    if gui:
+        cmd = [sys.executable, os.path.join(here, 'main.py')]
+    else:
+        cmd = [sys.executable, '-c', HEADLESS_STARTUP, db_path]
+    env = dict(os.environ, PROMPT_DB=db_path, PROMPT_STARTUP_BENCH='1')
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=here, env=env, capture_output=True, text=True, timeout=120)
+    total = (time.perf_counter() - start) * 1000
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode or not lines:
+        raise RuntimeError(f"startup failed ({proc.returncode}): {proc.stderr.strip()[-500:]}")
+    phases = json.loads(lines[-1])
+    phases['process'] = total
+    return phases
+
+
+def bench_startup(size: int, workdir: str, repeat: int) -> List[dict]:
+    """冷启动分阶段耗时(各次运行的中位数), 与 STARTUP_TARGET_MS 比较首次绘制"""
+    db_path = os.path.join(workdir, f'startup_{size}.db')
+    db = Database(db_path, sync_builtins=False)
+    db.bulk_upsert(synthetic_prompts(size))
+    db.close()
+
+    gui = has_display()
+    run_startup(db_path, gui)   # 第一次启动会同步内置prompts和补齐统计, 不计入结果
+    runs = [run_startup(db_path, gui) for _ in range(repeat)]
+    results = []
+    for phase in (*STARTUP_PHASES, 'process'):
+        times = [run[phase] / 1000 for run in runs if phase in run]
+        if not times:
+            continue
+        stats = {'seconds': statistics.median(times), 'min': min(times), 'max': max(times),
+                 'repeat': len(times)}
+        results.append({'size': size, 'op': f'startup_{phase}', **stats})
+        print(f"{size:>9} {'startup_' + phase:<32} {stats['seconds'] * 1000:>10.2f} ms")
+    if gui:
+        paint = statistics.median(run['first_paint'] for run in runs)
+        verdict = 'OK' if paint <= STARTUP_TARGET_MS else 'SLOW'
+        print(f"{size:>9} first paint {paint:.0f} ms (target {STARTUP_TARGET_MS} ms) {verdict}")
+    else:
+        print(f"{size:>9} no display: window phases skipped")
+    return results
+
+
+def environment() -> dict:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        revision = ''
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> int:
+    """与基线结果比较, 打印变慢超过threshold比例的操作, 返回回退数量"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['size'], r['op']): r for r in json.load(f)['results']}
+    regressions = 0
+    for r in results:
+        base = baseline.get((r['size'], r['op']))
+        if not base or not base['seconds'] or not r['seconds']:
+            continue
+        ratio = r['seconds'] / base['seconds']
+        if ratio > 1 + threshold:
+            regressions += 1
+            print(f"REGRESSION {r['size']:>9} {r['op']:<32} x{ratio:.2f} "
+                  f"({base['seconds'] * 1000:.2f} -> {r['seconds'] * 1000:.2f} ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Database benchmark")
+    parser.add_argument('--sizes', default='1000,10000',
+                        help="逗号分隔的库规模, 例如 1000,10000,100000,1000000")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="结果JSON文件")
+    parser.add_argument('--compare', help="基线结果JSON文件")
+    parser.add_argument('--threshold', type=float, default=0.2, help="判定回退的变慢比例")
+    parser.add_argument('--keep', action='store_true', help="保留生成的数据库和导出文件")
+    parser.add_argument('--startup', action='store_true', help="只测量桌面程序的分阶段冷启动耗时")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='prompt_bench_')
+    results = []
+    try:
+        for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+            if args.startup:
+                results.extend(bench_startup(size, workdir, args.repeat))
+            else:
+                results.extend(bench_size(size, workdir, args.repeat))
+    finally:
+        if args.keep:
+            print(f"files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f,
+                      ensure_ascii=False, indent=4)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
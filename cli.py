@@ -0,0 +1,404 @@
+"""命令行入口, 与桌面程序共用 db.Database, 不导入tkinter/customtkinter
+
+    python cli.py search 翻译
+    python cli.py search "code review" --hybrid
+    python cli.py list --filter custom
+    python cli.py list --max-tokens 2000 --sort tokens-desc
+    python cli.py list --category 写作 --tag email --tag draft
+    python cli.py facets --filter custom --tag email
+    python cli.py tags 12 --set "email, draft"
+    python cli.py get 8a7b5c3e-1d2f-4e6a-9b8c-7d6e5f4c3b2a
+    python cli.py render 12 --var lang=English --var text=你好
+    python cli.py import prompts.jsonl
+    python cli.py import prompts/ --workers 4
+    python cli.py --db other.db export - | python cli.py import -
+    python cli.py export - --filter builtin > builtin.jsonl
+    python cli.py stats
+
+结果以JSONL逐行输出到stdout, 方便用管道交给其他工具处理.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from dataclasses import asdict
+
+import archive
+from db import KEYSET_ORDERS, Database, PromptFilter
+from profiling import PROFILER
+
+FILTERS = {
+    'all': "所有Prompt",
+    'builtin': "内置Prompt",
+    'custom': "自定义Prompt",
+}
+
+# --sort的取值 -> db.SORT_ORDERS的键; 降序不用前导'-', 否则argparse会把'-tokens'当成选项
+SORTS = {
+    'id': 'id',
+    'title': 'title',
+    'length': 'length',
+    'length-desc': '-length',
+    'tokens': 'tokens',
+    'tokens-desc': '-tokens',
+}
+
+
+def emit(record: dict, out=sys.stdout):
+    out.write(json.dumps(record, ensure_ascii=False))
+    out.write('\n')
+
+
+def cmd_search(db: Database, args):
+    if args.semantic or args.hybrid:
+        search = db.search_semantic if args.semantic else db.search_hybrid
+        for summary in search(args.keyword, limit=args.limit or 50):
+            emit(asdict(summary))
+        return 0
+    if args.snippets:
+        for hit in db.search_hits(args.keyword, limit=args.limit):
+            emit(asdict(hit))
+        return 0
+    first = min(args.limit, 500) if args.limit else 50
+    for summary in itertools.islice(db.stream_search_summaries(args.keyword, first=first), args.limit or None):
+        emit(asdict(summary))
+    return 0
+
+
+def query_filter(args):
+    """--filter加上--category/--tag/--keyword; 没有附加条件时就是过滤器名"""
+    if args.category is None and not args.tag and not args.keyword:
+        return FILTERS[args.filter]
+    return PromptFilter.from_filter_type(FILTERS[args.filter], category=args.category, tags=args.tag,
+                                         keyword=args.keyword, match_any_tag=args.any_tag)
+
+
+def cmd_list(db: Database, args):
+    order_by = SORTS[args.sort]
+    if args.min_tokens is not None or args.max_tokens is not None or order_by not in KEYSET_ORDERS:
+        summaries = db.filter_summaries(query_filter(args), args.min_tokens, args.max_tokens,
+                                        order_by=order_by)
+    elif order_by == 'id':
+        summaries = db.iter_summaries(query_filter(args))
+    else:
+        summaries = db.stream_summaries(query_filter(args), order_by)
+    for summary in summaries:
+        emit(asdict(summary))
+    return 0
+
+
+def cmd_get(db: Database, args):
+    status = 0
+    for key in args.keys:
+        prompt = db.get_prompt_by_id(int(key)) if key.isdigit() else db.get_prompt_by_uuid(key)
+        if prompt:
+            emit(asdict(prompt))
+        else:
+            emit({'error': 'not found', 'key': key}, sys.stderr)
+            status = 1
+    return status
+
+
+def parse_vars(pairs) -> dict:
+    variables = {}
+    for pair in pairs:
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f"--var expects name=value, got {pair!r}")
+        variables[name] = value
+    return variables
+
+
+def cmd_render(db: Database, args):
+    prompt = db._lookup_prompt(args.key)
+    if not prompt:
+        emit({'error': 'not found', 'key': args.key}, sys.stderr)
+        return 1
+    if args.variables:
+        compiled, _ = db.templates.compile(prompt.content, key=prompt.uuid)
+        for name in compiled.names:
+            emit({'name': name, 'default': compiled.defaults.get(name)})
+        return 0
+    base = parse_vars(args.var)
+    if args.vars_file:
+        # 每行一组变量, --var 给出的值作为公共部分
+        f = sys.stdin.buffer if args.vars_file == '-' else open(args.vars_file, 'rb')
+        with f:
+            variable_sets = [{**base, **record} if isinstance(record, dict) else record
+                             for record in archive.iter_jsonl(f)]
+    else:
+        variable_sets = [base]
+    result = db.render_prompt_batch(prompt.uuid, variable_sets, strict=args.strict)
+    for index, text in enumerate(result.outputs):
+        if text is not None:
+            emit({'index': index, 'text': text})
+    for error in result.errors:
+        emit(asdict(error), sys.stderr)
+    if args.timings:
+        emit({'renders': len(result.outputs), 'cached': result.cached,
+              'compile_ms': round(result.compile_ms, 3), 'render_ms': round(result.render_ms, 3)},
+             sys.stderr)
+    return 1 if result.errors else 0
+
+
+def cmd_history(db: Database, args):
+    revisions = db.list_revisions(args.key)
+    if not revisions:
+        emit({'error': 'no revisions', 'key': args.key}, sys.stderr)
+        return 1
+    for revision in revisions[:args.limit or None]:
+        record = asdict(revision)
+        if args.content:
+            record['content'] = db.get_revision_content(revision.id)
+        emit(record)
+    return 0
+
+
+def cmd_restore(db: Database, args):
+    if not db.restore_revision(args.revision_id):
+        emit({'error': 'restore failed', 'revision_id': args.revision_id}, sys.stderr)
+        return 1
+    emit({'restored': args.revision_id})
+    return 0
+
+
+def cmd_dupes(db: Database, args):
+    if args.key:
+        for match in db.find_near_duplicates(args.key, args.threshold):
+            emit(asdict(match))
+        return 0
+    for group in db.near_duplicates.find_duplicates(args.threshold):
+        emit({'size': len(group), 'prompts': [asdict(m) for m in group]})
+    return 0
+
+
+def cmd_tokens(db: Database, args):
+    if not args.keys:
+        start = time.perf_counter()
+        computed = db.backfill_stats(workers=args.workers)
+        emit({'computed': computed, 'seconds': round(time.perf_counter() - start, 3)})
+        return 0
+    status = 0
+    for key in args.keys:
+        stats = db.get_text_stats(key)
+        if stats:
+            emit({'key': key, **asdict(stats)})
+        else:
+            emit({'error': 'not found', 'key': key}, sys.stderr)
+            status = 1
+    return status
+
+
+def cmd_index(db: Database, args):
+    if not db.semantic:
+        emit({'error': 'semantic search requires numpy'}, sys.stderr)
+        return 1
+    start = time.perf_counter()
+    updated = db.semantic.rebuild() if args.rebuild else db.semantic.refresh()
+    emit({'updated': updated, 'indexed': len(db.semantic.vectors),
+          'seconds': round(time.perf_counter() - start, 3)})
+    return 0
+
+
+def cmd_import(db: Database, args):
+    status = 0
+    paths = [path for path in args.files if path != '-']
+    if '-' in args.files:
+        # 从stdin读取时按JSONL解析, 可以直接接上 export -
+        result = archive.import_records(db, archive.iter_jsonl(sys.stdin.buffer),
+                                        batch_size=args.batch_size, dedup_threshold=args.dedup)
+        for error in result.errors:
+            emit({'file': '-', **asdict(error)}, sys.stderr)
+        for skipped in result.skipped:
+            emit({'file': '-', 'skipped': True, **asdict(skipped)}, sys.stderr)
+        emit({'file': '-', 'written': result.written, 'changed': result.changed,
+              'errors': len(result.errors), 'skipped': len(result.skipped)})
+        status = 1 if result.errors else 0
+    if paths:
+        # 文件和目录走多进程流水线, 中断后再次运行从检查点继续
+        import importer
+        report = importer.run_import(db, paths, workers=args.workers, dedup_threshold=args.dedup,
+                                     restart=args.restart)
+        for error in report.errors:
+            emit(asdict(error), sys.stderr)
+        for skipped in report.skipped:
+            emit({'skipped': True, **asdict(skipped)}, sys.stderr)
+        emit(report.summary())
+        status = status or (1 if report.errors else 0)
+    return status
+
+
+def cmd_facets(db: Database, args):
+    query = query_filter(args)
+    if not isinstance(query, PromptFilter):
+        query = PromptFilter.from_filter_type(query)
+    emit(asdict(db.facets(query, tag_limit=args.limit)))
+    return 0
+
+
+def cmd_tags(db: Database, args):
+    key = args.key
+    prompt = db.get_prompt_by_id(int(key)) if key.isdigit() else db.get_prompt_by_uuid(key)
+    if not prompt:
+        emit({'error': 'not found', 'key': key}, sys.stderr)
+        return 1
+    if args.set is not None:
+        if not db.set_tags(prompt.id, args.set):
+            return 1
+        prompt.tags = db.get_tags(prompt.id)
+    emit({'id': prompt.id, 'uuid': prompt.uuid, 'tags': prompt.tags})
+    return 0
+
+
+def cmd_export(db: Database, args):
+    filter_type = query_filter(args)
+    if args.file == '-':
+        # 输出到stdout时总是使用JSONL, 可以边读边处理
+        archive.write_jsonl(sys.stdout, db.iter_prompts(filter_type))
+    else:
+        count = archive.export_file(db, args.file, filter_type)
+        emit({'file': args.file, 'exported': count})
+    return 0
+
+
+def cmd_stats(db: Database, args):
+    emit({
+        'db_path': db.db_path,
+        'db_bytes': os.path.getsize(db.db_path),
+        'total': db.count_prompts(FILTERS['all']),
+        'builtin': db.count_prompts(FILTERS['builtin']),
+        'custom': db.count_prompts(FILTERS['custom']),
+        'categories': db.category_counts(),
+        'tags': len(db.tag_counts()),
+        'schema_version': db.reader.execute('PRAGMA user_version').fetchone()[0],
+        'fts_enabled': db.fts_enabled,
+    })
+    return 0
+
+
+def add_filter_arguments(p: argparse.ArgumentParser):
+    p.add_argument('--filter', choices=FILTERS, default='all')
+    p.add_argument('--category', help="只包含该分类")
+    p.add_argument('--tag', action='append', default=[], help="只包含带有该标签的prompt, 可重复(同时带有)")
+    p.add_argument('--any-tag', action='store_true', help="带有任一--tag即可")
+    p.add_argument('--keyword', help="标题或正文包含的关键词")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description="Prompt Management command line")
+    parser.add_argument('--db', help="数据库路径, 默认使用程序目录下的prompts.db")
+    parser.add_argument('--no-sync', action='store_true', help="不同步内置prompts")
+    parser.add_argument('--profile', action='store_true', help="结束时在stderr输出各方法/SQL的耗时统计")
+    parser.add_argument('--trace', metavar='PATH', help="记录耗时并写出Chrome trace JSON(隐含--profile)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('search', help="搜索prompt")
+    p.add_argument('keyword')
+    p.add_argument('--limit', type=int, default=0, help="最多输出的结果数")
+    p.add_argument('--snippets', action='store_true', help="输出高亮标题和正文片段")
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument('--semantic', action='store_true', help="按语义相似度搜索(需要numpy)")
+    mode.add_argument('--hybrid', action='store_true', help="关键词与语义结果混合排序")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser('list', help="列出prompt摘要")
+    add_filter_arguments(p)
+    p.add_argument('--min-tokens', type=int)
+    p.add_argument('--max-tokens', type=int, help="例如 --max-tokens 2000 只列出2k token以内的prompt")
+    p.add_argument('--sort', choices=SORTS, default='id')
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser('get', help="按id或uuid输出完整prompt")
+    p.add_argument('keys', nargs='+')
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser('render', help="渲染prompt中的 {{变量}}")
+    p.add_argument('key', help="prompt的id或uuid")
+    p.add_argument('--var', action='append', default=[], metavar='NAME=VALUE')
+    p.add_argument('--vars-file', help="JSONL文件, 每行一组变量, '-'表示stdin")
+    p.add_argument('--strict', action='store_true', help="缺少变量时报错而不是保留占位符")
+    p.add_argument('--variables', action='store_true', help="只列出模板中的变量")
+    p.add_argument('--timings', action='store_true', help="把编译/渲染耗时输出到stderr")
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser('history', help="列出prompt的修订历史")
+    p.add_argument('key', help="prompt的id或uuid")
+    p.add_argument('--limit', type=int, default=0)
+    p.add_argument('--content', action='store_true', help="同时输出每个修订的正文")
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser('restore', help="把prompt恢复到指定修订")
+    p.add_argument('revision_id', type=int)
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser('dupes', help="查找近似重复的prompt")
+    p.add_argument('key', nargs='?', help="只查找与该prompt(id或uuid)相似的; 省略时列出所有重复组")
+    p.add_argument('--threshold', type=float, default=0.8, help="相似度阈值(0~1)")
+    p.set_defaults(func=cmd_dupes)
+
+    p = sub.add_parser('tokens', help="输出prompt的字符/词/token统计; 省略key时为所有prompt补齐统计")
+    p.add_argument('keys', nargs='*', help="prompt的id或uuid")
+    p.add_argument('--workers', type=int, help="回填使用的进程数, 默认为CPU核数")
+    p.set_defaults(func=cmd_tokens)
+
+    p = sub.add_parser('index', help="建立或增量更新语义搜索的向量索引")
+    p.add_argument('--rebuild', action='store_true', help="丢弃现有向量重新建立")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser('import', help="导入JSON/JSONL/Markdown文件或目录, '-'表示从stdin读取JSONL")
+    p.add_argument('files', nargs='+')
+    p.add_argument('--batch-size', type=int, default=500, help="从stdin导入时每批写入的记录数")
+    p.add_argument('--workers', type=int, help="解析进程数, 默认为CPU核数")
+    p.add_argument('--restart', action='store_true', help="忽略上次导入留下的检查点")
+    p.add_argument('--dedup', type=float, metavar='THRESHOLD',
+                   help="跳过与已有prompt相似度不低于THRESHOLD(0~1)的新记录")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser('export', help="导出到JSON/JSONL文件, '-'表示以JSONL写到stdout")
+    p.add_argument('file')
+    add_filter_arguments(p)
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('facets', help="按分类和标签统计过滤结果的数量")
+    add_filter_arguments(p)
+    p.add_argument('--limit', type=int, default=50, help="最多输出的标签数")
+    p.set_defaults(func=cmd_facets)
+
+    p = sub.add_parser('tags', help="输出或替换prompt的标签")
+    p.add_argument('key', help="prompt的id或uuid")
+    p.add_argument('--set', metavar='TAGS', help="用逗号分隔的标签替换现有标签, 空字符串表示清空")
+    p.set_defaults(func=cmd_tags)
+
+    p = sub.add_parser('stats', help="数据库统计")
+    p.set_defaults(func=cmd_stats)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    # Windows控制台默认编码可能无法输出中文
+    for stream in (sys.stdout, sys.stderr):
+        if hasattr(stream, 'reconfigure'):
+            stream.reconfigure(encoding='utf-8')
+    if args.profile or args.trace:
+        # 必须在打开数据库之前启用, 连接才会记录SQL
+        PROFILER.enable()
+    db = Database(args.db, sync_builtins=not args.no_sync)
+    try:
+        return args.func(db, args)
+    except BrokenPipeError:
+        # 下游(例如head)提前关闭管道
+        sys.stderr.close()
+        return 0
+    finally:
+        db.close()
+        if args.trace:
+            PROFILER.export_chrome_trace(args.trace)
+        if args.profile and not sys.stderr.closed:
+            print(PROFILER.report(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
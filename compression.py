@@ -0,0 +1,328 @@
+"""prompts.content 的可选压缩存储
+
+开启后, UTF-8长度超过阈值的正文以zlib压缩存放在 content_z 列(content 置为空串),
+可选使用从现有正文训练出的共享字典. 每个连接都注册了SQL函数
+prompt_text(content, content_z), 读取完整prompt、全文索引和LIKE搜索通过它解压,
+列表摘要不读取正文因此不会解压.
+
+    python compression.py --enable --train          开启压缩, 训练字典并重新压缩现有数据
+    python compression.py --disable                 关闭压缩并解压所有正文
+    python compression.py --benchmark --size 5000   比较两种存储方式的大小、冷读取和搜索耗时
+
+保存在数据库中的触发器只处理未压缩的行, 压缩行的全文索引由应用写连接上的临时触发器
+维护(见migrations.PLAIN_TRIGGERS), 其他SQLite客户端也可以修改prompts表.
+压缩设置保存在meta表中, 写连接在每个写事务开始时发现其他进程提交过写入就重新读取.
+"""
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+from urllib.parse import quote
+
+HEADER = struct.Struct('>I')    # 压缩数据前的字典id, 0表示未使用字典
+DEFAULT_THRESHOLD = 2048        # 字节, 短正文压缩收益很小
+DEFAULT_LEVEL = 9
+DICT_SIZE = 32 * 1024           # zlib窗口为32KB, 更大的字典用不到
+SETTINGS_KEY = 'compression'
+# 训练字典时按行和句子切分正文
+FRAGMENT_RE = re.compile(r'(?<=[\n。！？；.!?;])')
+
+
+class ContentCodec:
+    """正文编码/解码, decode注册为每个连接上的SQL函数prompt_text"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.enabled = False
+        self.threshold = DEFAULT_THRESHOLD
+        self.level = DEFAULT_LEVEL
+        self.dict_id = 0
+        self._dicts = {}
+        self._lock = threading.Lock()
+
+    def configure(self, settings: dict):
+        self.enabled = bool(settings.get('enabled', False))
+        self.threshold = int(settings.get('threshold', DEFAULT_THRESHOLD))
+        self.level = int(settings.get('level', DEFAULT_LEVEL))
+        self.dict_id = int(settings.get('dict_id', 0))
+
+    def load(self, conn: sqlite3.Connection):
+        """从meta表读取设置"""
+        try:
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (SETTINGS_KEY,)).fetchone()
+        except sqlite3.OperationalError:   # 新数据库, 迁移还没有建表
+            return
+        self.configure(json.loads(row[0]) if row else {})
+
+    def settings(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'level': self.level,
+            'dict_id': self.dict_id,
+        }
+
+    def encode(self, content: str) -> Tuple[str, Optional[bytes]]:
+        """返回写入 (content, content_z) 两列的值"""
+        if not self.enabled:
+            return content, None
+        raw = content.encode('utf-8')
+        if len(raw) < self.threshold:
+            return content, None
+        zdict = self.dictionary(self.dict_id)
+        compressor = zlib.compressobj(self.level, zdict=zdict) if zdict else zlib.compressobj(self.level)
+        blob = HEADER.pack(self.dict_id if zdict else 0) + compressor.compress(raw) + compressor.flush()
+        if len(blob) >= len(raw):
+            return content, None
+        return '', blob
+
+    def decode(self, content: str, blob: Optional[bytes]) -> str:
+        if blob is None:
+            return content
+        dict_id, = HEADER.unpack_from(blob)
+        data = memoryview(blob)[HEADER.size:]
+        if dict_id:
+            decompressor = zlib.decompressobj(zdict=self.dictionary(dict_id))
+            raw = decompressor.decompress(data) + decompressor.flush()
+        else:
+            raw = zlib.decompress(data)
+        return raw.decode('utf-8')
+
+    def dictionary(self, dict_id: int) -> Optional[bytes]:
+        if not dict_id:
+            return None
+        with self._lock:
+            zdict = self._dicts.get(dict_id)
+        if zdict is None:
+            # 字典写入后不再修改, 读取一次后缓存在进程内;
+            # 使用独立连接, 因为这里可能运行在调用方连接的SQL函数回调中
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True)
+            try:
+                row = conn.execute('SELECT data FROM compression_dicts WHERE id = ?',
+                                   (dict_id,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                raise ValueError(f"compression dictionary {dict_id} not found")
+            zdict = bytes(row[0])
+            with self._lock:
+                self._dicts[dict_id] = zdict
+        return zdict
+
+    def add_dictionary(self, conn: sqlite3.Connection, zdict: bytes) -> int:
+        """在调用方的写事务中保存字典, 返回字典id"""
+        cursor = conn.execute('INSERT INTO compression_dicts (data, created_at) VALUES (?, ?)',
+                              (zdict, time.time()))
+        with self._lock:
+            self._dicts[cursor.lastrowid] = zdict
+        return cursor.lastrowid
+
+    def register(self, conn: sqlite3.Connection):
+        conn.create_function('prompt_text', 2, self.decode, deterministic=True)
+
+
+def train_dictionary(samples: Iterable[str], size: int = DICT_SIZE) -> bytes:
+    """从样本正文中挑选在多篇中重复出现的行/句子组成zlib预置字典
+
+    按 (出现的篇数 - 1) * 长度 打分; zlib优先匹配离当前位置近的数据,
+    因此得分最高的片段放在字典末尾.
+    """
+    counts = Counter()
+    for text in samples:
+        counts.update({f for f in FRAGMENT_RE.split(text) if len(f.strip()) >= 8})
+    scored = sorted(((n - 1) * len(f.encode('utf-8')), f) for f, n in counts.items() if n > 1)
+    chosen = []
+    total = 0
+    for score, fragment in reversed(scored):
+        data = fragment.encode('utf-8')
+        if total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    return b''.join(reversed(chosen))
+
+
+def recompress(db, enable: bool = True, threshold: int = DEFAULT_THRESHOLD,
+               level: int = DEFAULT_LEVEL, train: bool = False, sample_size: int = 2000,
+               chunk_size: int = 500, progress=None) -> dict:
+    """按新设置重写所有正文(enable=False时全部解压), 每批一个写事务"""
+    codec = db.connections.codec
+    settings = {'enabled': enable, 'threshold': threshold, 'level': level,
+                'dict_id': codec.dict_id if enable else 0}
+    if enable and train:
+        cursor = db.reader.execute('''
+            SELECT prompt_text(content, content_z) FROM prompts
+            WHERE content_length * 3 >= ? ORDER BY random() LIMIT ?
+        ''', (threshold, sample_size))
+        zdict = train_dictionary(row[0] for row in cursor)
+        if zdict:
+            with db.connections.write() as conn:
+                settings['dict_id'] = codec.add_dictionary(conn, zdict)
+    codec.configure(settings)
+    db.set_meta(SETTINGS_KEY, json.dumps(settings))
+
+    stats = {'rows': 0, 'rewritten': 0, 'compressed': 0, 'dict_id': settings['dict_id']}
+    last_id = 0
+    while True:
+        with db.connections.write() as conn:
+            rows = conn.execute('''
+                SELECT id, content, content_z FROM prompts WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            updates = []
+            for id_, content, blob in rows:
+                encoded = codec.encode(codec.decode(content, blob))
+                if encoded != (content, blob):
+                    updates.append((*encoded, id_))
+                stats['compressed'] += encoded[1] is not None
+            conn.executemany('UPDATE prompts SET content = ?, content_z = ? WHERE id = ?', updates)
+        stats['rows'] += len(rows)
+        stats['rewritten'] += len(updates)
+        last_id = rows[-1][0]
+        if progress:
+            progress(stats['rows'])
+    db.prompt_cache.clear()
+    return stats
+
+
+def _vacuum(db_path: str):
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def _measure_layout(db_path: str, sample_ids: list, keywords: list, repeat: int) -> dict:
+    import statistics
+
+    from db import Database
+
+    _vacuum(db_path)
+    result = {'db_bytes': os.path.getsize(db_path)}
+    # 冷读取: 每次新建连接(页缓存为空)读取一个prompt
+    cold = []
+    for prompt_id in sample_ids:
+        start = time.perf_counter()
+        db = Database(db_path, readonly=True)
+        db.get_prompt_by_id(prompt_id)
+        cold.append(time.perf_counter() - start)
+        db.close()
+    result['cold_read_ms'] = statistics.median(cold) * 1000
+
+    db = Database(db_path, readonly=True)
+    warm = []
+    for prompt_id in sample_ids:
+        db.prompt_cache.clear()
+        start = time.perf_counter()
+        db.get_prompt_by_id(prompt_id)
+        warm.append(time.perf_counter() - start)
+    result['warm_read_ms'] = statistics.median(warm) * 1000
+    for keyword in keywords:
+        for name, fn in (('search_prompts', db.search_prompts), ('search_hits', db.search_hits)):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn(keyword)
+                times.append(time.perf_counter() - start)
+            result[f'{name}[{keyword}]_ms'] = statistics.median(times) * 1000
+    start = time.perf_counter()
+    sum(1 for _ in db.iter_prompts())
+    result['iter_prompts_ms'] = (time.perf_counter() - start) * 1000
+    db.close()
+    return result
+
+
+def benchmark(db_path: Optional[str] = None, size: int = 5000, threshold: int = DEFAULT_THRESHOLD,
+              level: int = DEFAULT_LEVEL, repeat: int = 5, samples: int = 50) -> dict:
+    """在临时副本上比较原始存储与压缩存储(带字典/不带字典)"""
+    import random
+    import shutil
+    import tempfile
+
+    import bench
+    from db import Database
+
+    workdir = tempfile.mkdtemp(prefix='prompt_compress_')
+    try:
+        raw_path = os.path.join(workdir, 'raw.db')
+        if db_path:
+            source = sqlite3.connect(db_path)
+            target = sqlite3.connect(raw_path)
+            with target:
+                source.backup(target)
+            source.close()
+            target.close()
+            db = Database(raw_path, sync_builtins=False)
+            recompress(db, enable=False)
+        else:
+            db = Database(raw_path)
+            db.bulk_upsert(bench.synthetic_prompts(size))
+        ids = [row[0] for row in db.reader.execute('SELECT id FROM prompts')]
+        db.close()
+        sample_ids = random.Random(0).sample(ids, min(samples, len(ids)))
+
+        layouts = {'raw': raw_path}
+        for name, train in (('zlib', False), ('zlib+dict', True)):
+            path = os.path.join(workdir, f'{name}.db')
+            shutil.copy(raw_path, path)
+            db = Database(path, sync_builtins=False)
+            stats = recompress(db, threshold=threshold, level=level, train=train)
+            db.close()
+            print(f"{name}: {stats['compressed']} of {stats['rows']} bodies compressed")
+            layouts[name] = path
+        return {name: _measure_layout(path, sample_ids, bench.SEARCH_KEYWORDS, repeat)
+                for name, path in layouts.items()}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="prompts.content compression")
+    parser.add_argument('--db', help="数据库路径, 默认使用程序目录下的prompts.db")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--enable', action='store_true', help="开启压缩并重写现有正文")
+    group.add_argument('--disable', action='store_true', help="关闭压缩并解压所有正文")
+    group.add_argument('--benchmark', action='store_true', help="在临时副本上比较存储方式")
+    parser.add_argument('--train', action='store_true', help="从现有正文训练共享字典")
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD, help="压缩阈值(字节)")
+    parser.add_argument('--level', type=int, default=DEFAULT_LEVEL)
+    parser.add_argument('--vacuum', action='store_true', help="完成后VACUUM回收空间")
+    parser.add_argument('--size', type=int, default=5000, help="基准测试生成的prompt数量")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        results = benchmark(args.db, args.size, args.threshold, args.level)
+        names = list(results)
+        print(f"{'metric':<40}" + ''.join(f'{n:>14}' for n in names))
+        for metric in results[names[0]]:
+            print(f"{metric:<40}" + ''.join(f'{results[n][metric]:>14.2f}' for n in names))
+        return
+
+    from db import Database
+
+    db = Database(args.db, sync_builtins=False)
+    try:
+        start = time.perf_counter()
+        stats = recompress(db, enable=args.enable, threshold=args.threshold, level=args.level,
+                           train=args.train,
+                           progress=lambda rows: print(f"\r{rows} rows", end='', flush=True))
+        print(f"\n{stats} in {time.perf_counter() - start:.1f} s")
+    finally:
+        db.close()
+    if args.vacuum:
+        _vacuum(db.db_path)
+        print(f"db size: {os.path.getsize(db.db_path)} bytes")
+
+
+if __name__ == '__main__':
+    main()
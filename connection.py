@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+from urllib.parse import quote
+
+from compression import ContentCodec
+from profiling import connection_factory
+
+# 每个连接都会设置的PRAGMA
+CONNECTION_PRAGMAS = (
+    ('busy_timeout', 5000),          # 等待锁而不是立即报 "database is locked"
+    ('cache_size', -16000),          # 页缓存16MB(负数单位为KiB)
+    ('mmap_size', 256 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+# 只需要在写连接上设置的PRAGMA; WAL模式写入数据库文件后对所有连接生效
+WRITER_PRAGMAS = (
+    ('journal_mode', 'WAL'),          # 读写互不阻塞
+    ('synchronous', 'NORMAL'),        # WAL下只在检查点fsync, 崩溃不会损坏数据库
+)
+# 每个连接缓存的预编译语句数量(sqlite3默认128)
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionManager:
+    """SQLite连接管理: 一个共享的写连接 + 每个线程各自的只读连接
+
+    所有写操作通过 write() 串行执行; 读操作使用当前线程的 reader(),
+    在WAL模式下读连接看到的是最近一次提交的数据, 不会被写事务阻塞.
+    """
+
+    def __init__(self, db_path: str, readonly: bool = False,
+                 statement_cache_size: int = STATEMENT_CACHE_SIZE):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.statement_cache_size = statement_cache_size
+        self.write_lock = threading.RLock()
+        self._writer = None
+        self._local = threading.local()
+        self._writer_setup: List[Callable[[sqlite3.Connection], None]] = []
+        self._data_version = None
+        # 正文压缩编解码, 所有连接上注册SQL函数prompt_text()
+        self.codec = ContentCodec(db_path)
+
+    def _configure(self, conn: sqlite3.Connection, pragmas) -> sqlite3.Connection:
+        for name, value in pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        self.codec.register(conn)
+        return conn
+
+    @property
+    def writer(self) -> sqlite3.Connection:
+        """共享写连接, 可能被多个线程使用, 调用方需持有write_lock"""
+        if self.readonly:
+            raise sqlite3.OperationalError("database opened read-only")
+        if self._writer is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   cached_statements=self.statement_cache_size,
+                                   factory=connection_factory())
+            self._configure(conn, CONNECTION_PRAGMAS)
+            self._configure(conn, WRITER_PRAGMAS)
+            for setup in self._writer_setup:
+                setup(conn)
+            self._writer = conn
+        return self._writer
+
+    def add_writer_setup(self, setup: Callable[[sqlite3.Connection], None]):
+        """写连接打开时执行的设置(例如临时触发器), 已打开的写连接立即执行"""
+        with self.write_lock:
+            if setup in self._writer_setup:
+                return
+            self._writer_setup.append(setup)
+            if self._writer is not None:
+                setup(self._writer)
+
+    def reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, cached_statements=self.statement_cache_size,
+                                   factory=connection_factory())
+            self._configure(conn, CONNECTION_PRAGMAS)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """串行化的写事务: 正常结束时提交, 出错时回滚"""
+        with self.write_lock:
+            conn = self.writer
+            # 其他进程提交过写入(可能修改了压缩设置)时重新读取设置, 所有进程按相同设置写入
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._data_version:
+                self._data_version = version
+                self.codec.load(conn)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def close_reader(self):
+        """关闭当前线程的读连接(读连接只能在创建它的线程关闭)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def close(self):
+        """关闭写连接和当前线程的读连接"""
+        with self.write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                self._data_version = None
+        self.close_reader()
@@ -1,10 +1,21 @@
 import sqlite3
-from dataclasses import dataclass
-from typing import List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import base64
+import hashlib
 import json
 import os
+import re
+import threading
 import uuid
 
+from connection import ConnectionManager
+from migrations import MigrationRunner, install_temp_triggers, table_exists
+from profiling import PROFILER
+import revisions
+from revisions import Revision
+
 @dataclass
 class Prompt:
     id: Optional[int]  # 数据库自增ID
@@ -13,122 +24,868 @@ class Prompt:
     content: str
     category: str
     is_builtin: bool
+    tags: Optional[List[str]] = None   # None表示未读取/保存时不修改标签
+
+    @classmethod
+    def from_dict(cls, data: dict, is_builtin: bool = False) -> 'Prompt':
+        """从导入/内置JSON记录创建Prompt, 缺失字段使用默认值"""
+        if not isinstance(data, dict):
+            raise ValueError(f"record must be an object, got {type(data).__name__}")
+        return cls(
+            id=None,
+            uuid=data.get('uuid') or str(uuid.uuid4()),
+            title=data.get('title', ''),
+            content=data.get('content', ''),
+            category=data.get('category', '通用'),
+            is_builtin=is_builtin,
+            tags=normalize_tags(data['tags']) if 'tags' in data else None
+        )
+
+@dataclass
+class RecordError:
+    """批量写入中单条记录的错误"""
+    index: int      # 记录在输入中的序号
+    uuid: str
+    message: str
+
+@dataclass
+class BulkResult:
+    """批量写入结果"""
+    written: int = 0    # 成功写入(插入或更新)的记录数
+    changed: int = 0    # 实际发生变化的行数, 内容相同的记录不会重写
+    errors: List[RecordError] = field(default_factory=list)
+    skipped: List[RecordError] = field(default_factory=list)   # 按要求跳过的记录, 例如近似重复
+
+@dataclass
+class PromptSummary:
+    """列表展示用的轻量记录, 不含content"""
+    id: int
+    uuid: str
+    title: str
+    category: str
+    is_builtin: bool
+    content_length: int
+    tokens: Optional[int] = None   # 近似token数(见textstats.py), 还没有统计时为None
+
+@dataclass
+class PromptFilter:
+    """可组合的过滤条件, 各条件之间为AND, 为None/空的条件不限制
+
+    所有接受filter_type的列表/计数方法也接受PromptFilter.
+    """
+    category: Optional[str] = None
+    tags: Union[str, Sequence[str]] = ()   # 标签列表或逗号分隔的字符串; 默认要求带有全部标签, match_any_tag时任一即可
+    is_builtin: Optional[bool] = None
+    keyword: Optional[str] = None     # 标题或正文包含的关键词, 与search_prompts的匹配规则相同
+    match_any_tag: bool = False
+
+    @classmethod
+    def from_filter_type(cls, filter_type: str, **kwargs) -> 'PromptFilter':
+        """过滤器按钮("所有Prompt"等)加上其他条件"""
+        # 与FILTER_CLAUSES一致: 未知的过滤器按自定义处理
+        is_builtin = {"所有Prompt": None, "内置Prompt": True}.get(filter_type, False)
+        return cls(is_builtin=is_builtin, **kwargs)
+
+    @property
+    def is_simple(self) -> bool:
+        """只按分类/内置过滤, 计数可以直接从categories表得到"""
+        return not self.tags and not self.keyword
+
+@dataclass
+class Facets:
+    """过滤结果的分面计数"""
+    total: int
+    builtin: int
+    categories: Dict[str, int]   # 分类 -> 数量, 按数量降序
+    tags: Dict[str, int]         # 标签 -> 数量, 按数量降序
+
+@dataclass
+class Page:
+    """键集分页的一页结果"""
+    items: list
+    next_cursor: Optional[str]   # 传给下一次调用继续读取, 没有更多结果时为None
+
+@dataclass
+class SearchHit:
+    """搜索命中结果, 只包含列表展示需要的字段和高亮片段, 不含完整content"""
+    id: int
+    uuid: str
+    title: str
+    category: str
+    is_builtin: bool
+    title_highlight: str  # 标题中命中部分已用高亮标记包裹
+    snippet: str          # content中命中位置附近的片段
+    rank: float           # 越小越相关(BM25)
+
+# 全文索引使用trigram分词, 中文无需分词也能按子串匹配; 少于3个字符的关键词无法走索引
+FTS_MIN_KEYWORD_LEN = 3
+# BM25权重: 标题命中比正文命中更重要
+FTS_TITLE_WEIGHT = 10.0
+FTS_CONTENT_WEIGHT = 1.0
+
+# 正文可能压缩存放在content_z中(见compression.py), 读取完整prompt时才解压
+CONTENT_TEXT = 'prompt_text(content, content_z)'
+PROMPT_COLUMNS = f'id, uuid, title, {CONTENT_TEXT}, category, is_builtin'
+# token数按正文哈希从统计缓存中查找(主键查找), 结果列名为tokens, 可以用于WHERE/ORDER BY
+SUMMARY_COLUMNS = ('id, uuid, title, category, is_builtin, content_length, '
+                   '(SELECT s.tokens FROM text_stats s WHERE s.content_hash = prompts.content_hash) AS tokens')
+
+# 标签名用\x1f连接成一列(主键前缀查找), 由split_tags拆开
+TAGS_COLUMN = ('(SELECT group_concat(t.name, char(31)) FROM prompt_tags pt '
+               'JOIN tags t ON t.id = pt.tag_id WHERE pt.prompt_id = prompts.id)')
+TAGGED_PROMPT_COLUMNS = f'{PROMPT_COLUMNS}, {TAGS_COLUMN}'
+# 按id分页时, 带有某标签的prompt超过候选行的这个比例就逐行检查该标签, 否则先按标签取出候选
+TAG_SCAN_RATIO = 0.05
+# 标签候选不超过这个数量时关键词逐行LIKE匹配, 不使用全文索引
+KEYWORD_SCAN_LIMIT = 5000
+TAG_SEPARATORS = re.compile(r'[,，;；\n]')
+MAX_TAG_LENGTH = 64
+
+# 键集分页的排序: 排序键列(最后一列唯一), 下一页从上一页最后一行的键之后开始;
+# 按标题使用idx_prompts_title(索引按title, rowid排序). 搜索结果另有'rank'(相关度, id)
+KEYSET_ORDERS = {
+    'id': ('id',),
+    'title': ('title', 'id'),
+}
+
+# filter_summaries 的排序方式; 没有统计的prompt总是排在最后
+SORT_ORDERS = {
+    'id': 'id',
+    'title': 'title, id',
+    'length': 'content_length, id',
+    '-length': 'content_length DESC, id',
+    'tokens': 'tokens IS NULL, tokens, id',
+    '-tokens': 'tokens IS NULL, tokens DESC, id',
+}
+
+# LIKE搜索: 未压缩的正文直接匹配, 只有压缩的行才调用prompt_text()解压
+LIKE_FILTER = f'title LIKE ? OR content LIKE ? OR (content_z IS NOT NULL AND {CONTENT_TEXT} LIKE ?)'
+
+UPSERT_SQL = '''
+    INSERT INTO prompts (uuid, title, content, content_z, category, is_builtin, content_length,
+                         content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(uuid) DO UPDATE SET
+        title = excluded.title,
+        content = excluded.content,
+        content_z = excluded.content_z,
+        content_length = excluded.content_length,
+        content_hash = excluded.content_hash,
+        category = excluded.category,
+        is_builtin = excluded.is_builtin
+    WHERE title IS NOT excluded.title OR content IS NOT excluded.content
+       OR content_z IS NOT excluded.content_z
+       OR category IS NOT excluded.category OR is_builtin IS NOT excluded.is_builtin
+'''
+
+# 过滤器按钮对应的WHERE条件
+FILTER_CLAUSES = {
+    "所有Prompt": '',
+    "内置Prompt": 'WHERE is_builtin = 1',
+    "自定义Prompt": 'WHERE is_builtin = 0',
+}
+# 列表/计数方法的过滤参数: 过滤器按钮名或PromptFilter
+FilterType = Union[str, PromptFilter]
+
+def normalize_tags(tags: Union[str, Iterable[str], None]) -> List[str]:
+    """整理标签: 字符串按逗号/分号/换行拆分, 去掉首尾空白和空标签, 忽略大小写去重(保留第一次的写法)"""
+    if tags is None:
+        return []
+    if isinstance(tags, str):
+        tags = TAG_SEPARATORS.split(tags)
+    elif not isinstance(tags, (list, tuple, set)):
+        raise ValueError(f"tags must be a list or a string, got {type(tags).__name__}")
+    result, seen = [], set()
+    for tag in tags:
+        if not isinstance(tag, str):
+            raise ValueError(f"tag must be a string, got {type(tag).__name__}")
+        tag = ' '.join(tag.replace('\x1f', ' ').split())
+        if len(tag) > MAX_TAG_LENGTH:
+            raise ValueError(f"tag longer than {MAX_TAG_LENGTH} characters: {tag[:20]}...")
+        if tag and tag.casefold() not in seen:
+            seen.add(tag.casefold())
+            result.append(tag)
+    return result
+
+def encode_cursor(order: str, key: Sequence) -> str:
+    """排序方式和最后一行的排序键 -> 不透明的游标字符串"""
+    data = json.dumps([order, *key], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, order: str, size: int) -> list:
+    """游标 -> 排序键; 游标无效或不是这种排序产生的时抛出ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(data, list) or len(data) != size + 1 or data[0] != order:
+        raise ValueError(f"cursor does not belong to order {order!r}")
+    return data[1:]
+
+def split_tags(value: Optional[str]) -> List[str]:
+    """TAGS_COLUMN的值 -> 按名称排序的标签列表"""
+    return sorted(value.split('\x1f'), key=str.casefold) if value else []
+
+def tagged_prompt(row) -> Prompt:
+    """按TAGGED_PROMPT_COLUMNS读取的行 -> 带标签的Prompt"""
+    return Prompt(*row[:6], tags=split_tags(row[6]))
+
+class LRUCache:
+    """容量固定的LRU缓存(后台写队列和界面线程共用, 加锁)"""
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self):
+        """不改变访问顺序的快照"""
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
 
 class Database:
-    def __init__(self):
-        # 使用项目根目录下的数据库文件
-        db_path = os.path.join(os.path.dirname(__file__), 'prompts.db')
-        self.conn = sqlite3.connect(db_path)
-        self.create_tables()
-        self.load_builtin_prompts()
+    def __init__(self, db_path: Optional[str] = None, readonly: bool = False,
+                 sync_builtins: bool = True):
+        # 默认使用项目根目录下的数据库文件
+        self.db_path = db_path or os.path.join(os.path.dirname(__file__), 'prompts.db')
+        # 最近打开的prompt正文, 写操作时失效
+        self.prompt_cache = LRUCache(maxsize=32)
+        self._templates = None
+        self._near_duplicates = None
+        self._semantic = None
+        # 一个写连接 + 每线程一个读连接, 搜索/导入/UI可以并发访问
+        self.connections = ConnectionManager(self.db_path, readonly=readonly)
+        if readonly:
+            # 只读实例不建表也不同步内置prompts
+            self.fts_enabled = table_exists(self.reader, 'prompts_fts')
+        else:
+            self.create_tables()
+        # 压缩设置保存在meta表中, 写事务开始时还会检查其他进程是否修改过
+        self.connections.codec.load(self.reader)
+        if not readonly:
+            if sync_builtins:
+                self.load_builtin_prompts()
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接"""
+        return self.connections.reader()
+
+    def close(self):
+        self.connections.close()
         
     def create_tables(self):
-        self.conn.execute('''
-            CREATE TABLE IF NOT EXISTS prompts (
-                id INTEGER PRIMARY KEY,
-                uuid TEXT UNIQUE NOT NULL,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                category TEXT NOT NULL,
-                is_builtin BOOLEAN NOT NULL
-            )
-        ''')
-        self.conn.commit()
+        """按版本执行未应用的数据库迁移(建表、索引、全文索引等)"""
+        MigrationRunner(self.connections).run()
+        self.connections.add_writer_setup(install_temp_triggers)
+        self.fts_enabled = table_exists(self.reader, 'prompts_fts')
     
     def save_prompt(self, prompt: Prompt) -> bool:
         try:
             if not prompt.uuid:
                 prompt.uuid = str(uuid.uuid4())
             
-            # 检查uuid是否已存在，如果存在就更新而不是插入
-            cursor = self.conn.execute('SELECT id FROM prompts WHERE uuid = ?', (prompt.uuid,))
-            existing_prompt = cursor.fetchone()
-            
-            if existing_prompt:
-                # 更新现有记录
-                self.conn.execute('''
-                    UPDATE prompts 
-                    SET title = ?, content = ?, category = ?, is_builtin = ?
-                    WHERE uuid = ?
-                ''', (prompt.title, prompt.content, prompt.category, prompt.is_builtin, prompt.uuid))
-            else:
-                # 插入新记录
-                cursor = self.conn.execute(
-                    '''INSERT INTO prompts 
-                       (uuid, title, content, category, is_builtin) 
-                       VALUES (?, ?, ?, ?, ?)''',
-                    (prompt.uuid, prompt.title, prompt.content, prompt.category, prompt.is_builtin)
-                )
-                prompt.id = cursor.lastrowid
+            with self.connections.write() as conn:
+                # 检查uuid是否已存在，如果存在就更新而不是插入
+                cursor = conn.execute('SELECT id FROM prompts WHERE uuid = ?', (prompt.uuid,))
+                existing_prompt = cursor.fetchone()
+                
+                if existing_prompt:
+                    self.prompt_cache.pop(existing_prompt[0])
+                    self._record_baseline(conn, prompt.uuid)
+                    # 更新现有记录
+                    conn.execute('''
+                        UPDATE prompts 
+                        SET title = ?, content = ?, content_z = ?, category = ?, is_builtin = ?,
+                            content_length = ?
+                        WHERE uuid = ?
+                    ''', (prompt.title, *self.connections.codec.encode(prompt.content), prompt.category,
+                          prompt.is_builtin, len(prompt.content), prompt.uuid))
+                else:
+                    # 插入新记录
+                    cursor = conn.execute(
+                        '''INSERT INTO prompts 
+                           (uuid, title, content, content_z, category, is_builtin, content_length) 
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        (prompt.uuid, prompt.title, *self.connections.codec.encode(prompt.content),
+                         prompt.category, prompt.is_builtin, len(prompt.content))
+                    )
+                    prompt.id = cursor.lastrowid
+                revisions.record_revision(conn, prompt.uuid, prompt.title, prompt.category,
+                                          prompt.content)
+                prompt_id = existing_prompt[0] if existing_prompt else prompt.id
+                self.near_duplicates.index_prompt(conn, prompt_id, prompt.content)
+                self._record_stats(conn, prompt_id, prompt.content)
+                if prompt.tags is not None:
+                    self._set_tags(conn, prompt_id, prompt.tags)
                 
-            self.conn.commit()
+            self._refresh_semantic()
             return True
         except Exception as e:
             print(f"Error saving prompt: {e}")
             return False
     
+    def bulk_upsert(self, records: Iterable[Union[Prompt, dict]], batch_size: int = 500,
+                    is_builtin: Optional[bool] = None) -> BulkResult:
+        """在单个事务中按uuid批量插入或更新
+
+        records可以是Prompt或JSON字典(按Prompt.from_dict转换), 会被逐批消费,
+        每批使用executemany写入. 某条记录失败时只跳过该记录并记入errors;
+        流式解析器可以在无法解析的位置放入ValueError实例, 同样记入errors.
+        is_builtin不为None时覆盖所有记录的is_builtin. 带有tags的记录同时替换其标签.
+        """
+        result = BulkResult()
+        self.prompt_cache.clear()
+        try:
+            with self.connections.write() as conn:
+                conn.execute('BEGIN')
+                batch, tagged = [], {}
+                for index, record in enumerate(records):
+                    try:
+                        if isinstance(record, ValueError):
+                            raise record
+                        prompt = record if isinstance(record, Prompt) else Prompt.from_dict(record)
+                        row = self._upsert_row(prompt, is_builtin)
+                    except ValueError as e:
+                        result.errors.append(RecordError(index, self._record_uuid(record), str(e)))
+                        continue
+                    batch.append((index, row))
+                    if prompt.tags is not None:
+                        tagged[prompt.uuid] = prompt.tags
+                    if len(batch) >= batch_size:
+                        self._write_batch(conn, batch, result)
+                        self._write_tags(conn, tagged, result)
+                        batch, tagged = [], {}
+                if batch:
+                    self._write_batch(conn, batch, result)
+                    self._write_tags(conn, tagged, result)
+        except Exception as e:
+            print(f"Error in bulk upsert: {e}")
+            result.errors.append(RecordError(-1, '', str(e)))
+            result.written = result.changed = 0
+        return result
+
+    @staticmethod
+    def _record_uuid(record) -> str:
+        if isinstance(record, dict):
+            return str(record.get('uuid') or '')
+        return getattr(record, 'uuid', None) or ''
+
+    def _upsert_row(self, prompt: Prompt, is_builtin: Optional[bool]) -> tuple:
+        """校验并转换为UPSERT_SQL参数"""
+        for name in ('title', 'content', 'category'):
+            if not isinstance(getattr(prompt, name), str):
+                raise ValueError(f"{name} must be a string")
+        if not prompt.uuid:
+            prompt.uuid = str(uuid.uuid4())
+        builtin = prompt.is_builtin if is_builtin is None else is_builtin
+        return (prompt.uuid, prompt.title, *self.connections.codec.encode(prompt.content),
+                prompt.category, bool(builtin), len(prompt.content),
+                revisions.content_hash(prompt.content))
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list, result: BulkResult):
+        """整批写入; 失败时回滚到保存点并逐条重试, 找出出错的记录"""
+        conn.execute('SAVEPOINT bulk_batch')
+        try:
+            cursor = conn.executemany(UPSERT_SQL, [row for _, row in batch])
+            result.written += len(batch)
+            result.changed += cursor.rowcount
+            conn.execute('RELEASE bulk_batch')
+            return
+        except sqlite3.DatabaseError:
+            conn.execute('ROLLBACK TO bulk_batch')
+        
+        for index, row in batch:
+            try:
+                cursor = conn.execute(UPSERT_SQL, row)
+                result.written += 1
+                result.changed += cursor.rowcount
+            except sqlite3.DatabaseError as e:
+                result.errors.append(RecordError(index, row[0], str(e)))
+        conn.execute('RELEASE bulk_batch')
+
+    def _write_tags(self, conn: sqlite3.Connection, tagged: Dict[str, List[str]], result: BulkResult):
+        """批量写入后按uuid替换标签, 写入失败的记录跳过"""
+        failed = {error.uuid for error in result.errors}
+        uuids = [u for u in tagged if u not in failed]
+        for i in range(0, len(uuids), 500):
+            chunk = uuids[i:i + 500]
+            rows = conn.execute(f"SELECT uuid, id FROM prompts WHERE uuid IN ({','.join('?' * len(chunk))})",
+                                chunk).fetchall()
+            for prompt_uuid, prompt_id in rows:
+                self._set_tags(conn, prompt_id, tagged[prompt_uuid])
+
+    @staticmethod
+    def _set_tags(conn: sqlite3.Connection, prompt_id: int, tags: Iterable[str]):
+        """在调用方的写事务中把prompt的标签替换为tags, 只增删有变化的关联; 计数由触发器维护"""
+        tags = normalize_tags(tags)
+        wanted = set()
+        if tags:
+            conn.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)', [(tag,) for tag in tags])
+            wanted = {row[0] for row in conn.execute(
+                f"SELECT id FROM tags WHERE name IN ({','.join('?' * len(tags))})", tags)}
+        current = {row[0] for row in conn.execute('SELECT tag_id FROM prompt_tags WHERE prompt_id = ?',
+                                                  (prompt_id,))}
+        conn.executemany('DELETE FROM prompt_tags WHERE prompt_id = ? AND tag_id = ?',
+                         [(prompt_id, tag_id) for tag_id in current - wanted])
+        conn.executemany('INSERT INTO prompt_tags (prompt_id, tag_id) VALUES (?, ?)',
+                         [(prompt_id, tag_id) for tag_id in wanted - current])
+
     def get_all_prompts(self) -> List[Prompt]:
-        cursor = self.conn.execute('SELECT id, uuid, title, content, category, is_builtin FROM prompts')
-        return [Prompt(*row) for row in cursor.fetchall()]
+        cursor = self.reader.execute(f'SELECT {TAGGED_PROMPT_COLUMNS} FROM prompts')
+        return [tagged_prompt(row) for row in cursor.fetchall()]
+    
+    def iter_prompts(self, filter_type: FilterType = "所有Prompt", batch_size: int = 500) -> Iterator[Prompt]:
+        """按id顺序逐批遍历游标, 不一次性把所有prompt读入内存"""
+        where, params = self._where(filter_type)
+        cursor = self.reader.execute(f'SELECT {TAGGED_PROMPT_COLUMNS} FROM prompts {where} ORDER BY id', params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tagged_prompt(row)
+    
+    def iter_summaries(self, filter_type: FilterType = "所有Prompt", batch_size: int = 500) -> Iterator[PromptSummary]:
+        """与iter_prompts相同, 但只读取摘要字段"""
+        where, params = self._where(filter_type)
+        cursor = self.reader.execute(f'SELECT {SUMMARY_COLUMNS} FROM prompts {where} ORDER BY id', params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield PromptSummary(*row)
+    
+    def get_all_summaries(self) -> List[PromptSummary]:
+        """列表用: 只取摘要字段, 不读取content"""
+        return self.get_filtered_summaries("所有Prompt")
     
     def get_prompt_by_id(self, prompt_id: int) -> Optional[Prompt]:
-        cursor = self.conn.execute('SELECT id, uuid, title, content, category, is_builtin FROM prompts WHERE id = ?', (prompt_id,))
+        """按id读取完整prompt, 最近打开过的直接从LRU缓存返回"""
+        cached = self.prompt_cache.get(prompt_id)
+        if cached is not None:
+            return replace(cached, tags=list(cached.tags))
+        cursor = self.reader.execute(f'SELECT {TAGGED_PROMPT_COLUMNS} FROM prompts WHERE id = ?', (prompt_id,))
         row = cursor.fetchone()
-        return Prompt(*row) if row else None
+        if not row:
+            return None
+        prompt = tagged_prompt(row)
+        self.prompt_cache.put(prompt_id, replace(prompt, tags=list(prompt.tags)))
+        return prompt
+    
+    def get_prompt_by_uuid(self, prompt_uuid: str) -> Optional[Prompt]:
+        row = self.reader.execute('SELECT id FROM prompts WHERE uuid = ?', (prompt_uuid,)).fetchone()
+        return self.get_prompt_by_id(row[0]) if row else None
+    
+    def get_summary_by_uuid(self, prompt_uuid: str) -> Optional[PromptSummary]:
+        row = self.reader.execute(f'SELECT {SUMMARY_COLUMNS} FROM prompts WHERE uuid = ?',
+                                  (prompt_uuid,)).fetchone()
+        return PromptSummary(*row) if row else None
+    
+    def get_prompts_by_uuids(self, uuids: Iterable[str], chunk_size: int = 500) -> List[Prompt]:
+        """按uuid批量读取完整prompt(不经过LRU缓存), 不存在的uuid忽略, 结果顺序不保证"""
+        uuids = list(uuids)
+        prompts = []
+        for i in range(0, len(uuids), chunk_size):
+            chunk = uuids[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor = self.reader.execute(
+                f'SELECT {TAGGED_PROMPT_COLUMNS} FROM prompts WHERE uuid IN ({placeholders})', chunk)
+            prompts.extend(tagged_prompt(row) for row in cursor)
+        return prompts
+    
+    @property
+    def templates(self):
+        """模板引擎(编译结果按uuid+正文哈希缓存), 第一次使用时才导入和创建"""
+        if self._templates is None:
+            from template import TemplateEngine
+            self._templates = TemplateEngine()
+        return self._templates
+
+    @property
+    def near_duplicates(self):
+        """MinHash/LSH近似重复索引, 第一次使用时才导入和创建"""
+        if self._near_duplicates is None:
+            from dedup import NearDuplicateIndex
+            self._near_duplicates = NearDuplicateIndex(self)
+        return self._near_duplicates
+
+    def find_near_duplicates(self, key: Union[int, str], threshold: float = 0.8) -> list:
+        """与指定prompt近似重复的其他prompt(dedup.DuplicateMatch列表)"""
+        prompt = self._lookup_prompt(key)
+        if not prompt:
+            return []
+        return self.near_duplicates.find_similar(prompt.content, threshold, exclude_id=prompt.id)
+
+    @property
+    def semantic(self):
+        """本地向量索引(semantic.SemanticIndex), 第一次使用时才导入; 未安装numpy时为None"""
+        if self._semantic is None:
+            import semantic
+            if semantic.np is None:
+                return None
+            self._semantic = semantic.SemanticIndex(self)
+        return self._semantic
+
+    def _refresh_semantic(self):
+        """保存/删除提交后增量更新语义索引; 还没有建立过索引时不做任何事"""
+        if self._semantic is None and not os.path.exists(self.db_path + '.vectors.npy'):
+            return
+        try:
+            if self.semantic:
+                self.semantic.refresh()
+        except Exception as e:
+            print(f"Error updating semantic index: {e}")
+
+    def search_semantic(self, query: str, limit: int = 50) -> List[PromptSummary]:
+        """按语义相似度排序的prompt(第一次使用时为全部prompt建立向量索引)"""
+        if not query.strip() or not self.semantic:
+            return []
+        import semantic
+        ids = [prompt_id for prompt_id, _ in
+               self.semantic.search(query, limit, refresh=not self.connections.readonly)]
+        summaries = semantic.load_summaries(self, ids)
+        return [summaries[i] for i in ids if i in summaries]
+
+    def search_hybrid(self, query: str, limit: int = 50) -> List[PromptSummary]:
+        """关键词结果与语义结果按倒数排名融合; 没有numpy时只返回关键词结果"""
+        keyword = self.search_summaries(query)
+        if not self.semantic:
+            return keyword[:limit]
+        import semantic
+        semantic_ids = [prompt_id for prompt_id, _ in
+                        self.semantic.search(query, limit, refresh=not self.connections.readonly)]
+        by_id = {s.id: s for s in keyword}
+        by_id.update(semantic.load_summaries(self, [i for i in semantic_ids if i not in by_id]))
+        fused = semantic.reciprocal_rank_fusion([[s.id for s in keyword[:limit]], semantic_ids])
+        return [by_id[i] for i, _ in fused[:limit] if i in by_id]
+
+    def _lookup_prompt(self, key: Union[int, str]) -> Optional[Prompt]:
+        if isinstance(key, int) or key.isdigit():
+            return self.get_prompt_by_id(int(key))
+        return self.get_prompt_by_uuid(key)
+
+    def render_prompt(self, key: Union[int, str], variables: dict,
+                      strict: bool = False) -> Optional[str]:
+        """按id或uuid渲染prompt正文中的 {{变量}}, prompt不存在时返回None"""
+        prompt = self._lookup_prompt(key)
+        if not prompt:
+            return None
+        return self.templates.render(prompt.content, variables, key=prompt.uuid, strict=strict)
+
+    def render_prompt_batch(self, key: Union[int, str], variable_sets: Iterable[dict],
+                            strict: bool = False):
+        """用多组变量渲染同一个prompt, 返回template.RenderBatch; prompt不存在时返回None"""
+        prompt = self._lookup_prompt(key)
+        if not prompt:
+            return None
+        return self.templates.render_batch(prompt.content, variable_sets, key=prompt.uuid,
+                                           strict=strict)
     
     def delete_prompt(self, prompt_id: int) -> bool:
         try:
-            self.conn.execute('DELETE FROM prompts WHERE id = ?', (prompt_id,))
-            self.conn.commit()
+            self.prompt_cache.pop(prompt_id)
+            with self.connections.write() as conn:
+                conn.execute('DELETE FROM prompts WHERE id = ?', (prompt_id,))
+            self._refresh_semantic()
             return True
         except:
             return False
     
     def update_prompt(self, prompt: Prompt) -> bool:
         try:
-            self.conn.execute('''
-                UPDATE prompts 
-                SET title = ?, content = ?, category = ?
-                WHERE id = ?
-            ''', (prompt.title, prompt.content, prompt.category, prompt.id))
-            self.conn.commit()
+            self.prompt_cache.pop(prompt.id)
+            with self.connections.write() as conn:
+                row = conn.execute('SELECT uuid FROM prompts WHERE id = ?', (prompt.id,)).fetchone()
+                if row:
+                    self._record_baseline(conn, row[0])
+                conn.execute('''
+                    UPDATE prompts 
+                    SET title = ?, content = ?, content_z = ?, category = ?, content_length = ?
+                    WHERE id = ?
+                ''', (prompt.title, *self.connections.codec.encode(prompt.content), prompt.category,
+                      len(prompt.content), prompt.id))
+                if row:
+                    revisions.record_revision(conn, row[0], prompt.title, prompt.category,
+                                              prompt.content)
+                    self.near_duplicates.index_prompt(conn, prompt.id, prompt.content)
+                    self._record_stats(conn, prompt.id, prompt.content)
+                    if prompt.tags is not None:
+                        self._set_tags(conn, prompt.id, prompt.tags)
+            self._refresh_semantic()
             return True
         except:
             return False
 
+    @staticmethod
+    def _record_stats(conn: sqlite3.Connection, prompt_id: int, content: str):
+        """保存时在同一事务中更新正文哈希和统计缓存"""
+        import textstats
+        textstats.record(conn, prompt_id, content)
+
+    def get_text_stats(self, key: Union[int, str]):
+        """按id或uuid读取prompt的正文统计(textstats.TextStats), 没有缓存时当场计算并保存"""
+        import textstats
+        prompt = self._lookup_prompt(key)
+        if not prompt:
+            return None
+        digest, = self.reader.execute('SELECT content_hash FROM prompts WHERE id = ?',
+                                      (prompt.id,)).fetchone()
+        stats = textstats.load(self.reader, digest) if digest else None
+        if stats is None and self.connections.readonly:
+            return textstats.compute(prompt.content)
+        if stats is None:
+            with self.connections.write() as conn:
+                stats = textstats.load(conn, textstats.record(conn, prompt.id, prompt.content))
+        return stats
+
+    def backfill_stats(self, workers: Optional[int] = None, progress=None) -> int:
+        """为批量写入的prompt补齐统计(数量多时使用进程池), 返回计算的正文数"""
+        import textstats
+        return textstats.backfill(self, workers=workers, progress=progress)
+
+    @staticmethod
+    def _record_baseline(conn: sqlite3.Connection, prompt_uuid: str):
+        """修改前把当前正文记为修订(还没有历史, 或导入/同步在历史之外改过正文时)"""
+        row = conn.execute(f'SELECT title, category, {CONTENT_TEXT} FROM prompts WHERE uuid = ?',
+                           (prompt_uuid,)).fetchone()
+        if row:
+            revisions.record_revision(conn, prompt_uuid, *row)
+
+    def list_revisions(self, key: Union[int, str]) -> List[Revision]:
+        """按id或uuid列出prompt的修订, 最新的在前(不读取正文)"""
+        prompt = self._lookup_prompt(key)
+        return revisions.list_revisions(self.reader, prompt.uuid) if prompt else []
+
+    def get_revision_content(self, revision_id: int) -> Optional[str]:
+        revision = revisions.get_revision(self.reader, revision_id)
+        return revisions.load_content(self.reader, revision.content_hash) if revision else None
+
+    def restore_revision(self, revision_id: int) -> bool:
+        """把prompt恢复到某个修订(恢复本身也记为一个新修订)"""
+        try:
+            with self.connections.write() as conn:
+                revision = revisions.get_revision(conn, revision_id)
+                if not revision:
+                    return False
+                content = revisions.load_content(conn, revision.content_hash)
+                row = conn.execute('SELECT id FROM prompts WHERE uuid = ?',
+                                   (revision.prompt_uuid,)).fetchone()
+                if content is None or not row:
+                    return False
+                self.prompt_cache.pop(row[0])
+                self._record_baseline(conn, revision.prompt_uuid)
+                conn.execute('''
+                    UPDATE prompts SET title = ?, content = ?, content_z = ?, category = ?,
+                                       content_length = ?
+                    WHERE id = ?
+                ''', (revision.title, *self.connections.codec.encode(content), revision.category,
+                      len(content), row[0]))
+                revisions.record_revision(conn, revision.prompt_uuid, revision.title,
+                                          revision.category, content)
+                self.near_duplicates.index_prompt(conn, row[0], content)
+                self._record_stats(conn, row[0], content)
+            self._refresh_semantic()
+            return True
+        except Exception as e:
+            print(f"Error restoring revision: {e}")
+            return False
+
+    def revision_stats(self) -> dict:
+        return revisions.storage_stats(self.reader)
+
     def search_prompts(self, keyword: str) -> List[Prompt]:
-        cursor = self.conn.execute('''
-            SELECT id, uuid, title, content, category, is_builtin 
+        """搜索标题或内容包含关键词的prompt, 按相关度排序"""
+        return [tagged_prompt(row) for row in self._search(TAGGED_PROMPT_COLUMNS, keyword)]
+
+    def search_summaries(self, keyword: str) -> List[PromptSummary]:
+        """列表用的搜索: 结果与search_prompts相同, 但不读取content"""
+        return [PromptSummary(*row) for row in self._search(SUMMARY_COLUMNS, keyword)]
+
+    def _search(self, columns: str, keyword: str) -> sqlite3.Cursor:
+        if self._use_fts(keyword):
+            return self.reader.execute(f'''
+                SELECT {columns}
+                FROM prompts JOIN (
+                    SELECT rowid AS fts_id, bm25(prompts_fts, ?, ?) AS rank
+                    FROM prompts_fts
+                    WHERE prompts_fts MATCH ?
+                ) ON id = fts_id
+                ORDER BY rank
+            ''', (FTS_TITLE_WEIGHT, FTS_CONTENT_WEIGHT, self._fts_phrase(keyword)))
+        pattern = f'%{keyword}%'
+        return self.reader.execute(f'''
+            SELECT {columns}
             FROM prompts 
-            WHERE title LIKE ? OR content LIKE ?
-        ''', (f'%{keyword}%', f'%{keyword}%'))
-        return [Prompt(*row) for row in cursor.fetchall()]
+            WHERE {LIKE_FILTER}
+            ORDER BY title NOT LIKE ?
+        ''', (pattern, pattern, pattern, pattern))
+
+    def search_hits(self, keyword: str, limit: int = 200, markers=('[', ']'),
+                    snippet_tokens: int = 32) -> List[SearchHit]:
+        """按相关度返回搜索结果及高亮片段, 不读取完整content到内存"""
+        start, end = markers
+        if self._use_fts(keyword):
+            cursor = self.reader.execute('''
+                SELECT p.id, p.uuid, p.title, p.category, p.is_builtin,
+                       highlight(prompts_fts, 0, ?, ?),
+                       snippet(prompts_fts, 1, ?, ?, '…', ?),
+                       bm25(prompts_fts, ?, ?) AS rank
+                FROM prompts_fts f JOIN prompts p ON p.id = f.rowid
+                WHERE prompts_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ''', (start, end, start, end, snippet_tokens,
+                  FTS_TITLE_WEIGHT, FTS_CONTENT_WEIGHT, self._fts_phrase(keyword), limit))
+            return [SearchHit(*row) for row in cursor.fetchall()]
+        
+        # 短关键词无法使用trigram索引, 退回LIKE并在SQL中截取片段
+        pattern = f'%{keyword}%'
+        cursor = self.reader.execute(f'''
+            SELECT id, uuid, title, category, is_builtin,
+                   substr(text, max(instr(lower(text), lower(?)) - ?, 1), ?),
+                   rank
+            FROM (
+                SELECT id, uuid, title, category, is_builtin, {CONTENT_TEXT} AS text,
+                       title NOT LIKE ? AS rank
+                FROM prompts
+                WHERE {LIKE_FILTER}
+                ORDER BY rank
+                LIMIT ?
+            )
+        ''', (keyword, snippet_tokens // 2, snippet_tokens + len(keyword),
+              pattern, pattern, pattern, pattern, limit))
+        hits = []
+        for id_, uuid_, title, category, is_builtin, snippet, rank in cursor.fetchall():
+            hits.append(SearchHit(
+                id=id_, uuid=uuid_, title=title, category=category, is_builtin=is_builtin,
+                title_highlight=self._highlight(title, keyword, markers),
+                snippet=self._highlight(snippet, keyword, markers),
+                rank=float(rank)
+            ))
+        return hits
+
+    def _use_fts(self, keyword: str) -> bool:
+        return self.fts_enabled and len(keyword) >= FTS_MIN_KEYWORD_LEN
+
+    @staticmethod
+    def _fts_phrase(keyword: str) -> str:
+        """把关键词转成FTS5短语查询, 保持与原LIKE一致的子串语义"""
+        return '"' + keyword.replace('"', '""') + '"'
+
+    @staticmethod
+    def _highlight(text: str, keyword: str, markers) -> str:
+        """大小写不敏感地为text中的keyword加上高亮标记"""
+        pos = text.lower().find(keyword.lower())
+        if pos < 0:
+            return text
+        end = pos + len(keyword)
+        return text[:pos] + markers[0] + text[pos:end] + markers[1] + text[end:]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.reader.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
 
-    def load_builtin_prompts(self):
+    def set_meta(self, key: str, value: str):
+        with self.connections.write() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def load_builtin_prompts(self, builtin_file: Optional[str] = None, force: bool = False):
+        """增量同步内置prompts
+
+        文件的mtime和大小与上次同步记录一致时直接跳过, 不读取文件;
+        否则比较文件哈希, 内容确有变化时按uuid只插入/更新/删除有差异的记录,
+        未变化的内置prompt保持原有id.
+        """
         try:
-            # 先清除所有内置prompts
-            self.conn.execute('DELETE FROM prompts WHERE is_builtin = 1')
-            self.conn.commit()
-                
-            # 重新加载内置prompts
-            builtin_file = os.path.join(os.path.dirname(__file__), 'builtin_prompts.json')
-            if os.path.exists(builtin_file):
-                with open(builtin_file, 'r', encoding='utf-8') as f:
-                    prompts = json.load(f)
-                    for p in prompts:
-                        # 确保数据完整性
-                        prompt = Prompt(
-                            id=None,
-                            uuid=p.get('uuid', str(uuid.uuid4())),
-                            title=p.get('title', ''),
-                            content=p.get('content', ''),
-                            category=p.get('category', '通用'),
-                            is_builtin=True
-                        )
-                        self.save_prompt(prompt)
+            builtin_file = builtin_file or os.path.join(os.path.dirname(__file__), 'builtin_prompts.json')
+            if not os.path.exists(builtin_file):
+                return
+            
+            stat = os.stat(builtin_file)
+            stamp = f"{stat.st_mtime_ns}:{stat.st_size}"
+            manifest = json.loads(self.get_meta('builtin_manifest') or '{}')
+            if not force and manifest.get('stamp') == stamp:
+                return
+            
+            with open(builtin_file, 'rb') as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if not force and manifest.get('sha256') == digest:
+                # 只是文件时间变了(例如重新检出), 内容相同
+                manifest['stamp'] = stamp
+                self.set_meta('builtin_manifest', json.dumps(manifest))
+                return
+            
+            records = self._diff_builtin_prompts(json.loads(raw.decode('utf-8-sig')),
+                                                 {} if force else manifest.get('records', {}))
+            # 清单最后写入: 中途失败时下次启动会重新同步
+            self.set_meta('builtin_manifest', json.dumps({
+                'stamp': stamp, 'sha256': digest, 'records': records
+            }))
         except Exception as e:
             print(f"Error loading builtin prompts: {e}")
 
+    def _diff_builtin_prompts(self, prompts: list, known: dict) -> dict:
+        """按uuid把内置prompts同步到数据库, 返回新的 {uuid: 记录哈希} 清单"""
+        records = {}
+        changed = []
+        for p in prompts:
+            if isinstance(p, dict) and not p.get('uuid'):
+                # 缺少uuid的记录按标题生成稳定的uuid, 避免每次同步都换新行
+                p = dict(p, uuid=str(uuid.uuid5(uuid.NAMESPACE_URL, f"builtin:{p.get('title', '')}")))
+            record_hash = hashlib.sha1(json.dumps(p, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+            if isinstance(p, dict):
+                records[p['uuid']] = record_hash
+                if known.get(p['uuid']) == record_hash:
+                    continue
+            changed.append(p)
+        
+        result = self.bulk_upsert(changed, is_builtin=True)
+        for error in result.errors:
+            print(f"Error loading builtin prompt {error.uuid}: {error.message}")
+            records.pop(error.uuid, None)
+        
+        # 删除已不在内置文件中的内置prompts
+        existing = {row[0] for row in self.reader.execute('SELECT uuid FROM prompts WHERE is_builtin = 1')}
+        removed = existing - records.keys()
+        if removed:
+            self.prompt_cache.clear()
+            with self.connections.write() as conn:
+                conn.executemany('DELETE FROM prompts WHERE uuid = ? AND is_builtin = 1',
+                                 [(u,) for u in removed])
+        return records
+
     def export_prompts_to_json(self, prompts: List[Prompt]) -> List[dict]:
         """将Prompt对象转换为可序列化的字典列表"""
         return [{
@@ -136,15 +893,338 @@ class Database:
             'title': p.title,
             'content': p.content,
             'category': p.category,
-            'is_builtin': p.is_builtin
+            'is_builtin': p.is_builtin,
+            **({'tags': p.tags} if p.tags else {})
         } for p in prompts]
 
-    def get_filtered_prompts(self, filter_type: str) -> List[Prompt]:
-        if filter_type == "所有Prompt":
-            return self.get_all_prompts()
-        elif filter_type == "内置Prompt":
-            cursor = self.conn.execute('SELECT id, uuid, title, content, category, is_builtin FROM prompts WHERE is_builtin = 1')
-            return [Prompt(*row) for row in cursor.fetchall()]
-        else:  # 自定义Prompt
-            cursor = self.conn.execute('SELECT id, uuid, title, content, category, is_builtin FROM prompts WHERE is_builtin = 0')
-            return [Prompt(*row) for row in cursor.fetchall()]
\ No newline at end of file
+    def get_filtered_prompts(self, filter_type: FilterType) -> List[Prompt]:
+        where, params = self._where(filter_type)
+        cursor = self.reader.execute(f'SELECT {TAGGED_PROMPT_COLUMNS} FROM prompts {where}', params)
+        return [tagged_prompt(row) for row in cursor.fetchall()]
+
+    def _where(self, filter_type: FilterType, paged: bool = False) -> Tuple[str, list]:
+        """过滤器按钮名或PromptFilter -> ('WHERE ...', 参数), 不限制时为('', [])
+
+        paged: 结果按id分页读取(LIMIT), 常见的标签改为逐行检查, 不必先取出全部候选.
+        """
+        if not isinstance(filter_type, PromptFilter):
+            return FILTER_CLAUSES.get(filter_type, FILTER_CLAUSES["自定义Prompt"]), []
+        conditions, params = self._filter_conditions(filter_type, paged)
+        return ('WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def _filter_conditions(self, query: PromptFilter, paged: bool = False) -> Tuple[List[str], list]:
+        """PromptFilter -> 条件列表和参数; 每个条件都能走索引:
+        分类/内置用idx_prompts_category, 标签用prompt_tags, 关键词用全文索引"""
+        conditions, params = [], []
+        if query.category is not None:
+            conditions.append('category = ?')
+            params.append(query.category)
+        if query.is_builtin is not None:
+            conditions.append('is_builtin = ?')
+            params.append(int(bool(query.is_builtin)))
+        candidates = None      # 标签条件给出的候选行数上限, 没有驱动的标签条件时为None
+        tags = normalize_tags(query.tags)
+        if tags:
+            rows = self.reader.execute(
+                f"SELECT id, prompt_count FROM tags WHERE name IN ({','.join('?' * len(tags))})", tags).fetchall()
+            if not rows or (not query.match_any_tag and len(rows) < len(tags)):
+                return ['0'], []     # 有标签不存在, 结果一定为空
+            # 标签的候选比分类/内置条件选出的行少时先取出候选集合, 否则逐行用主键检查标签;
+            # 分页时按id顺序逐行检查很快就能凑满一页, 只有少见的标签才先取候选
+            basis = self.count_prompts(PromptFilter(category=query.category, is_builtin=query.is_builtin))
+            total = basis * (TAG_SCAN_RATIO if paged else 1)
+            if query.match_any_tag:
+                tag_ids = [tag_id for tag_id, _ in rows]
+                candidates = sum(count for _, count in rows)
+                drive = candidates < total
+                source = f"SELECT prompt_id FROM prompt_tags WHERE tag_id IN ({','.join('?' * len(tag_ids))})"
+                conditions.append(f'id IN ({source})' if drive else
+                                  f"EXISTS (SELECT 1 FROM prompt_tags WHERE prompt_id = prompts.id "
+                                  f"AND tag_id IN ({','.join('?' * len(tag_ids))}))")
+                params.extend(tag_ids)
+                candidates = candidates if drive else None
+            else:
+                rows.sort(key=lambda row: row[1])
+                rarest_id, rarest_count = rows[0]
+                if rarest_count < total:
+                    conditions.append('id IN (SELECT prompt_id FROM prompt_tags WHERE tag_id = ?)')
+                    params.append(rarest_id)
+                    candidates = rarest_count
+                    rows = rows[1:]
+                for tag_id, _ in rows:
+                    conditions.append('EXISTS (SELECT 1 FROM prompt_tags '
+                                      'WHERE prompt_id = prompts.id AND tag_id = ?)')
+                    params.append(tag_id)
+        if query.keyword:
+            # 候选行很少时逐行LIKE比展开全文索引的全部命中更快
+            if self._use_fts(query.keyword) and (candidates is None or candidates > KEYWORD_SCAN_LIMIT):
+                conditions.append('id IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)')
+                params.append(self._fts_phrase(query.keyword))
+            else:
+                conditions.append(f'({LIKE_FILTER})')
+                params.extend([f'%{query.keyword}%'] * 3)
+        return conditions, params
+
+    def _category_rows(self, category: Optional[str], is_builtin: Optional[bool]) -> List[Tuple[str, int, int]]:
+        """[(分类, 数量, 其中内置数量)], 直接读取触发器维护的categories表"""
+        sql = 'SELECT name, prompt_count, builtin_count FROM categories'
+        rows = (self.reader.execute(sql).fetchall() if category is None else
+                self.reader.execute(f'{sql} WHERE name = ?', (category,)).fetchall())
+        if is_builtin is None:
+            return rows
+        if is_builtin:
+            return [(name, builtin, builtin) for name, _, builtin in rows if builtin]
+        return [(name, total - builtin, 0) for name, total, builtin in rows if total > builtin]
+
+    def category_counts(self, is_builtin: Optional[bool] = None) -> dict:
+        """{分类: prompt数量}, 读取预先维护的计数"""
+        return {name: total for name, total, _ in self._category_rows(None, is_builtin)}
+
+    def tag_counts(self, limit: Optional[int] = None) -> dict:
+        """{标签: prompt数量}, 按数量降序, 读取预先维护的计数"""
+        cursor = self.reader.execute('SELECT name, prompt_count FROM tags ORDER BY prompt_count DESC, name '
+                                     'LIMIT ?', (-1 if limit is None else limit,))
+        return dict(cursor.fetchall())
+
+    def get_tags(self, prompt_id: int) -> List[str]:
+        row = self.reader.execute(f'SELECT {TAGS_COLUMN} FROM prompts WHERE id = ?', (prompt_id,)).fetchone()
+        return split_tags(row[0]) if row else []
+
+    def set_tags(self, prompt_id: int, tags: Union[str, Iterable[str]]) -> bool:
+        """替换prompt的标签(字符串按逗号拆分)"""
+        try:
+            self.prompt_cache.pop(prompt_id)
+            with self.connections.write() as conn:
+                self._set_tags(conn, prompt_id, tags)
+            return True
+        except Exception as e:
+            print(f"Error saving tags: {e}")
+            return False
+
+    def matches_filter(self, filter_type: FilterType, prompt_id: int) -> bool:
+        """id为prompt_id的prompt是否在过滤结果中"""
+        where, params = self._where(filter_type)
+        where = f'{where} AND id = ?' if where else 'WHERE id = ?'
+        return self.reader.execute(f'SELECT 1 FROM prompts {where}', (*params, prompt_id)).fetchone() is not None
+
+    def count_prompts(self, filter_type: FilterType) -> int:
+        """过滤结果数量; 只按分类/内置或单个标签过滤时直接读取预先维护的计数, 不扫描prompts"""
+        query = (filter_type if isinstance(filter_type, PromptFilter)
+                 else PromptFilter.from_filter_type(filter_type))
+        if query.is_simple:
+            return sum(total for _, total, _ in self._category_rows(query.category, query.is_builtin))
+        if query.category is None and query.is_builtin is None and not query.keyword:
+            return self._count_tagged(query)
+        where, params = self._where(query)
+        return self.reader.execute(f'SELECT COUNT(*) FROM prompts {where}', params).fetchone()[0]
+
+    def _count_tagged(self, query: PromptFilter) -> int:
+        """只有标签条件时的数量: 单个标签读取tags表, 多个标签只查prompt_tags, 不读取prompts的行"""
+        tags = normalize_tags(query.tags)
+        rows = self.reader.execute(
+            f"SELECT id, prompt_count FROM tags WHERE name IN ({','.join('?' * len(tags))})", tags).fetchall()
+        if not rows or (not query.match_any_tag and len(rows) < len(tags)):
+            return 0
+        if len(rows) == 1:
+            return rows[0][1]
+        tag_ids = [tag_id for tag_id, _ in sorted(rows, key=lambda row: row[1])]
+        if query.match_any_tag:
+            return self.reader.execute(
+                f"SELECT COUNT(DISTINCT prompt_id) FROM prompt_tags WHERE tag_id IN ({','.join('?' * len(tag_ids))})",
+                tag_ids).fetchone()[0]
+        checks = ' AND '.join(['EXISTS (SELECT 1 FROM prompt_tags o WHERE o.prompt_id = pt.prompt_id '
+                               'AND o.tag_id = ?)'] * (len(tag_ids) - 1))
+        return self.reader.execute(f'SELECT COUNT(*) FROM prompt_tags pt WHERE pt.tag_id = ? AND {checks}',
+                                   tag_ids).fetchone()[0]
+
+    def facets(self, query: Optional[PromptFilter] = None, tag_limit: int = 50) -> Facets:
+        """过滤结果按分类和标签的计数(侧边栏/过滤面板用)
+
+        没有标签和关键词条件时分类计数直接读取categories表; 完全不过滤时标签计数
+        读取tags表. 其余情况只在匹配的行上分组统计, 条件越窄越快.
+        """
+        query = query or PromptFilter()
+        if query.is_simple:
+            rows = self._category_rows(query.category, query.is_builtin)
+        else:
+            where, params = self._where(query)
+            rows = self.reader.execute(f'SELECT category, COUNT(*), SUM(is_builtin != 0) FROM prompts {where} '
+                                       'GROUP BY category', params).fetchall()
+        if query.is_simple and query.category is None and query.is_builtin is None:
+            tags = self.tag_counts(tag_limit)
+        else:
+            where, params = self._where(query)
+            cursor = self.reader.execute(f'''
+                SELECT t.name, COUNT(*) AS n FROM prompt_tags pt JOIN tags t ON t.id = pt.tag_id
+                WHERE pt.prompt_id IN (SELECT id FROM prompts {where})
+                GROUP BY pt.tag_id ORDER BY n DESC, t.name LIMIT ?
+            ''', (*params, tag_limit))
+            tags = dict(cursor.fetchall())
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return Facets(total=sum(row[1] for row in rows), builtin=sum(row[2] for row in rows),
+                      categories={name: total for name, total, _ in rows}, tags=tags)
+
+    def get_summaries_page(self, filter_type: FilterType, limit: int, offset: int = 0,
+                           after_id: Optional[int] = None) -> List[PromptSummary]:
+        """按id顺序读取一页摘要; 给出after_id时从该id之后继续读(无需OFFSET跳过前面的行)"""
+        where, params = self._where(filter_type, paged=True)
+        if after_id is not None:
+            where = f'{where} AND id > ?' if where else 'WHERE id > ?'
+            params.append(after_id)
+            offset = 0
+        cursor = self.reader.execute(
+            f'SELECT {SUMMARY_COLUMNS} FROM prompts {where} ORDER BY id LIMIT ? OFFSET ?',
+            (*params, limit, offset)
+        )
+        return [PromptSummary(*row) for row in cursor.fetchall()]
+
+    def page_prompts(self, filter_type: FilterType = "所有Prompt", order_by: str = 'id', limit: int = 50,
+                     cursor: Optional[str] = None) -> Page:
+        """按键集分页读取完整prompt: 每页一次只读取limit行的查询, 与总行数和页码无关"""
+        return self._keyset_page(TAGGED_PROMPT_COLUMNS, tagged_prompt, filter_type, order_by, limit, cursor)
+
+    def page_summaries(self, filter_type: FilterType = "所有Prompt", order_by: str = 'id', limit: int = 50,
+                       cursor: Optional[str] = None) -> Page:
+        """与page_prompts相同, 但只读取摘要字段"""
+        return self._keyset_page(SUMMARY_COLUMNS, lambda row: PromptSummary(*row), filter_type, order_by,
+                                 limit, cursor)
+
+    def page_search_prompts(self, keyword: str, limit: int = 50, cursor: Optional[str] = None) -> Page:
+        """按相关度分页的搜索结果(排序与search_prompts相同)"""
+        return self._search_page(TAGGED_PROMPT_COLUMNS, tagged_prompt, keyword, limit, cursor)
+
+    def page_search_summaries(self, keyword: str, limit: int = 50, cursor: Optional[str] = None) -> Page:
+        return self._search_page(SUMMARY_COLUMNS, lambda row: PromptSummary(*row), keyword, limit, cursor)
+
+    def stream_prompts(self, filter_type: FilterType = "所有Prompt", order_by: str = 'id',
+                       first: int = 50, page_size: int = 500) -> Iterator[Prompt]:
+        """get_filtered_prompts的生成器版本: 先读取first行, 之后每次按需读取page_size行
+
+        各页是独立的短查询, 遍历期间不会长时间占用读事务; 只需要前N个结果时
+        配合itertools.islice使用, 不会读取更多的行.
+        """
+        return self._stream(lambda limit, cursor: self.page_prompts(filter_type, order_by, limit, cursor),
+                            first, page_size)
+
+    def stream_summaries(self, filter_type: FilterType = "所有Prompt", order_by: str = 'id',
+                         first: int = 50, page_size: int = 500) -> Iterator[PromptSummary]:
+        return self._stream(lambda limit, cursor: self.page_summaries(filter_type, order_by, limit, cursor),
+                            first, page_size)
+
+    def stream_search_prompts(self, keyword: str, first: int = 50, page_size: int = 500) -> Iterator[Prompt]:
+        """search_prompts的生成器版本"""
+        return self._stream(lambda limit, cursor: self.page_search_prompts(keyword, limit, cursor),
+                            first, page_size)
+
+    def stream_search_summaries(self, keyword: str, first: int = 50,
+                                page_size: int = 500) -> Iterator[PromptSummary]:
+        return self._stream(lambda limit, cursor: self.page_search_summaries(keyword, limit, cursor),
+                            first, page_size)
+
+    @staticmethod
+    def _stream(fetch: Callable[[int, Optional[str]], Page], first: int, page_size: int) -> Iterator:
+        page = fetch(first, None)
+        while True:
+            yield from page.items
+            if page.next_cursor is None:
+                return
+            page = fetch(page_size, page.next_cursor)
+
+    @staticmethod
+    def _finish_page(rows: list, convert, order: str, key_size: int, limit: int) -> Page:
+        """查询多取的一行用来判断是否还有下一页; 排序键是每行最后key_size列"""
+        more = len(rows) > limit
+        rows = rows[:limit]
+        items = [convert(row[:-key_size]) for row in rows]
+        cursor = encode_cursor(order, rows[-1][-key_size:]) if more else None
+        return Page(items, cursor)
+
+    def _keyset_page(self, columns: str, convert, filter_type: FilterType, order_by: str, limit: int,
+                     cursor: Optional[str]) -> Page:
+        if order_by not in KEYSET_ORDERS:
+            raise ValueError(f"unknown order {order_by!r}, expected one of {', '.join(KEYSET_ORDERS)}")
+        keys = KEYSET_ORDERS[order_by]
+        limit = max(limit, 1)
+        where, params = self._where(filter_type, paged=True)
+        if cursor is not None:
+            condition = f"({', '.join(keys)}) > ({', '.join('?' * len(keys))})"
+            where = f'{where} AND {condition}' if where else f'WHERE {condition}'
+            params.extend(decode_cursor(cursor, order_by, len(keys)))
+        rows = self.reader.execute(
+            f"SELECT {columns}, {', '.join(keys)} FROM prompts {where} ORDER BY {', '.join(keys)} LIMIT ?",
+            (*params, limit + 1)).fetchall()
+        return self._finish_page(rows, convert, order_by, len(keys), limit)
+
+    def _search_page(self, columns: str, convert, keyword: str, limit: int, cursor: Optional[str]) -> Page:
+        """按(相关度, id)键集分页; 全文索引先在命中中取前limit个, 只为这些行读取prompts"""
+        after = decode_cursor(cursor, 'rank', 2) if cursor is not None else None
+        limit = max(limit, 1)
+        if self._use_fts(keyword):
+            keyset = 'WHERE (rank, fts_id) > (?, ?)' if after else ''
+            rows = self.reader.execute(f'''
+                SELECT {columns}, rank, id
+                FROM (
+                    SELECT fts_id, rank FROM (
+                        SELECT rowid AS fts_id, bm25(prompts_fts, ?, ?) AS rank
+                        FROM prompts_fts
+                        WHERE prompts_fts MATCH ?
+                    ) {keyset}
+                    ORDER BY rank, fts_id
+                    LIMIT ?
+                ) JOIN prompts ON id = fts_id
+                ORDER BY rank, id
+            ''', (FTS_TITLE_WEIGHT, FTS_CONTENT_WEIGHT, self._fts_phrase(keyword), *(after or ()),
+                  limit + 1)).fetchall()
+        else:
+            # 与_search相同, 标题命中的(rank 0)排在只有正文命中的(rank 1)前面; 两部分分别
+            # 按id顺序扫描, 凑够一页就停止, 不必先找出全部命中再排序
+            pattern = f'%{keyword}%'
+            rank, after_id = after or (0, 0)
+            rows = []
+            if rank == 0:
+                rows = self.reader.execute(f'''
+                    SELECT {columns}, 0, id FROM prompts
+                    WHERE title LIKE ? AND id > ?
+                    ORDER BY id LIMIT ?
+                ''', (pattern, after_id, limit + 1)).fetchall()
+                after_id = 0
+            if len(rows) <= limit:
+                rows += self.reader.execute(f'''
+                    SELECT {columns}, 1, id FROM prompts
+                    WHERE title NOT LIKE ? AND ({LIKE_FILTER}) AND id > ?
+                    ORDER BY id LIMIT ?
+                ''', (pattern, pattern, pattern, pattern, after_id, limit + 1 - len(rows))).fetchall()
+        return self._finish_page(rows, convert, 'rank', 2, limit)
+
+    def filter_summaries(self, filter_type: FilterType = "所有Prompt", min_tokens: Optional[int] = None,
+                         max_tokens: Optional[int] = None, order_by: str = 'id',
+                         limit: Optional[int] = None) -> List[PromptSummary]:
+        """按token数范围过滤并排序的摘要; 指定了范围时不包含还没有统计的prompt"""
+        if order_by not in SORT_ORDERS:
+            raise ValueError(f"unknown order {order_by!r}, expected one of {', '.join(SORT_ORDERS)}")
+        where, params = self._where(filter_type)
+        conditions = [where[len('WHERE '):]] if where else []
+        if min_tokens is not None:
+            conditions.append('tokens >= ?')
+            params.append(min_tokens)
+        if max_tokens is not None:
+            conditions.append('tokens <= ?')
+            params.append(max_tokens)
+        sql = f'SELECT {SUMMARY_COLUMNS} FROM prompts'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {SORT_ORDERS[order_by]}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [PromptSummary(*row) for row in self.reader.execute(sql, params)]
+
+    def get_filtered_summaries(self, filter_type: FilterType) -> List[PromptSummary]:
+        """列表用: 按过滤器返回摘要, 不读取content"""
+        where, params = self._where(filter_type)
+        cursor = self.reader.execute(f'SELECT {SUMMARY_COLUMNS} FROM prompts {where}', params)
+        return [PromptSummary(*row) for row in cursor.fetchall()]
+
+
+# 启用剖析(PROMPT_PROFILE=1)时为所有公开方法计时, 未启用时不做任何替换
+PROFILER.register(Database, category='db')
@@ -0,0 +1,276 @@
+"""近似重复prompt检测: MinHash签名 + LSH分桶
+
+正文规范化(小写, 合并空白)后按UTF-8字节切成长度SHINGLE_BYTES的片段,
+用单次哈希MinHash(one permutation hashing, 空桶按循环方向补齐)生成
+NUM_HASHES个值的签名, 签名相同位置的比例即Jaccard相似度的估计.
+签名分为BANDS段, 每段哈希成一个桶号存入minhash_buckets, 查询时只比较
+至少有一段落在同一桶中的候选, 不需要两两比较全部prompt.
+
+新增或正文变化的prompt由触发器记入minhash_pending; 单条保存时立即重算签名,
+批量导入/同步的记录在下次查询前由 refresh() 补齐, 只处理待处理的行.
+"""
+import hashlib
+import re
+import sqlite3
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from db import CONTENT_TEXT, Database, Prompt, RecordError
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS     # 每段4个值: 相似度约0.5以上的才大概率成为候选
+SHINGLE_BYTES = 8
+VALUE_BITS = 26                # 低26位为桶内最小值, 高6位为桶号
+VALUE_MASK = (1 << VALUE_BITS) - 1
+EMPTY = 0xFFFFFFFF
+DEFAULT_THRESHOLD = 0.8
+MAX_BUCKET_COMPARE = 200       # 过大的桶(例如大量相同模板)只与桶内第一个比较
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+@dataclass
+class DuplicateMatch:
+    id: int
+    uuid: str
+    title: str
+    similarity: float
+
+
+def normalize(text: str) -> bytes:
+    return WHITESPACE_RE.sub(' ', text.lower()).strip().encode('utf-8')
+
+
+def signature(text: str) -> array:
+    data = normalize(text)
+    sig = array('I', [EMPTY]) * NUM_HASHES
+    if len(data) < SHINGLE_BYTES:
+        data = data.ljust(SHINGLE_BYTES)
+    crc32 = zlib.crc32
+    for shingle in {data[i:i + SHINGLE_BYTES] for i in range(len(data) - SHINGLE_BYTES + 1)}:
+        h = (crc32(shingle) * 0x9E3779B1) & 0xFFFFFFFF
+        slot = h >> VALUE_BITS
+        value = h & VALUE_MASK
+        if value < sig[slot]:
+            sig[slot] = value
+    # 空桶取后面第一个非空桶的值加上距离偏移, 保证不同文档的补齐方式一致
+    if EMPTY in sig:
+        for i in range(NUM_HASHES):
+            if sig[i] == EMPTY:
+                distance = next(d for d in range(1, NUM_HASHES)
+                                if sig[(i + d) % NUM_HASHES] <= VALUE_MASK)
+                sig[i] = sig[(i + distance) % NUM_HASHES] + (distance << VALUE_BITS)
+    return sig
+
+
+def similarity(a: array, b: array) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def band_keys(sig: array) -> List[Tuple[int, int]]:
+    """[(段号, 桶号)], 桶号为该段签名字节的64位有符号哈希"""
+    data = sig.tobytes()
+    size = ROWS * sig.itemsize
+    return [(band, int.from_bytes(hashlib.blake2b(data[band * size:(band + 1) * size],
+                                                  digest_size=8).digest(), 'big', signed=True))
+            for band in range(BANDS)]
+
+
+def load_signature(blob: bytes) -> array:
+    sig = array('I')
+    sig.frombytes(blob)
+    return sig
+
+
+class NearDuplicateIndex:
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def store(conn: sqlite3.Connection, prompt_id: int, sig: array):
+        """在调用方的写事务中保存签名和分桶"""
+        conn.execute('DELETE FROM minhash_pending WHERE prompt_id = ?', (prompt_id,))
+        conn.execute('DELETE FROM minhash_buckets WHERE prompt_id = ?', (prompt_id,))
+        conn.execute('INSERT OR REPLACE INTO minhash_signatures (prompt_id, signature) VALUES (?, ?)',
+                     (prompt_id, sig.tobytes()))
+        conn.executemany('INSERT OR IGNORE INTO minhash_buckets (band, bucket, prompt_id) VALUES (?, ?, ?)',
+                         [(band, bucket, prompt_id) for band, bucket in band_keys(sig)])
+
+    def index_prompt(self, conn: sqlite3.Connection, prompt_id: int, text: str):
+        """保存单条prompt时在同一事务中更新签名"""
+        self.store(conn, prompt_id, signature(text))
+
+    def refresh(self, chunk_size: int = 500, progress=None) -> int:
+        """为minhash_pending中的prompt(新增或正文变化)计算签名, 返回计算的数量"""
+        done = 0
+        last_id = 0
+        while True:
+            rows = self.db.reader.execute(f'''
+                SELECT p.id, {CONTENT_TEXT} FROM minhash_pending m
+                JOIN prompts p ON p.id = m.prompt_id
+                WHERE m.prompt_id > ?
+                ORDER BY m.prompt_id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                return done
+            signatures = [(prompt_id, signature(text)) for prompt_id, text in rows]
+            with self.db.connections.write() as conn:
+                for prompt_id, sig in signatures:
+                    # 计算期间可能已被删除
+                    if conn.execute('SELECT 1 FROM prompts WHERE id = ?', (prompt_id,)).fetchone():
+                        self.store(conn, prompt_id, sig)
+            done += len(rows)
+            last_id = rows[-1][0]
+            if progress:
+                progress(done)
+
+    def candidates(self, sig: array) -> List[int]:
+        keys = band_keys(sig)
+        placeholders = ','.join('(?, ?)' for _ in keys)
+        # CROSS JOIN固定以键列表为外层循环, 每个键走主键查找
+        cursor = self.db.reader.execute(f'''
+            WITH keys(band, bucket) AS (VALUES {placeholders})
+            SELECT DISTINCT m.prompt_id FROM keys
+            CROSS JOIN minhash_buckets m ON m.band = keys.band AND m.bucket = keys.bucket
+        ''', [v for key in keys for v in key])
+        return [row[0] for row in cursor]
+
+    def _signatures(self, ids: List[int]) -> Dict[int, array]:
+        result = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            cursor = self.db.reader.execute(
+                f"SELECT prompt_id, signature FROM minhash_signatures "
+                f"WHERE prompt_id IN ({','.join('?' * len(chunk))})", chunk)
+            result.update((prompt_id, load_signature(blob)) for prompt_id, blob in cursor)
+        return result
+
+    def _matches(self, scores: Dict[int, float]) -> List[DuplicateMatch]:
+        if not scores:
+            return []
+        ids = list(scores)
+        cursor = self.db.reader.execute(
+            f"SELECT id, uuid, title FROM prompts WHERE id IN ({','.join('?' * len(ids))})", ids)
+        matches = [DuplicateMatch(id_, uuid_, title, scores[id_]) for id_, uuid_, title in cursor]
+        return sorted(matches, key=lambda m: (-m.similarity, m.id))
+
+    def find_similar(self, text: str, threshold: float = DEFAULT_THRESHOLD,
+                     exclude_id: Optional[int] = None) -> List[DuplicateMatch]:
+        """与给定正文相似度不低于threshold的prompt, 按相似度从高到低"""
+        self.refresh()
+        sig = signature(text)
+        ids = [i for i in self.candidates(sig) if i != exclude_id]
+        scores = {}
+        for prompt_id, other in self._signatures(ids).items():
+            score = similarity(sig, other)
+            if score >= threshold:
+                scores[prompt_id] = score
+        return self._matches(scores)
+
+    def find_duplicates(self, threshold: float = DEFAULT_THRESHOLD) -> List[List[DuplicateMatch]]:
+        """所有近似重复组(每组至少两个prompt), 只比较落在同一桶中的prompt"""
+        self.refresh()
+        parent = {}
+
+        def find(x):
+            while parent.get(x, x) != x:
+                parent[x] = parent.get(parent[x], parent[x])
+                x = parent[x]
+            return x
+
+        best = {}   # prompt_id -> 与组内成员的最高相似度
+        cursor = self.db.reader.execute('''
+            SELECT group_concat(prompt_id) FROM minhash_buckets
+            GROUP BY band, bucket HAVING COUNT(*) > 1
+        ''')
+        pairs = set()
+        for members, in cursor:
+            ids = sorted(int(i) for i in members.split(','))
+            if len(ids) > MAX_BUCKET_COMPARE:
+                pairs.update((ids[0], other) for other in ids[1:])
+            else:
+                pairs.update((a, b) for n, a in enumerate(ids) for b in ids[n + 1:])
+        signatures = self._signatures(sorted({i for pair in pairs for i in pair}))
+        for a, b in pairs:
+            if a not in signatures or b not in signatures:
+                continue    # 查询期间被修改或删除
+            score = similarity(signatures[a], signatures[b])
+            if score >= threshold:
+                parent[find(b)] = find(a)
+                best[a] = max(best.get(a, 0.0), score)
+                best[b] = max(best.get(b, 0.0), score)
+        groups = {}
+        for prompt_id in best:
+            groups.setdefault(find(prompt_id), {})[prompt_id] = best[prompt_id]
+        result = [self._matches(scores) for scores in groups.values()]
+        return sorted(result, key=lambda g: (-len(g), g[0].id))
+
+
+class DuplicateFilter:
+    """导入时判断新记录是否与库中或本次已接受的记录近似重复"""
+
+    def __init__(self, db: Database, threshold: float = DEFAULT_THRESHOLD):
+        self.db = db
+        self.threshold = threshold
+        self.index = NearDuplicateIndex(db)
+        self.index.refresh()
+        self.seen: Dict[Tuple[int, int], List[Tuple[str, array]]] = {}
+
+    def is_update(self, prompt_uuid: Optional[str]) -> bool:
+        """uuid与库中相同的记录是更新, 总是保留"""
+        return bool(prompt_uuid) and self.db.reader.execute(
+            'SELECT 1 FROM prompts WHERE uuid = ?', (prompt_uuid,)).fetchone() is not None
+
+    def match(self, sig: array) -> Optional[Tuple[str, float]]:
+        """(相似记录的uuid, 相似度), 没有近似重复时返回None"""
+        for key in band_keys(sig):
+            for other_uuid, other in self.seen.get(key, ()):
+                score = similarity(sig, other)
+                if score >= self.threshold:
+                    return other_uuid, score
+        ids = self.index.candidates(sig)
+        for prompt_id, other in self.index._signatures(ids).items():
+            score = similarity(sig, other)
+            if score >= self.threshold:
+                row = self.db.reader.execute('SELECT uuid FROM prompts WHERE id = ?', (prompt_id,)).fetchone()
+                if row:
+                    return row[0], score
+        return None
+
+    def add(self, key: str, sig: array):
+        """记下已接受的记录, 之后的记录也与它比较"""
+        for band_key in band_keys(sig):
+            self.seen.setdefault(band_key, []).append((key, sig))
+
+
+def skip_near_duplicates(db: Database, records: Iterable, threshold: float = DEFAULT_THRESHOLD,
+                         skipped: Optional[List[RecordError]] = None) -> Iterator:
+    """导入时过滤记录: 与库中或本次已导入的其他prompt近似重复的记录不产出, 记入skipped
+
+    uuid与库中相同的记录是更新, 总是保留.
+    """
+    duplicates = DuplicateFilter(db, threshold)
+    for position, record in enumerate(records):
+        if isinstance(record, ValueError):
+            yield record
+            continue
+        try:
+            prompt = record if isinstance(record, Prompt) else Prompt.from_dict(record)
+        except ValueError:
+            yield record    # 交给bulk_upsert记录错误
+            continue
+        if not isinstance(prompt.content, str) or duplicates.is_update(prompt.uuid):
+            yield record
+            continue
+        sig = signature(prompt.content)
+        duplicate = duplicates.match(sig)
+        if duplicate:
+            if skipped is not None:
+                skipped.append(RecordError(position, prompt.uuid or '',
+                                           f"near-duplicate of {duplicate[0]} ({duplicate[1]:.2f})"))
+            continue
+        duplicates.add(prompt.uuid or f'#{position}', sig)
+        yield record
@@ -1,37 +1,181 @@
+"""界面翻译
 
+i18n/ 目录下的每个 <语言代码>.json 都是一个语言包, 启动时只列出文件名,
+第一次使用某个语言时才读取并把嵌套结构展开成 "a.b.c" -> 文本 的平表,
+之后 t() 只是一次字典查找. 当前语言缺少的键依次回退到 FALLBACK_LANG 和键本身,
+回退结果也记入平表, 缺失的键按语言汇总在 missing 中.
+
+    python i18n.py          # 检查所有语言包相对 zh.json 缺少/多余的键, 以及代码中用到而 zh.json 没有的键
+"""
+import ast
+import glob
 import json
 import os
+import string
+import sys
+from typing import Dict, Iterable, List, Optional, Set
+
+I18N_DIR = os.path.join(os.path.dirname(__file__), 'i18n')
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+FALLBACK_LANG = "zh"   # 界面源文本的语言, 其他语言包以它为准
+
+
+def flatten(tree: dict, prefix: str = '') -> Dict[str, str]:
+    """把嵌套的语言包展开为点分隔键的平表, 非字符串的叶子转为字符串"""
+    table = {}
+    for key, value in tree.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            table.update(flatten(value, f'{name}.'))
+        else:
+            table[name] = value if isinstance(value, str) else str(value)
+    return table
+
+
+def discover_languages(i18n_dir: str = I18N_DIR) -> List[str]:
+    """i18n目录下所有语言包的语言代码, 源语言排在最前"""
+    try:
+        names = os.listdir(i18n_dir)
+    except OSError:
+        return []
+    languages = sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+    if FALLBACK_LANG in languages:
+        languages.remove(FALLBACK_LANG)
+        languages.insert(0, FALLBACK_LANG)
+    return languages
+
+
+def _placeholders(text: str) -> List[str]:
+    try:
+        return [field for _, field, _, _ in string.Formatter().parse(text) if field is not None]
+    except ValueError:
+        return ['<invalid format>']
+
 
 class I18n:
-    def __init__(self):
-        self.current_lang = "zh"
-        self.translations = self._load_translations()
-    
-    def _load_translations(self):
-        """加载翻译文件"""
-        translations = {}
-        i18n_dir = os.path.join(os.path.dirname(__file__), 'i18n')
-        
-        for lang in ['zh', 'en']:
-            file_path = os.path.join(i18n_dir, f'{lang}.json')
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    translations[lang] = json.load(f)
-        
-        return translations
-    
+    """界面翻译; 语言包在第一次使用时才读取"""
+    def __init__(self, lang: str = FALLBACK_LANG, i18n_dir: str = I18N_DIR):
+        self.i18n_dir = i18n_dir
+        self.languages = discover_languages(i18n_dir)
+        self.tables: Dict[str, Dict[str, str]] = {}   # 语言 -> 展开后的键表(含已回退的键)
+        self.missing: Dict[str, Set[str]] = {}        # 语言 -> 查找时缺少的键
+        self.current_lang = FALLBACK_LANG
+        self._table = self._load_language(FALLBACK_LANG) or {}
+        self.set_language(lang)
+
+    def _load_language(self, lang: str) -> Optional[Dict[str, str]]:
+        """读取并展开一个语言包, 已读取过的直接返回; 不存在或无法解析时返回None"""
+        table = self.tables.get(lang)
+        if table is not None:
+            return table
+        if lang not in self.languages:
+            return None
+        file_path = os.path.join(self.i18n_dir, f'{lang}.json')
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                table = flatten(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error loading language pack {file_path}: {e}")
+            return None
+        self.tables[lang] = table
+        return table
+
     def t(self, key: str) -> str:
         """获取翻译文本"""
-        try:
-            keys = key.split('.')
-            value = self.translations[self.current_lang]
-            for k in keys:
-                value = value[k]
-            return value
-        except (KeyError, TypeError):
-            return key
-    
-    def set_language(self, lang: str):
-        """设置当前语言"""
-        if lang in self.translations:
-            self.current_lang = lang
\ No newline at end of file
+        text = self._table.get(key)
+        if text is None:
+            text = self._resolve_missing(key)
+        return text
+
+    def _resolve_missing(self, key: str) -> str:
+        """记录缺少的键并回退; 结果写回当前语言的键表, 同一个键只处理一次"""
+        self.missing.setdefault(self.current_lang, set()).add(key)
+        fallback = self.tables.get(FALLBACK_LANG, {})
+        text = fallback.get(key, key) if self.current_lang != FALLBACK_LANG else key
+        self._table[key] = text
+        return text
+
+    def set_language(self, lang: str) -> bool:
+        """设置当前语言, 语言包不存在时保持原语言并返回False"""
+        table = self._load_language(lang)
+        if table is None:
+            return False
+        self.current_lang = lang
+        self._table = table
+        return True
+
+    def next_language(self) -> str:
+        """语言切换按钮循环切换到的下一个语言"""
+        if self.current_lang not in self.languages:
+            return self.current_lang
+        index = self.languages.index(self.current_lang)
+        return self.languages[(index + 1) % len(self.languages)]
+
+    def language_name(self, lang: str) -> str:
+        """语言包中 lang.name 给出的显示名称, 没有时为语言代码"""
+        table = self._load_language(lang)
+        return (table or {}).get("lang.name", lang)
+
+
+def used_keys(paths: Iterable[str]) -> Set[str]:
+    """源文件中以字符串字面量传给 t() / xxx.t() 的键; 运行时拼出的键(f-string)无法检查"""
+    keys = set()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not node.args:
+                continue
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+            if name != 't':
+                continue
+            keys.update(_literal_keys(node.args[0]))
+    return keys
+
+
+def _literal_keys(node: ast.AST) -> List[str]:
+    """字面量键, 包括 t("a" if x else "b") 这样的条件表达式"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.IfExp):
+        return _literal_keys(node.body) + _literal_keys(node.orelse)
+    return []
+
+
+def check_packs(i18n_dir: str = I18N_DIR, source_dir: Optional[str] = SOURCE_DIR) -> Dict[str, Dict[str, List[str]]]:
+    """一次性比较所有语言包与源语言包: 缺少的键、多余的键、占位符不一致的键;
+    给出source_dir时还检查其中的代码用到而源语言包没有的键(undefined)"""
+    reference = I18n(FALLBACK_LANG, i18n_dir)
+    source = reference.tables.get(FALLBACK_LANG, {})
+    report = {}
+    if source_dir:
+        used = used_keys(sorted(glob.glob(os.path.join(source_dir, '*.py'))))
+        report[FALLBACK_LANG] = {'undefined': sorted(used - source.keys())}
+    for lang in reference.languages:
+        if lang == FALLBACK_LANG:
+            continue
+        table = reference._load_language(lang) or {}
+        report[lang] = {
+            'missing': sorted(source.keys() - table.keys()),
+            'extra': sorted(table.keys() - source.keys()),
+            'placeholders': sorted(key for key in source.keys() & table.keys()
+                                   if _placeholders(source[key]) != _placeholders(table[key])),
+        }
+    return report
+
+
+def main() -> int:
+    report = check_packs()
+    problems = 0
+    for lang, issues in report.items():
+        for kind, keys in issues.items():
+            for key in keys:
+                print(f"{lang}: {kind} {key}")
+            if kind != 'extra':
+                problems += len(keys)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""多进程流水线导入: 目录或多个JSON/JSONL/Markdown文件
+
+    python importer.py prompts/ extra.jsonl --workers 4 --dedup 0.8
+
+输入先被划分为导入单元: 大的JSONL文件按换行对齐切成若干分片, JSON数组文件
+整个文件一个单元, Markdown和小文件合并成一个单元. 解析、规范化以及正文哈希、
+统计(textstats)和MinHash签名(dedup)在进程池中计算; 主进程中唯一的写入者
+按提交顺序取回结果, 凑够一批后在一个事务中写入prompts/text_stats/minhash
+并记录已完成单元的检查点.
+
+同时在途的单元数有上限(背压), 解析快于写入时不会把整个输入读进内存.
+中断后用相同参数再次运行会跳过已有检查点的单元; 检查点按文件路径、大小、
+修改时间和分片范围标识, 文件改动后会重新导入. 导入全部完成后删除本次的检查点,
+之后再导入同样的文件会完整地重新导入.
+没有uuid的记录按文件路径和记录位置生成确定的uuid5, 重复导入同一文件不会产生重复的prompt.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+import archive
+import dedup
+import textstats
+from db import BulkResult, Database, RecordError, normalize_tags
+from revisions import content_hash
+
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+SUPPORTED_EXTENSIONS = ('.json',) + archive.JSONL_EXTENSIONS + MARKDOWN_EXTENSIONS
+SHARD_BYTES = 4 << 20          # JSONL分片和小文件合并单元的目标大小
+COMMIT_RECORDS = 2000          # 每个写事务至少包含的记录数
+UUID_NAMESPACE = uuid.UUID('5b0c1f9e-4d7a-4c52-9a51-2f8e3c6d7a10')
+
+
+@dataclass
+class Segment:
+    path: str
+    kind: str     # 'json' / 'jsonl' / 'markdown'
+    start: int    # 字节范围, 只对JSONL分片有意义
+    end: int
+
+
+@dataclass
+class ImportUnit:
+    key: str                  # 检查点标识
+    segments: List[Segment]
+    size: int
+
+
+@dataclass
+class PreparedRecord:
+    """worker规范化后的记录, 附带并行计算好的哈希、统计和签名"""
+    position: int
+    uuid: str
+    title: str
+    content: str
+    category: str
+    content_hash: str
+    stats: textstats.TextStats
+    signature: bytes
+    tags: Optional[List[str]] = None   # 记录中没有tags字段时为None, 不修改已有标签
+
+
+@dataclass
+class UnitResult:
+    key: str
+    records: List[PreparedRecord]
+    errors: List[RecordError]
+    size: int
+    parse_seconds: float
+
+
+@dataclass
+class ImportReport:
+    files: int = 0
+    units: int = 0
+    resumed_units: int = 0       # 检查点中已完成而跳过的单元
+    records: int = 0             # 本次解析出的记录数(含出错和跳过的)
+    written: int = 0
+    changed: int = 0
+    errors: List[RecordError] = field(default_factory=list)
+    skipped: List[RecordError] = field(default_factory=list)
+    bytes: int = 0
+    seconds: float = 0.0
+    parse_seconds: float = 0.0   # 所有worker解析/计算耗时之和
+    write_seconds: float = 0.0
+    workers: int = 1
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> dict:
+        return {
+            'files': self.files, 'units': self.units, 'resumed_units': self.resumed_units,
+            'records': self.records, 'written': self.written, 'changed': self.changed,
+            'errors': len(self.errors), 'skipped': len(self.skipped),
+            'megabytes': round(self.bytes / 1e6, 2), 'seconds': round(self.seconds, 3),
+            'records_per_second': round(self.records_per_second, 1),
+            'parse_seconds': round(self.parse_seconds, 3),
+            'write_seconds': round(self.write_seconds, 3), 'workers': self.workers,
+        }
+
+
+def discover(paths: Iterable[str]) -> List[str]:
+    """展开目录(递归), 只保留支持的扩展名, 按路径排序"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        else:
+            files.append(path)
+    return [os.path.abspath(f) for f in files]
+
+
+def file_kind(path: str) -> str:
+    lower = path.lower()
+    if lower.endswith(MARKDOWN_EXTENSIONS):
+        return 'markdown'
+    return 'jsonl' if archive.is_jsonl(path) else 'json'
+
+
+def _jsonl_shards(path: str, size: int, shard_bytes: int) -> List[Tuple[int, int]]:
+    """按换行对齐的字节范围"""
+    bounds = [0]
+    with open(path, 'rb') as f:
+        while bounds[-1] + shard_bytes < size:
+            f.seek(bounds[-1] + shard_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def plan_units(files: List[str], shard_bytes: int = SHARD_BYTES) -> List[ImportUnit]:
+    """把文件划分为导入单元; 相同的输入总是得到相同的单元和检查点标识"""
+    units = []
+    pending: List[Segment] = []
+    pending_size = 0
+
+    def add(segments: List[Segment], size: int):
+        st = [os.stat(s.path) for s in segments]
+        identity = '\n'.join(f'{s.path}|{t.st_size}|{t.st_mtime_ns}|{s.start}-{s.end}'
+                             for s, t in zip(segments, st))
+        units.append(ImportUnit(hashlib.sha1(identity.encode('utf-8')).hexdigest(), segments, size))
+
+    for path in files:
+        size = os.path.getsize(path)
+        kind = file_kind(path)
+        if kind == 'jsonl' and size > shard_bytes:
+            for start, end in _jsonl_shards(path, size, shard_bytes):
+                add([Segment(path, kind, start, end)], end - start)
+        elif size >= shard_bytes:
+            add([Segment(path, kind, 0, size)], size)
+        else:
+            # 小文件合并, 避免每个文件一次进程间往返
+            pending.append(Segment(path, kind, 0, size))
+            pending_size += size
+            if pending_size >= shard_bytes:
+                add(pending, pending_size)
+                pending, pending_size = [], 0
+    if pending:
+        add(pending, pending_size)
+    return units
+
+
+def parse_markdown(text: str, path: str) -> dict:
+    """一个Markdown文件是一条prompt
+
+    可选的front matter(--- 之间的 key: value 行)给出title/category/uuid;
+    没有title时使用第一个 # 标题(从正文中去掉), 再没有则使用文件名.
+    """
+    record = {}
+    body = text.lstrip('﻿')
+    if body.startswith('---'):
+        header, sep, rest = body[3:].partition('\n---')
+        if sep:
+            for line in header.strip().splitlines():
+                key, colon, value = line.partition(':')
+                if colon and key.strip() in ('title', 'category', 'uuid'):
+                    record[key.strip()] = value.strip().strip('"\'')
+            body = rest.split('\n', 1)[1] if '\n' in rest else ''
+    body = body.strip('\n')
+    if 'title' not in record:
+        first, _, rest = body.partition('\n')
+        if first.startswith('# '):
+            record['title'] = first[2:].strip()
+            body = rest.strip('\n')
+        else:
+            record['title'] = os.path.splitext(os.path.basename(path))[0]
+    record['content'] = body
+    return record
+
+
+def _read_segment(segment: Segment) -> Iterable:
+    if segment.kind == 'markdown':
+        with open(segment.path, 'rb') as f:
+            text = f.read().decode('utf-8-sig', errors='replace')
+        yield parse_markdown(text, segment.path)
+        return
+    with open(segment.path, 'rb') as f:
+        if segment.kind == 'json':
+            try:
+                yield from archive.iter_json_array(f)
+            except ValueError as e:
+                yield ValueError(str(e))
+            return
+        f.seek(segment.start)
+        data = f.read(segment.end - segment.start)
+    yield from archive.iter_jsonl(data.splitlines(True))
+
+
+def prepare_unit(unit: ImportUnit) -> UnitResult:
+    """worker: 解析单元中的记录并计算哈希、统计和MinHash签名"""
+    start = time.perf_counter()
+    records, errors = [], []
+    position = 0
+    for segment in unit.segments:
+        name = os.path.basename(segment.path)
+        if segment.start:
+            name = f'{name}@{segment.start}'   # JSONL分片中的行号从分片起点算起
+        for offset, record in enumerate(_read_segment(segment)):
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                if not isinstance(record, dict):
+                    raise ValueError(f"record must be an object, got {type(record).__name__}")
+                title = record.get('title', '')
+                content = record.get('content', '')
+                category = record.get('category', '通用')
+                for label, value in (('title', title), ('content', content), ('category', category)):
+                    if not isinstance(value, str):
+                        raise ValueError(f"{label} must be a string")
+                tags = normalize_tags(record['tags']) if 'tags' in record else None
+                prompt_uuid = record.get('uuid') or str(
+                    uuid.uuid5(UUID_NAMESPACE, f'{segment.path}:{segment.start}:{offset}'))
+                records.append(PreparedRecord(
+                    position, str(prompt_uuid), title, content, category, content_hash(content),
+                    textstats.compute(content), dedup.signature(content).tobytes(), tags))
+            except ValueError as e:
+                uuid_ = str(record.get('uuid') or '') if isinstance(record, dict) else ''
+                errors.append(RecordError(position, uuid_, f"{name}: {e}"))
+            position += 1
+    return UnitResult(unit.key, records, errors, unit.size, time.perf_counter() - start)
+
+
+class BatchWriter:
+    """唯一的写入者: 凑够一批记录后在一个事务中写入, 并记下这些单元的检查点"""
+
+    def __init__(self, db: Database, report: ImportReport, dedup_threshold: Optional[float] = None,
+                 commit_records: int = COMMIT_RECORDS):
+        self.db = db
+        self.report = report
+        self.commit_records = commit_records
+        self.duplicates = dedup.DuplicateFilter(db, dedup_threshold) if dedup_threshold is not None else None
+        self.pending: List[UnitResult] = []
+        self.pending_records = 0
+
+    def add(self, result: UnitResult):
+        self.pending.append(result)
+        self.pending_records += len(result.records)
+        if self.pending_records >= self.commit_records:
+            self.flush()
+
+    def _accept(self, record: PreparedRecord) -> bool:
+        if self.duplicates is None or self.duplicates.is_update(record.uuid):
+            return True
+        sig = dedup.load_signature(record.signature)
+        duplicate = self.duplicates.match(sig)
+        if duplicate:
+            self.report.skipped.append(RecordError(
+                record.position, record.uuid, f"near-duplicate of {duplicate[0]} ({duplicate[1]:.2f})"))
+            return False
+        self.duplicates.add(record.uuid, sig)
+        return True
+
+    def flush(self):
+        if not self.pending:
+            return
+        start = time.perf_counter()
+        result = BulkResult()
+        codec = self.db.connections.codec
+        with self.db.connections.write() as conn:
+            conn.execute('BEGIN')
+            for unit in self.pending:
+                accepted = [r for r in unit.records if self._accept(r)]
+                batch = [(r.position, (r.uuid, r.title, *codec.encode(r.content), r.category, False,
+                                       len(r.content), r.content_hash))
+                         for r in accepted]
+                self.db._write_batch(conn, batch, result)
+                failed = {e.uuid for e in result.errors}
+                ids = dict(self._ids(conn, [r.uuid for r in accepted if r.uuid not in failed]))
+                for record in accepted:
+                    prompt_id = ids.get(record.uuid)
+                    if prompt_id is None:
+                        continue
+                    textstats.store(conn, record.content_hash, record.stats)
+                    dedup.NearDuplicateIndex.store(conn, prompt_id, dedup.load_signature(record.signature))
+                    if record.tags is not None:
+                        self.db._set_tags(conn, prompt_id, record.tags)
+                conn.execute('INSERT OR REPLACE INTO import_checkpoints (unit, records, finished_at) '
+                             'VALUES (?, ?, ?)', (unit.key, len(unit.records), time.time()))
+        self.db.prompt_cache.clear()
+        self.report.written += result.written
+        self.report.changed += result.changed
+        self.report.errors.extend(result.errors)
+        self.report.write_seconds += time.perf_counter() - start
+        self.pending, self.pending_records = [], 0
+
+    @staticmethod
+    def _ids(conn, uuids: List[str]):
+        for i in range(0, len(uuids), 500):
+            chunk = uuids[i:i + 500]
+            yield from conn.execute(
+                f"SELECT uuid, id FROM prompts WHERE uuid IN ({','.join('?' * len(chunk))})", chunk)
+
+
+def completed_units(db: Database, keys: List[str]) -> set:
+    done = set()
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        done.update(row[0] for row in db.reader.execute(
+            f"SELECT unit FROM import_checkpoints WHERE unit IN ({','.join('?' * len(chunk))})", chunk))
+    return done
+
+
+def interrupted_units(db: Database, paths: Iterable[str], shard_bytes: int = SHARD_BYTES) -> int:
+    """这些输入在上次中断的导入中已完成的单元数, 为0时导入会从头开始"""
+    return len(completed_units(db, [u.key for u in plan_units(discover(paths), shard_bytes)]))
+
+
+def run_import(db: Database, paths: Iterable[str], workers: Optional[int] = None,
+               dedup_threshold: Optional[float] = None, restart: bool = False,
+               progress: Optional[archive.ProgressCallback] = None,
+               max_in_flight: Optional[int] = None, shard_bytes: int = SHARD_BYTES) -> ImportReport:
+    """流水线导入, 返回包含吞吐量的报告; progress按已写入的字节数回调"""
+    started = time.perf_counter()
+    files = discover(paths)
+    units = plan_units(files, shard_bytes)
+    workers = workers or os.cpu_count() or 1
+    report = ImportReport(files=len(files), units=len(units), workers=workers)
+    if restart:
+        with db.connections.write() as conn:
+            conn.executemany('DELETE FROM import_checkpoints WHERE unit = ?', [(u.key,) for u in units])
+    done = completed_units(db, [u.key for u in units])
+    todo = [u for u in units if u.key not in done]
+    report.resumed_units = len(units) - len(todo)
+    total = sum(u.size for u in todo)
+    writer = BatchWriter(db, report, dedup_threshold)
+
+    def consume(result: UnitResult):
+        report.records += len(result.records) + len(result.errors)
+        report.errors.extend(result.errors)
+        report.parse_seconds += result.parse_seconds
+        report.bytes += result.size
+        writer.add(result)
+        if progress:
+            progress(report.bytes, total)
+
+    if workers == 1 or len(todo) <= 1:
+        for unit in todo:
+            consume(prepare_unit(unit))
+    else:
+        # 按提交顺序取回结果, 在途单元数有上限: 写入跟不上时暂停提交新单元
+        limit = max_in_flight or workers * 2
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for unit in todo:
+                if len(in_flight) >= limit:
+                    consume(in_flight.popleft().result())
+                in_flight.append(pool.submit(prepare_unit, unit))
+            while in_flight:
+                consume(in_flight.popleft().result())
+    writer.flush()
+    # 检查点只用于继续中断的导入, 全部写完后清除
+    with db.connections.write() as conn:
+        conn.executemany('DELETE FROM import_checkpoints WHERE unit = ?', [(u.key,) for u in units])
+    db._refresh_semantic()
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="并行导入目录或多个JSON/JSONL/Markdown文件")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--db', help="数据库路径, 默认使用程序目录下的prompts.db")
+    parser.add_argument('--workers', type=int, help="解析进程数, 默认为CPU核数")
+    parser.add_argument('--dedup', type=float, metavar='THRESHOLD',
+                        help="跳过与已有prompt相似度不低于THRESHOLD(0~1)的新记录")
+    parser.add_argument('--restart', action='store_true', help="忽略上次中断留下的检查点, 重新导入所有单元")
+    args = parser.parse_args(argv)
+    db = Database(args.db, sync_builtins=False)
+    try:
+        report = run_import(db, args.paths, args.workers, args.dedup, args.restart)
+    finally:
+        db.close()
+    for error in report.errors:
+        print(json.dumps({'error': error.message, 'index': error.index, 'uuid': error.uuid},
+                         ensure_ascii=False), file=sys.stderr)
+    print(json.dumps(report.summary(), ensure_ascii=False))
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+from typing import Dict, List, Optional, Sequence
+
+from db import Database, FilterType, LRUCache, PromptSummary
+from profiling import PROFILER
+
+
+class PromptListModel:
+    """列表数据模型: 列表控件只通过 len() 和 window() 读取可见范围的数据"""
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def window(self, start: int, stop: int) -> List[PromptSummary]:
+        """返回[start, stop)范围内的行"""
+        raise NotImplementedError
+
+    def get(self, index: int) -> Optional[PromptSummary]:
+        if 0 <= index < len(self):
+            rows = self.window(index, index + 1)
+            return rows[0] if rows else None
+        return None
+
+    # 写操作完成前后就地修改模型, 不重新查询整个列表
+    def index_of(self, prompt_uuid: str) -> Optional[int]:
+        """已加载的行中查找, 不在内存中时返回None"""
+        return None
+
+    def replace(self, row: PromptSummary) -> Optional[int]:
+        """按uuid替换已有行, 返回其索引"""
+        return None
+
+    def append(self, row: PromptSummary) -> int:
+        """乐观地把还没写入的新行追加到末尾, 返回其索引"""
+        raise NotImplementedError
+
+    def confirm(self, row: PromptSummary) -> Optional[int]:
+        """写入完成后用数据库中的行替换乐观行"""
+        return self.replace(row)
+
+    def remove(self, prompt_uuid: str) -> Optional[int]:
+        """乐观地删除行, 返回原来的索引"""
+        return None
+
+    def removed(self, prompt_uuid: str):
+        """删除已写入数据库"""
+
+
+class SequenceModel(PromptListModel):
+    """已经在内存中的结果(例如搜索结果)"""
+
+    def __init__(self, rows: Sequence[PromptSummary]):
+        self.rows = list(rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def window(self, start: int, stop: int) -> List[PromptSummary]:
+        return self.rows[max(start, 0):stop]
+
+    def index_of(self, prompt_uuid: str) -> Optional[int]:
+        for i, row in enumerate(self.rows):
+            if row.uuid == prompt_uuid:
+                return i
+        return None
+
+    def replace(self, row: PromptSummary) -> Optional[int]:
+        index = self.index_of(row.uuid)
+        if index is not None:
+            self.rows[index] = row
+        return index
+
+    def append(self, row: PromptSummary) -> int:
+        self.rows.append(row)
+        return len(self.rows) - 1
+
+    def remove(self, prompt_uuid: str) -> Optional[int]:
+        index = self.index_of(prompt_uuid)
+        if index is not None:
+            del self.rows[index]
+        return index
+
+
+class QueryModel(PromptListModel):
+    """按过滤器分页读取的游标模型
+
+    创建时只执行一次 COUNT, 行数据按页懒加载并缓存最近访问的页.
+    顺序滚动时用上一页最后的id续读, 避免OFFSET跳过大量行.
+    还没写入的新行(没有id)暂存在 _extra 中排在最后, 写入后按id顺序它也正好在最后.
+    已提交但还没写入的删除只把行隐藏起来(_hidden记录它在查询结果中的位置),
+    这时重新读取的页中仍有这一行, 删除写入后 removed() 才把它从计数和页中去掉.
+    """
+
+    def __init__(self, db: Database, filter_type: FilterType, page_size: int = 200, max_pages: int = 16):
+        self.db = db
+        self.filter_type = filter_type
+        self.page_size = page_size
+        self._count = db.count_prompts(filter_type)
+        self._pages = LRUCache(maxsize=max_pages)
+        self._extra: List[PromptSummary] = []
+        self._hidden: Dict[str, int] = {}     # 等待删除的uuid -> 在查询结果中的位置
+
+    def __len__(self) -> int:
+        return self._count - len(self._hidden) + len(self._extra)
+
+    def _to_row(self, index: int) -> int:
+        """显示位置 -> 查询结果中的位置(跳过隐藏的行)"""
+        for hidden in sorted(self._hidden.values()):
+            if hidden > index:
+                break
+            index += 1
+        return index
+
+    def _to_index(self, row: int) -> int:
+        return row - sum(1 for hidden in self._hidden.values() if hidden < row)
+
+    def window(self, start: int, stop: int) -> List[PromptSummary]:
+        start = max(start, 0)
+        visible = self._count - len(self._hidden)
+        extra = self._extra[max(start - visible, 0):max(stop - visible, 0)]
+        stop = min(stop, visible)
+        rows = []
+        if start < stop:
+            first, last = self._to_row(start), self._to_row(stop - 1) + 1
+            for page in range(first // self.page_size, (last - 1) // self.page_size + 1):
+                page_rows = self._page(page)
+                base = page * self.page_size
+                rows.extend(row for row in page_rows[max(first - base, 0):last - base]
+                            if row.uuid not in self._hidden)
+        return rows + extra
+
+    def _locate(self, prompt_uuid: str) -> Optional[int]:
+        """已加载的行在查询结果中的位置, _extra中的行排在_count之后"""
+        if prompt_uuid in self._hidden:
+            return None
+        for i, row in enumerate(self._extra):
+            if row.uuid == prompt_uuid:
+                return self._count + i
+        for page, rows in self._pages.items():
+            for i, row in enumerate(rows):
+                if row.uuid == prompt_uuid:
+                    return page * self.page_size + i
+        return None
+
+    def index_of(self, prompt_uuid: str) -> Optional[int]:
+        row = self._locate(prompt_uuid)
+        return None if row is None else self._to_index(row)
+
+    def replace(self, row: PromptSummary) -> Optional[int]:
+        position = self._locate(row.uuid)
+        if position is None:
+            return None
+        if position >= self._count:
+            self._extra[position - self._count] = row
+        else:
+            page, offset = divmod(position, self.page_size)
+            self._pages.get(page)[offset] = row
+        return self._to_index(position)
+
+    def append(self, row: PromptSummary) -> int:
+        self._extra.append(row)
+        return len(self) - 1
+
+    def confirm(self, row: PromptSummary) -> Optional[int]:
+        position = self._locate(row.uuid)
+        if position is None or position < self._count:
+            return self.replace(row)
+        del self._extra[position - self._count]
+        if not self.db.matches_filter(self.filter_type, row.id):
+            # 新行不属于当前的过滤结果(例如在"内置Prompt"或按标签过滤时新建)
+            return None
+        # 新行已写入: 计入COUNT, 丢弃它所在的页(下次访问时重新读取)
+        self._pages.pop(self._count // self.page_size)
+        self._count += 1
+        return self._to_index(self._count - 1)
+
+    def remove(self, prompt_uuid: str) -> Optional[int]:
+        position = self._locate(prompt_uuid)
+        if position is None:
+            # 不在已加载的页中, 无法确定位置, 删除写入后再重新计数
+            return None
+        index = self._to_index(position)
+        if position >= self._count:
+            del self._extra[position - self._count]
+        else:
+            self._hidden[prompt_uuid] = position
+        return index
+
+    def removed(self, prompt_uuid: str):
+        position = self._hidden.pop(prompt_uuid, None)
+        if position is None:
+            if self._locate(prompt_uuid) is None:
+                self._count = self.db.count_prompts(self.filter_type)
+                self._pages.clear()
+            return
+        # 之后的行前移一位: 这一行和后面的隐藏行位置减一, 丢弃这一行所在及之后的页
+        for uuid, hidden in self._hidden.items():
+            if hidden > position:
+                self._hidden[uuid] = hidden - 1
+        first = position // self.page_size
+        for page, _ in self._pages.items():
+            if page >= first:
+                self._pages.pop(page)
+        self._count -= 1
+
+    def _page(self, page: int) -> List[PromptSummary]:
+        rows = self._pages.get(page)
+        if rows is not None:
+            return rows
+        previous = self._pages.get(page - 1) if page > 0 else None
+        if previous:
+            rows = self.db.get_summaries_page(self.filter_type, self.page_size,
+                                              after_id=previous[-1].id)
+        else:
+            rows = self.db.get_summaries_page(self.filter_type, self.page_size,
+                                              offset=page * self.page_size)
+        self._pages.put(page, rows)
+        return rows
+
+
+PROFILER.register(QueryModel, ['window', '_page'], category='model')
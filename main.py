@@ -1,24 +1,72 @@
+import time
+_STARTED = time.perf_counter()   # 启动各阶段的耗时都相对这里计算
 import tkinter as tk
 from tkinter import messagebox, filedialog
+import tkinter.font as tkfont
 import customtkinter as ctk
 import json
 import uuid
 import os
-from db import Database, Prompt
+import queue
+import threading
 from i18n import I18n  # 新增导入
+from profiling import PROFILER
+# db/列表模型/搜索/写队列在窗口显示后由 open_database() 在后台线程导入
+
+def _elapsed_ms() -> float:
+    return round((time.perf_counter() - _STARTED) * 1000, 1)
+
+
+def open_database(db_path=None, filter_type="所有Prompt"):
+    """打开数据库(迁移、同步内置prompts)并预读列表第一页; 不涉及Tk, 可以在任意线程调用"""
+    from db import Database
+    from list_model import QueryModel
+    db = Database(db_path)
+    model = QueryModel(db, filter_type)
+    model.window(0, model.page_size)
+    return db, model
+
+
+# 工具栏按钮(创建时的中文文本) -> 翻译键
+BUTTON_TEXT_KEYS = {
+    "新建": "btn.new",
+    "保存": "btn.save",
+    "删除": "btn.delete",
+    "导入": "btn.import",
+    "导出": "btn.export",
+    "预览": "btn.preview",
+    "查重": "btn.duplicates",
+}
+
+# 排序菜单的选项(Database.filter_summaries 的order_by), 显示文本为翻译键 sort.<order_by>
+SORT_OPTIONS = ('id', 'title', 'tokens', '-tokens')
 
 class PromptManager(ctk.CTk):
     def __init__(self):
         super().__init__()
         
-        # 初始化国际化
+        # 启动各阶段完成时距进程启动的毫秒数(见 bench.py --startup)
+        self.startup_phases = {'imports': _elapsed_ms()}
+        
+        # 初始化国际化(只读取当前语言的语言包)
         self.i18n = I18n()
         
-        # 初始化数据库
-        self.db = Database()
+        # 数据库在窗口显示后由后台线程打开(见 _open_database), 打开之前以下均为None
+        self.db = None
+        # 后台搜索调度器(防抖, 独立连接, 丢弃过期查询)
+        self.search_scheduler = None
+        # 后台写队列: 保存/删除不阻塞界面, 连续保存同一个prompt合并为一次写入
+        self.write_queue = None
+        self._unsaved = {}        # uuid -> 已提交但还没写入的Prompt, 打开时优先使用
         
-        # 添加prompt存储字典
-        self.prompt_cache = {}
+        # 列表数据模型, 按索引提供PromptSummary(不含content, 打开时再按id读取)
+        self.prompt_model = None
+        
+        # 模板预览窗口(同时只打开一个)
+        self.preview_window = None
+        
+        # 性能剖析面板(F12)
+        self.profiler_window = None
         
         # 配置窗口
         self.title(self.i18n.t("app.title"))
@@ -27,7 +75,16 @@ class PromptManager(ctk.CTk):
         # 创建变量
         self.title_var = tk.StringVar()
         self.category_var = tk.StringVar(value="通用")
+        self.tags_var = tk.StringVar()
         self.filter_var = tk.StringVar(value="所有Prompt")
+        # 分类菜单显示"分类 (数量)", _category_choices 把显示文本映射回分类名(全部分类为None)
+        self.category_filter_var = tk.StringVar(value=self.i18n.t("facet.all_categories"))
+        self._category_choices = {}
+        self.tag_filter_var = tk.StringVar()
+        # 排序菜单显示翻译后的文本, _sort_choices 把显示文本映射回order_by
+        self._sort_choices = {self.i18n.t(f"sort.{order}"): order for order in SORT_OPTIONS}
+        self.sort_var = tk.StringVar(value=self.i18n.t("sort.id"))
+        self.max_tokens_var = tk.StringVar()
         self.search_var = tk.StringVar()
         self.search_var.trace_add("write", self._on_search_changed)  # 添加搜索变量监听
         
@@ -37,14 +94,72 @@ class PromptManager(ctk.CTk):
         # 创建界面
         self.create_gui()
         
-        # 加载提示词
-        self.load_prompts()
-        
         # 添加语言切换按钮
         self._add_language_switcher()
         
+
         # 保存需要更新文本的组件引用
         self.ui_elements = {}
+        
+        self.bind("<Control-s>", lambda e: self.save_prompt())
+        self.bind("<F12>", lambda e: self.open_profiler())
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # 先显示窗口框架, 事件循环空闲后再打开数据库并加载列表
+        self.count_label.configure(text="⏳")
+        self.startup_phases['shell'] = _elapsed_ms()
+        self.after_idle(self._open_database)
+    
+    def _open_database(self):
+        # 环境变量PROMPT_DB可以指定数据库文件, 默认使用程序目录下的prompts.db
+        self.startup_phases['first_paint'] = _elapsed_ms()
+        filter_type = self.filter_var.get()
+        self._run_in_background(
+            lambda progress: open_database(os.environ.get('PROMPT_DB'), filter_type),
+            self._on_database_ready, poll_ms=10
+        )
+    
+    def _on_database_ready(self, result, error):
+        """主线程: 接入已打开的数据库, 按当前的过滤/排序/搜索条件显示列表"""
+        if error:
+            self.count_label.configure(text="")
+            messagebox.showerror(self.i18n.t("dialog.error"),
+                                 self.i18n.t("dialog.open_db_failed").format(error))
+            return
+        from search import SearchScheduler
+        from writequeue import WriteQueue
+        self.db, model = result
+        self.startup_phases['database'] = _elapsed_ms()
+        self.search_scheduler = SearchScheduler(self, self.db, self._on_search_results)
+        self.write_queue = WriteQueue(self, self.db, self._on_write_done)
+        self._refresh_category_menu()
+        
+        # 加载期间用户可能已经输入了搜索词或改变了过滤条件, 预读的第一页只在条件未变时使用
+        if self.search_var.get().strip():
+            self._on_search_changed()
+        elif (model.filter_type == self._current_filter() and self._sort_order() == 'id'
+              and not self.max_tokens_var.get().strip()):
+            self._update_prompt_list(model)
+        else:
+            self.load_prompts()
+        self.update_idletasks()
+        self.startup_phases['list'] = _elapsed_ms()
+        
+        if os.environ.get('PROMPT_STARTUP_BENCH'):
+            # bench.py --startup: 输出各阶段耗时后退出
+            print(json.dumps(self.startup_phases), flush=True)
+            self.after_idle(self.on_close)
+            return
+        
+        # 后台补齐批量导入/同步的prompt的token统计
+        self._backfill_stats()
+    
+    def _ready(self) -> bool:
+        """数据库是否已经打开; 还没打开时在状态栏提示"""
+        if self.db is None:
+            self._show_status(self.i18n.t("status.opening_db"))
+            return False
+        return True
     
     def create_gui(self):
         # 创建主布局
@@ -79,7 +194,7 @@ class PromptManager(ctk.CTk):
         # 搜索框
         self.search_entry = ctk.CTkEntry(
             search_frame,
-            placeholder_text="搜索提示词...",
+            placeholder_text=self.i18n.t("search.placeholder"),
             textvariable=self.search_var,
             height=35,
             corner_radius=8
@@ -100,6 +215,17 @@ class PromptManager(ctk.CTk):
         clear_button.pack(side=tk.RIGHT, padx=(5,0))
         self.clear_button = clear_button
         
+        # 语义搜索开关: 打开后关键词结果与本地向量索引的结果混合排序
+        self.semantic_var = tk.BooleanVar(value=False)
+        self.semantic_switch = ctk.CTkSwitch(
+            sidebar,
+            text=self.i18n.t("search.semantic"),
+            variable=self.semantic_var,
+            command=self._on_semantic_toggle,
+            font=("Microsoft YaHei UI", 11)
+        )
+        self.semantic_switch.pack(anchor="w", padx=15, pady=(0,5))
+        
         # 过滤器容器
         filter_frame = ctk.CTkFrame(sidebar, fg_color="transparent")
         filter_frame.pack(fill=tk.X, padx=15, pady=10)
@@ -128,13 +254,73 @@ class PromptManager(ctk.CTk):
             btn.pack(side=tk.LEFT, padx=2, expand=True)
             self.filter_buttons[text] = btn  # 用原始文本作为键
         
+        # 排序和token上限: 例如只列出2000 token以内的prompt
+        sort_frame = ctk.CTkFrame(sidebar, fg_color="transparent")
+        sort_frame.pack(fill=tk.X, padx=15, pady=(0,5))
+        
+        self.sort_menu = ctk.CTkOptionMenu(
+            sort_frame,
+            values=list(self._sort_choices),
+            variable=self.sort_var,
+            command=lambda _: self.load_prompts(),
+            width=110,
+            height=28,
+            font=("Microsoft YaHei UI", 11)
+        )
+        self.sort_menu.pack(side=tk.LEFT)
+        
+        self.max_tokens_label = ctk.CTkLabel(
+            sort_frame,
+            text=self.i18n.t("sort.max_tokens"),
+            font=("Microsoft YaHei UI", 11),
+            text_color="gray60"
+        )
+        self.max_tokens_label.pack(side=tk.LEFT, padx=(10,5))
+        
+        self.max_tokens_entry = ctk.CTkEntry(
+            sort_frame,
+            textvariable=self.max_tokens_var,
+            placeholder_text=self.i18n.t("sort.unlimited"),
+            width=70,
+            height=28
+        )
+        self.max_tokens_entry.pack(side=tk.LEFT)
+        self.max_tokens_entry.bind("<Return>", lambda e: self.load_prompts())
+        self.max_tokens_entry.bind("<FocusOut>", lambda e: self.load_prompts())
+        
+        # 分类(带数量)和标签过滤, 与上面的过滤器按钮组合
+        facet_frame = ctk.CTkFrame(sidebar, fg_color="transparent")
+        facet_frame.pack(fill=tk.X, padx=15, pady=(0,5))
+        
+        self.category_menu = ctk.CTkOptionMenu(
+            facet_frame,
+            values=[self.category_filter_var.get()],
+            variable=self.category_filter_var,
+            command=lambda _: self.load_prompts(),
+            width=110,
+            height=28,
+            font=("Microsoft YaHei UI", 11),
+            dynamic_resizing=False
+        )
+        self.category_menu.pack(side=tk.LEFT)
+        
+        self.tag_filter_entry = ctk.CTkEntry(
+            facet_frame,
+            textvariable=self.tag_filter_var,
+            placeholder_text=self.i18n.t("facet.tags_placeholder"),
+            height=28
+        )
+        self.tag_filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10,0))
+        self.tag_filter_entry.bind("<Return>", lambda e: self.load_prompts())
+        self.tag_filter_entry.bind("<FocusOut>", lambda e: self.load_prompts())
+        
         # 提示词列表标题
         list_header = ctk.CTkFrame(sidebar, fg_color="transparent")
         list_header.pack(fill=tk.X, padx=15, pady=(20,5))
         
         list_label = ctk.CTkLabel(
             list_header,
-            text="📝 提示词列表",
+            text=self.i18n.t("list.title"),
             font=("Microsoft YaHei UI", 14, "bold"),
             anchor="w"
         )
@@ -142,7 +328,7 @@ class PromptManager(ctk.CTk):
         
         count_label = ctk.CTkLabel(
             list_header,
-            text="0 个项目",
+            text=self.i18n.t("list.count").format(0),
             font=("Microsoft YaHei UI", 11),
             text_color="gray60"
         )
@@ -185,11 +371,12 @@ class PromptManager(ctk.CTk):
         title_frame = ctk.CTkFrame(main, fg_color="transparent")
         title_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=10)
         
-        ctk.CTkLabel(
+        self.title_label = ctk.CTkLabel(
             title_frame,
-            text="标题:",
+            text=self.i18n.t("editor.title"),
             font=("Microsoft YaHei UI", 12, "bold")
-        ).pack(side=tk.LEFT, padx=5)
+        )
+        self.title_label.pack(side=tk.LEFT, padx=5)
         
         title_entry = ctk.CTkEntry(
             title_frame,
@@ -199,11 +386,12 @@ class PromptManager(ctk.CTk):
         )
         title_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         
-        ctk.CTkLabel(
+        self.category_label = ctk.CTkLabel(
             title_frame,
-            text="分类:",
+            text=self.i18n.t("editor.category"),
             font=("Microsoft YaHei UI", 12, "bold")
-        ).pack(side=tk.LEFT, padx=5)
+        )
+        self.category_label.pack(side=tk.LEFT, padx=5)
         
         category_entry = ctk.CTkEntry(
             title_frame,
@@ -214,6 +402,23 @@ class PromptManager(ctk.CTk):
         )
         category_entry.pack(side=tk.LEFT, padx=5)
         
+        self.tags_label = ctk.CTkLabel(
+            title_frame,
+            text=self.i18n.t("editor.tags"),
+            font=("Microsoft YaHei UI", 12, "bold")
+        )
+        self.tags_label.pack(side=tk.LEFT, padx=5)
+        
+        self.tags_entry = ctk.CTkEntry(
+            title_frame,
+            textvariable=self.tags_var,
+            placeholder_text=self.i18n.t("editor.tags_placeholder"),
+            width=160,
+            height=32,
+            font=("Microsoft YaHei UI", 11)
+        )
+        self.tags_entry.pack(side=tk.LEFT, padx=5)
+        
         # 按钮工具栏
         btn_frame = ctk.CTkFrame(main, fg_color="transparent")
         btn_frame.grid(row=1, column=0, sticky="ew", padx=10, pady=(5,10))
@@ -223,7 +428,9 @@ class PromptManager(ctk.CTk):
             ("保存", "#3498DB", self.save_prompt),      # 蓝色
             ("删除", "#E74C3C", self.delete_prompt),    # 红色
             ("导入", "#34495E", self.import_prompts),   # 深灰蓝色
-            ("导出", "#34495E", self.export_prompts)    # 深灰蓝色
+            ("导出", "#34495E", self.export_prompts),   # 深灰蓝色
+            ("预览", "#8E44AD", self.preview_template), # 紫色
+            ("查重", "#34495E", self.find_duplicates)   # 深灰蓝色
         ]
         
         # 保存按钮工具栏引用
@@ -234,7 +441,7 @@ class PromptManager(ctk.CTk):
         for text, color, command in button_configs:
             btn = ctk.CTkButton(
                 btn_frame,
-                text=text,
+                text=self.i18n.t(BUTTON_TEXT_KEYS[text]),
                 command=command,
                 width=100,
                 height=32,
@@ -256,57 +463,161 @@ class PromptManager(ctk.CTk):
             fg_color="transparent"
         )
         self.content_text.pack(fill=tk.BOTH, expand=True, padx=2, pady=2)
+        self.content_text.bind("<KeyRelease>", lambda e: self._schedule_stats_update())
+        
+        # 状态栏: 左侧显示保存/删除结果(非模态, 自动消失), 右侧是正文统计
+        status_bar = ctk.CTkFrame(main, fg_color="transparent")
+        status_bar.grid(row=3, column=0, sticky="ew", padx=15, pady=(0,5))
+        
+        self.status_label = ctk.CTkLabel(
+            status_bar,
+            text="",
+            font=("Microsoft YaHei UI", 10),
+            text_color="gray60",
+            anchor="w"
+        )
+        self.status_label.pack(side=tk.LEFT)
+        self._status_after_id = None
+        
+        # 正文统计: 字符/词/近似token数, 输入停顿后更新
+        self.stats_label = ctk.CTkLabel(
+            status_bar,
+            text="",
+            font=("Microsoft YaHei UI", 10),
+            text_color="gray60",
+            anchor="e"
+        )
+        self.stats_label.pack(side=tk.RIGHT)
+        self._stats_after_id = None
+
+    def _show_status(self, text, error=False, timeout_ms=4000):
+        """在状态栏显示消息, timeout_ms后自动清除(为None时保留)"""
+        if self._status_after_id is not None:
+            self.after_cancel(self._status_after_id)
+            self._status_after_id = None
+        self.status_label.configure(text=text, text_color="#E74C3C" if error else "gray60")
+        if timeout_ms is not None:
+            self._status_after_id = self.after(timeout_ms, self._clear_status)
+
+    def _clear_status(self):
+        self._status_after_id = None
+        self.status_label.configure(text="")
+
+    def _schedule_stats_update(self, delay_ms=300):
+        if self._stats_after_id is not None:
+            self.after_cancel(self._stats_after_id)
+        self._stats_after_id = self.after(delay_ms, self._update_stats_label)
+
+    def _update_stats_label(self):
+        """按编辑器中的正文计算统计(与保存时写入缓存的算法相同)"""
+        import textstats
+        self._stats_after_id = None
+        stats = textstats.compute(self.content_text.get("1.0", "end-1c"))
+        self.stats_label.configure(
+            text=self.i18n.t("status.text_stats").format(
+                chars=stats.chars, words=stats.words, tokens=stats.approx_tokens)
+        )
 
     def _on_search_changed(self, *args):
         """处理搜索文本变化"""
+        if self.db is None:
+            return   # 数据库打开后会按当前搜索词重新执行
         search_text = self.search_var.get().strip()
         if search_text:
-            # 执行搜索
-            prompts = self.db.search_prompts(search_text)
-            self._update_prompt_list(prompts)
+            # 交给后台线程搜索, 结果通过 _on_search_results 回调
+            self.search_scheduler.submit(search_text)
             self.clear_button.configure(fg_color=("gray75", "gray35"))  # 显示清除按钮
         else:
             # 恢复显示所有prompt
+            self.search_scheduler.cancel()
             self.load_prompts()
             self.clear_button.configure(fg_color="transparent")  # 隐藏清除按钮
 
+    def _on_semantic_toggle(self):
+        """切换关键词/混合搜索, 并用当前搜索词重新搜索"""
+        if self.semantic_var.get():
+            if not self._ready() or not self.db.semantic:
+                messagebox.showwarning(self.i18n.t("dialog.warning"), self.i18n.t("dialog.semantic_requires_numpy"))
+                self.semantic_var.set(False)
+                return
+            self.search_scheduler.query = lambda db, keyword: db.search_hybrid(keyword)
+        else:
+            from search import default_query
+            self.search_scheduler.query = default_query
+        self._on_search_changed()
+
+    def _on_search_results(self, keyword, prompts):
+        """后台搜索完成后在主线程刷新列表"""
+        self._update_prompt_list(prompts)
+
     def _clear_search(self):
         """清除搜索"""
         self.search_var.set("")
         self.load_prompts()
 
     def _update_prompt_list(self, prompts):
-        """更新提示词列表显示"""
-        self.prompt_list.delete(0, tk.END)
-        self.prompt_cache.clear()
-        
-        # 确保每行有足够的空间显示图标和标题
-        max_title_len = max([len(p.title) for p in prompts]) if prompts else 0
-        format_str = " {:<" + str(max_title_len + 4) + "}"
-        
-        for i, p in enumerate(prompts):
-            # 添加项目，包括图标和固定宽度的格式
-            icon = "📌" if p.is_builtin else "📝"
-            display_text = format_str.format(f"{icon} {p.title}")
-            self.prompt_list.insert(tk.END, display_text)
-            self.prompt_cache[i] = p
-            
-            # 设置内置项目的特殊样式
-            if p.is_builtin:
-                self.prompt_list.itemconfig(
-                    i,
-                    fg="#4CAF50" if ctk.get_appearance_mode()=="light" else "#81C784"
-                )
+        """更新提示词列表显示, prompts为列表模型或PromptSummary列表"""
+        from list_model import PromptListModel, SequenceModel
+        if not isinstance(prompts, PromptListModel):
+            prompts = SequenceModel(prompts)
+        self.prompt_model = prompts
+        # 虚拟列表只绘制可见行, 刷新耗时与总行数无关
+        self.prompt_list.set_model(prompts)
         
         # 更新计数
-        count = len(prompts)
-        self.count_label.configure(text=f"{count} 个项目")
+        self._update_count_label()
+
+    def _current_filter(self):
+        """过滤器按钮加上分类/标签过滤; 没有选择分类和标签时就是过滤器按钮名"""
+        category = self._category_choices.get(self.category_filter_var.get())
+        tags = self.tag_filter_var.get().strip()
+        if category is None and not tags:
+            return self.filter_var.get()
+        from db import PromptFilter
+        return PromptFilter.from_filter_type(self.filter_var.get(), category=category, tags=tags)
+
+    def _refresh_category_menu(self):
+        """按预先维护的分类计数更新分类菜单, 保持当前选择的分类"""
+        selected = self._category_choices.get(self.category_filter_var.get())
+        all_label = self.i18n.t("facet.all_categories")
+        self._category_choices = {all_label: None}
+        counts = self.db.category_counts() if self.db is not None else {}
+        for name, count in counts.items():
+            self._category_choices[f"{name} ({count})"] = name
+        self.category_menu.configure(values=list(self._category_choices))
+        label = next((text for text, name in self._category_choices.items()
+                      if name == selected and selected is not None), all_label)
+        if self.category_filter_var.get() != label:
+            self.category_filter_var.set(label)
+            if selected is not None and label == all_label and self.db is not None:
+                # 选中的分类已经没有prompt, 回到全部分类
+                self.load_prompts()
 
     def load_prompts(self):
         """加载提示词列表"""
-        filter_type = self.filter_var.get()
-        prompts = self.db.get_filtered_prompts(filter_type)
-        self._update_prompt_list(prompts)
+        if self.db is None:
+            return
+        from list_model import QueryModel
+        filter_type = self._current_filter()
+        order_by = self._sort_order()
+        max_tokens = self.max_tokens_var.get().strip()
+        if order_by == 'id' and not max_tokens.isdigit():
+            self._update_prompt_list(QueryModel(self.db, filter_type))
+            return
+        # 排序或按token过滤时一次读出摘要(不含正文)
+        self._update_prompt_list(self.db.filter_summaries(
+            filter_type, max_tokens=int(max_tokens) if max_tokens.isdigit() else None,
+            order_by=order_by
+        ))
+
+    def _backfill_stats(self):
+        """后台计算缺少的正文统计, 完成后刷新列表中的token数"""
+        def done(computed, error):
+            if error:
+                print(f"Error computing prompt stats: {error}")
+            self.load_prompts()
+        
+        self._run_in_background(lambda progress: self.db.backfill_stats(progress=progress), done)
 
     def on_select_prompt(self, event=None):
         """选择提示词时的处理"""
@@ -315,20 +626,28 @@ class PromptManager(ctk.CTk):
             return
             
         index = selection[0]
-        prompt = self.prompt_cache.get(index)
+        summary = self.prompt_model.get(index)
+        # 列表只保存摘要, 打开时才读取正文(数据库层有LRU缓存); 还在写队列中的以队列里的为准
+        prompt = self._unsaved.get(summary.uuid) if summary else None
+        if prompt is None and summary and summary.id is not None:
+            prompt = self.db.get_prompt_by_id(summary.id)
         
         if prompt:
             self.title_var.set(prompt.title)
             self.category_var.set(prompt.category)
+            self.tags_var.set(", ".join(prompt.tags or []))
             self.content_text.delete("1.0", tk.END)
             self.content_text.insert("1.0", prompt.content)
+            self._update_stats_label()
     
     def new_prompt(self):
         """新建提示词"""
         self.prompt_list.selection_clear(0, tk.END)
         self.title_var.set("")
         self.category_var.set("通用")
+        self.tags_var.set("")
         self.content_text.delete("1.0", tk.END)
+        self._update_stats_label()
 
     def save_prompt(self):
         """保存当前prompt"""
@@ -336,111 +655,298 @@ class PromptManager(ctk.CTk):
         category = self.category_var.get().strip()
         content = self.content_text.get("1.0", tk.END).strip()
         
+        if not self._ready():
+            return
         if not title or not content:
-            messagebox.showwarning("提示", "标题和内容不能为空!")
+            self._show_status(self.i18n.t("dialog.empty_content"), error=True)
+            return
+        import textstats
+        from db import Prompt, PromptSummary, normalize_tags
+        try:
+            tags = normalize_tags(self.tags_var.get())
+        except ValueError as e:
+            self._show_status(str(e), error=True)
             return
             
-        # 获取当前选中的prompt(如果有)
+        # 获取当前选中的prompt(如果有), 按它的uuid更新而不是插入一条副本
         selection = self.prompt_list.curselection()
-        prompt_id = None
-        if selection:
-            prompt = self.prompt_cache.get(selection[0])  # 从缓存中获取
-            prompt_id = prompt.id if prompt else None
-            
-        # 创建新的prompt对象
+        current = self.prompt_model.get(selection[0]) if selection else None
+        
         new_prompt = Prompt(
-            id=prompt_id,
-            uuid=str(uuid.uuid4()) if not prompt_id else None,
+            id=current.id if current else None,
+            uuid=current.uuid if current else str(uuid.uuid4()),
             title=title,
             content=content,
             category=category,
-            is_builtin=False
+            is_builtin=bool(current.is_builtin) if current else False,
+            tags=tags
         )
         
-        # 保存到数据库
-        if self.db.save_prompt(new_prompt):
-            messagebox.showinfo("成功", "保存成功!")
-            self.load_prompts()
+        # 先就地更新列表, 写入在后台进行, 完成后由 _on_write_done 确认
+        summary = PromptSummary(new_prompt.id, new_prompt.uuid, title, category, new_prompt.is_builtin,
+                                len(content), textstats.approx_tokens(content))
+        if current:
+            self.prompt_model.replace(summary)
         else:
-            messagebox.showerror("错误", "保存失败!")
+            self.prompt_list.selection_set(self.prompt_model.append(summary))
+            self._update_count_label()
+        self.prompt_list.refresh()
+        
+        self._unsaved[new_prompt.uuid] = new_prompt
+        self.write_queue.save(new_prompt)
+        self._show_status(self.i18n.t("status.saving"), timeout_ms=None)
 
     def delete_prompt(self):
         """删除当前prompt"""
+        if not self._ready():
+            return
         selection = self.prompt_list.curselection()
         if not selection:
             return
             
         index = selection[0]
-        prompt = self.prompt_cache.get(index)  # 从缓存中获取
+        prompt = self.prompt_model.get(index)  # 从列表模型中获取
         if not prompt:
             return
             
         if prompt.is_builtin:
-            messagebox.showwarning("提示", "内置Prompt不能删除!")
+            self._show_status(self.i18n.t("dialog.delete_builtin"), error=True)
             return
             
-        if messagebox.askyesno("确认", "确定要删除这个Prompt吗?"):
-            if self.db.delete_prompt(prompt.id):
-                messagebox.showinfo("成功", "删除成功!")
+        if messagebox.askyesno(self.i18n.t("dialog.confirm"), self.i18n.t("dialog.delete_confirm")):
+            # 立即从列表中移除, 后台删除失败时再重新加载
+            self._unsaved.pop(prompt.uuid, None)
+            self.write_queue.delete(prompt.uuid, prompt.id)
+            self.prompt_model.remove(prompt.uuid)
+            self.new_prompt()  # 清空编辑区
+            self._update_count_label()
+            self.prompt_list.refresh()
+            self._show_status(self.i18n.t("status.deleting"), timeout_ms=None)
+
+    def _on_write_done(self, op):
+        """主线程: 后台写入完成后确认或回滚乐观更新"""
+        if op.kind == 'save':
+            if self._unsaved.get(op.key) is op.prompt:
+                del self._unsaved[op.key]
+            if not op.ok:
+                self._show_status(self.i18n.t("dialog.save_failed"), error=True)
                 self.load_prompts()
-                self.new_prompt()  # 清空编辑区
-            else:
-                messagebox.showerror("错误", "删除失败!")
+                return
+            # 换成数据库中的行(新建的prompt这时才有id)
+            summary = self.db.get_summary_by_uuid(op.key)
+            if summary:
+                selected = self.prompt_list.curselection()
+                was_selected = bool(selected) and self.prompt_model.index_of(op.key) == selected[0]
+                index = self.prompt_model.confirm(summary)
+                if was_selected and index is not None:
+                    self.prompt_list.selection_set(index)
+                elif was_selected:
+                    # 新建的prompt不属于当前过滤结果, 不再显示; 清空编辑区, 避免再次保存时又新建一条
+                    self.new_prompt()
+                self._update_count_label()
+                self.prompt_list.refresh()
+            self._refresh_category_menu()
+            self._show_status(self.i18n.t("dialog.save_success") if op.submitted == 1
+                              else self.i18n.t("status.saved_merged").format(op.submitted))
+        else:
+            if not op.ok:
+                self._show_status(self.i18n.t("dialog.delete_failed"), error=True)
+                self.load_prompts()
+                return
+            self.prompt_model.removed(op.key)
+            self._update_count_label()
+            self.prompt_list.refresh()
+            self._refresh_category_menu()
+            self._show_status(self.i18n.t("dialog.delete_success"))
+
+    def on_close(self):
+        """关闭窗口前写完队列中的保存/删除"""
+        if self.write_queue is not None and not self.write_queue.close():
+            print("Error closing write queue: pending writes did not finish in time")
+        if self.search_scheduler is not None:
+            self.search_scheduler.close()
+        self.destroy()
 
     def import_prompts(self):
-        """从json文件导入prompts"""
-        filename = filedialog.askopenfilename(
-            filetypes=[("JSON Files", "*.json")],
-            title="选择要导入的JSON文件"
+        """导入一个或多个JSON/JSONL/Markdown文件(多进程解析, 单一写入者批量提交)"""
+        if not self._ready():
+            return
+        filenames = filedialog.askopenfilenames(
+            filetypes=[("Prompt Files", "*.json *.jsonl *.ndjson *.md *.markdown"),
+                       ("JSON Files", "*.json"), ("JSON Lines", "*.jsonl *.ndjson"),
+                       ("Markdown", "*.md *.markdown")],
+            title=self.i18n.t("dialog.import_select")
         )
-        if not filename:
+        if not filenames:
             return
-            
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                prompts = json.load(f)
-                
-            success = 0
-            for p in prompts:
-                prompt = Prompt(
-                    id=None,
-                    uuid=p.get('uuid', str(uuid.uuid4())),
-                    title=p.get('title', ''),
-                    content=p.get('content', ''),
-                    category=p.get('category', '通用'),
-                    is_builtin=False
-                )
-                if self.db.save_prompt(prompt):
-                    success += 1
-                    
+        dedup_threshold = 0.8 if messagebox.askyesno(
+            self.i18n.t("dialog.confirm"), self.i18n.t("dialog.import_dedup")
+        ) else None
+        import importer
+        restart = False
+        if importer.interrupted_units(self.db, filenames):
+            # 上次导入这些文件时中断了: 继续导入剩余部分, 或者全部重新导入
+            resume = messagebox.askyesnocancel(self.i18n.t("dialog.confirm"),
+                                               self.i18n.t("dialog.import_resume"))
+            if resume is None:
+                return
+            restart = not resume
+        
+        def work(progress):
+            # 解析在进程池中进行, 本线程是唯一的写入者
+            return importer.run_import(self.db, filenames, dedup_threshold=dedup_threshold,
+                                       restart=restart, progress=progress)
+        
+        def done(report, error):
+            self._refresh_category_menu()
             self.load_prompts()
-            messagebox.showinfo("成功", f"成功导入 {success} 个Prompt!")
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"导入失败: {str(e)}")
+            t = self.i18n.t
+            if error:
+                messagebox.showerror(t("dialog.error"), t("dialog.import_failed").format(error))
+                return
+            message = t("dialog.import_success").format(report.written) + " " + \
+                t("dialog.import_speed").format(f"{report.records_per_second:.0f}")
+            if report.errors:
+                details = "\n".join(
+                    f"#{e.index} {e.uuid}: {e.message}" for e in report.errors[:10]
+                )
+                messagebox.showwarning(
+                    t("dialog.warning"),
+                    f"{message}\n{t('dialog.import_errors').format(len(report.errors))}\n{details}"
+                )
+            elif report.skipped:
+                messagebox.showinfo(
+                    t("dialog.success"),
+                    f"{message}\n{t('dialog.import_skipped').format(len(report.skipped))}"
+                )
+            else:
+                messagebox.showinfo(t("dialog.success"), message)
+        
+        self._run_in_background(work, done)
 
     def export_prompts(self):
-        """导出prompts到json文件"""
+        """流式导出prompts到JSON/JSONL文件"""
+        if not self._ready():
+            return
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON Files", "*.json")],
-            title="选择保存位置"
+            filetypes=[("JSON Files", "*.json"), ("JSON Lines", "*.jsonl")],
+            title=self.i18n.t("dialog.export_select")
         )
         if not filename:
             return
-            
-        try:
-            filter_type = self.filter_var.get()
-            prompts = self.db.get_filtered_prompts(filter_type)
-            data = self.db.export_prompts_to_json(prompts)
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-                
-            messagebox.showinfo("成功", "导出成功!")
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"导出失败: {str(e)}")
+        
+        filter_type = self._current_filter()
+        
+        def work(progress):
+            import archive
+            # 后台线程使用自己的读连接遍历游标
+            return archive.export_file(self.db, filename, filter_type, progress)
+        
+        def done(result, error):
+            self._update_count_label()
+            if error:
+                messagebox.showerror(self.i18n.t("dialog.error"),
+                                     self.i18n.t("dialog.export_failed").format(error))
+            else:
+                messagebox.showinfo(self.i18n.t("dialog.success"), self.i18n.t("dialog.export_success"))
+        
+        self._run_in_background(work, done)
+
+    def preview_template(self):
+        """打开模板预览窗口, 按编辑器中的正文渲染 {{变量}}"""
+        if not self._ready():
+            return
+        if self.preview_window is not None and self.preview_window.winfo_exists():
+            self.preview_window.focus()
+            return
+        self.preview_window = TemplatePreview(
+            self, self.db.templates, lambda: self.content_text.get("1.0", "end-1c")
+        )
+
+    def open_profiler(self):
+        """打开性能剖析面板"""
+        if self.profiler_window is not None and self.profiler_window.winfo_exists():
+            self.profiler_window.focus()
+            return
+        # 运行中启用时重新打开连接, 之后的SQL才会被计时
+        self.profiler_window = ProfilerPanel(
+            self, on_enable=lambda: self.db and self.db.connections.close()
+        )
+
+    def find_duplicates(self):
+        """选中prompt时查找与它近似重复的prompt, 否则列出整个库中的近似重复组"""
+        if not self._ready():
+            return
+        selection = self.prompt_list.curselection()
+        summary = self.prompt_model.get(selection[0]) if selection else None
+        
+        def work(progress):
+            index = self.db.near_duplicates
+            index.refresh(progress=lambda done: progress(done, 0))
+            if summary:
+                return [self.db.find_near_duplicates(summary.id)]
+            return index.find_duplicates()
+        
+        def done(groups, error):
+            t = self.i18n.t
+            self._update_count_label()
+            if error:
+                messagebox.showerror(t("dialog.error"), t("duplicates.failed").format(error))
+                return
+            groups = [g for g in groups if g]
+            if not groups:
+                messagebox.showinfo(t("dialog.warning"), t("duplicates.none"))
+                return
+            lines = []
+            if summary:
+                lines.append(t("duplicates.similar_to").format(summary.title))
+            for n, group in enumerate(groups, 1):
+                if not summary:
+                    lines.append(t("duplicates.group").format(n, len(group)))
+                lines.extend(f"    {m.similarity:.0%}  #{m.id} {m.title}" for m in group)
+                lines.append("")
+            window = ctk.CTkToplevel(self)
+            window.title(t("duplicates.title"))
+            window.geometry("560x420")
+            text = ctk.CTkTextbox(window, wrap="none", font=("Microsoft YaHei UI", 11))
+            text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            text.insert("1.0", "\n".join(lines))
+            text.configure(state="disabled")
+        
+        self._run_in_background(work, done)
+
+    def _run_in_background(self, work, on_done, poll_ms=50):
+        """在后台线程执行work(progress), 进度显示在计数标签上, 完成后在主线程回调on_done(result, error)"""
+        events = queue.Queue()
+        
+        def target():
+            try:
+                result = work(lambda done, total: events.put(("progress", (done, total))))
+                events.put(("done", result))
+            except Exception as e:
+                events.put(("error", e))
+        
+        def poll():
+            progress = None
+            while True:
+                try:
+                    kind, value = events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "progress":
+                    progress = value
+                else:
+                    on_done(value if kind == "done" else None, value if kind == "error" else None)
+                    return
+            if progress:
+                done, total = progress
+                percent = f"{done * 100 // total}%" if total else str(done)
+                self.count_label.configure(text=f"⏳ {percent}")
+            self.after(poll_ms, poll)
+        
+        threading.Thread(target=target, daemon=True).start()
+        self.after(poll_ms, poll)
 
     # 美化窗口
     def configure_window_style(self):
@@ -493,88 +999,428 @@ class PromptManager(ctk.CTk):
         
         lang_btn = ctk.CTkButton(
             lang_frame,
-            text=self.i18n.t("lang.switch"),
+            text=self.i18n.language_name(self.i18n.next_language()),
             width=80,
             height=25,
             command=self._switch_language
         )
         lang_btn.pack(padx=5, pady=5)
+        self.lang_button = lang_btn
     
     def _switch_language(self):
-        """切换语言"""
-        current_lang = self.i18n.current_lang
-        new_lang = "en" if current_lang == "zh" else "zh"
-        self.i18n.set_language(new_lang)
+        """切换到下一个语言包(i18n目录中的所有语言循环切换)"""
+        self.i18n.set_language(self.i18n.next_language())
         self._update_ui_texts()
     
+    def _translatable_texts(self):
+        """(组件, 选项, 文本) 列表, 文本按当前语言翻译"""
+        t = self.i18n.t
+        items = [
+            (self.search_entry, "placeholder_text", t("search.placeholder")),
+            (self.tag_filter_entry, "placeholder_text", t("facet.tags_placeholder")),
+            (self.tags_label, "text", t("editor.tags")),
+            (self.tags_entry, "placeholder_text", t("editor.tags_placeholder")),
+            (self.semantic_switch, "text", t("search.semantic")),
+            (self.max_tokens_label, "text", t("sort.max_tokens")),
+            (self.max_tokens_entry, "placeholder_text", t("sort.unlimited")),
+            (self.title_label, "text", t("editor.title")),
+            (self.category_label, "text", t("editor.category")),
+            (self.list_label, "text", t("list.title")),
+            (self.lang_button, "text", self.i18n.language_name(self.i18n.next_language())),
+        ]
+        # 过滤器按钮和工具栏按钮以创建时的中文文本为键
+        items.extend((btn, "text", t(f"filter.{text}")) for text, btn in self.filter_buttons.items())
+        items.extend((self.buttons[text], "text", t(key))
+                     for text, key in BUTTON_TEXT_KEYS.items() if text in self.buttons)
+        return items
+    
     def _update_ui_texts(self):
-        """更新界面文本"""
-        # 更新窗口标题
-        self.title(self.i18n.t("app.title"))
+        """更新界面文本, 只重新配置文本有变化的组件"""
+        title = self.i18n.t("app.title")
+        if self.title() != title:
+            self.title(title)
+        for widget, option, text in self._translatable_texts():
+            if widget.cget(option) != text:
+                widget.configure(**{option: text})
+        self._refresh_sort_menu()
+        self._refresh_category_menu()
+        self._update_count_label()
+    
+    def _sort_order(self) -> str:
+        """排序菜单当前选择的order_by"""
+        return self._sort_choices.get(self.sort_var.get(), 'id')
+    
+    def _refresh_sort_menu(self):
+        """按当前语言更新排序菜单, 保持选择的排序"""
+        order = self._sort_order()
+        self._sort_choices = {self.i18n.t(f"sort.{o}"): o for o in SORT_OPTIONS}
+        self.sort_menu.configure(values=list(self._sort_choices))
+        self.sort_var.set(self.i18n.t(f"sort.{order}"))
+    
+    def _update_count_label(self):
+        """按当前语言显示列表项目数"""
+        if self.prompt_model is not None:
+            self.count_label.configure(text=self.i18n.t("list.count").format(len(self.prompt_model)))
+
+class TemplatePreview(ctk.CTkToplevel):
+    """模板预览窗口
+
+    定时读取编辑器正文, 变化时重新编译(引擎按正文哈希缓存编译结果)并为每个变量
+    生成输入框, 输入时重新渲染. 底部显示编译和渲染耗时.
+    """
+
+    def __init__(self, master, engine, get_content, poll_ms=300):
+        super().__init__(master)
+        self.i18n = master.i18n
+        self.title(self.i18n.t("preview.title"))
+        self.geometry("640x520")
+        self.engine = engine
+        self.get_content = get_content
+        self.poll_ms = poll_ms
+        self._content = None
+        self._compiled = None
+        self._compile_info = ""
+        self._entries = {}   # 变量名 -> 输入框
+        self._poll_id = None
+
+        self.vars_frame = ctk.CTkScrollableFrame(self, height=140, label_text=self.i18n.t("preview.variables"))
+        self.vars_frame.pack(fill=tk.X, padx=10, pady=(10, 5))
+        self.vars_frame.grid_columnconfigure(1, weight=1)
+
+        self.output = ctk.CTkTextbox(self, wrap="word", font=("Microsoft YaHei UI", 11))
+        self.output.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        bottom = ctk.CTkFrame(self, fg_color="transparent")
+        bottom.pack(fill=tk.X, padx=10, pady=(0, 10))
+        self.timing_label = ctk.CTkLabel(
+            bottom, text="", font=("Microsoft YaHei UI", 10), text_color="gray60"
+        )
+        self.timing_label.pack(side=tk.LEFT)
+        ctk.CTkButton(bottom, text=self.i18n.t("preview.copy"), width=80, command=self._copy).pack(side=tk.RIGHT)
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self._poll()
+
+    def _poll(self):
+        content = self.get_content()
+        if content != self._content:
+            self._content = content
+            self._recompile()
+        self._poll_id = self.after(self.poll_ms, self._poll)
+
+    def _recompile(self):
+        start = time.perf_counter()
+        compiled, cached = self.engine.compile(self._content)
+        ms = (time.perf_counter() - start) * 1000
+        if self._compiled is None or compiled.names != self._compiled.names:
+            self._build_inputs(compiled)
+        self._compiled = compiled
+        self._compile_info = self.i18n.t("preview.cached" if cached else "preview.compiled").format(
+            ms=f"{ms:.2f}")
+        self._render()
+
+    def _build_inputs(self, compiled):
+        # 变量变化时重建输入框, 保留同名变量已输入的值
+        values = {name: entry.get() for name, entry in self._entries.items()}
+        for child in self.vars_frame.winfo_children():
+            child.destroy()
+        self._entries = {}
+        for row, name in enumerate(compiled.names):
+            ctk.CTkLabel(self.vars_frame, text=name).grid(row=row, column=0, sticky="w", padx=5, pady=2)
+            entry = ctk.CTkEntry(self.vars_frame, placeholder_text=compiled.defaults.get(name, ""))
+            entry.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+            if values.get(name):
+                entry.insert(0, values[name])
+            entry.bind("<KeyRelease>", lambda e: self._render())
+            self._entries[name] = entry
+
+    def _render(self):
+        # 空输入框视为未提供, 使用默认值或保留占位符
+        variables = {name: entry.get() for name, entry in self._entries.items() if entry.get()}
+        start = time.perf_counter()
+        text = self._compiled.render(variables)
+        ms = (time.perf_counter() - start) * 1000
+        self.output.configure(state="normal")
+        self.output.delete("1.0", tk.END)
+        self.output.insert("1.0", text)
+        self.output.configure(state="disabled")
+        self.timing_label.configure(
+            text=self.i18n.t("preview.timing").format(
+                count=len(self._compiled.names), compile=self._compile_info, ms=f"{ms:.3f}")
+        )
+
+    def _copy(self):
+        self.clipboard_clear()
+        self.clipboard_append(self.output.get("1.0", "end-1c"))
+
+    def close(self):
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        self.destroy()
+
+class ProfilerPanel(ctk.CTkToplevel):
+    """性能剖析面板
+
+    每秒刷新一次按总耗时排序的直方图表格和最近的慢查询, 可以导出JSON或
+    Chrome trace(在 chrome://tracing 或 ui.perfetto.dev 中打开).
+    """
+
+    def __init__(self, master, on_enable=None, refresh_ms=1000):
+        super().__init__(master)
+        self.i18n = master.i18n
+        self.title(self.i18n.t("profiler.title"))
+        self.geometry("900x560")
+        self.on_enable = on_enable
+        self.refresh_ms = refresh_ms
+        self._refresh_id = None
+
+        self.output = ctk.CTkTextbox(self, wrap="none", font=("Consolas", 11))
+        self.output.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+
+        bottom = ctk.CTkFrame(self, fg_color="transparent")
+        bottom.pack(fill=tk.X, padx=10, pady=(0, 10))
+        self.toggle_button = ctk.CTkButton(bottom, text="", width=80, command=self._toggle)
+        self.toggle_button.pack(side=tk.LEFT)
+        ctk.CTkButton(bottom, text=self.i18n.t("profiler.reset"), width=80, command=self._reset).pack(side=tk.LEFT, padx=5)
+        ctk.CTkButton(bottom, text=self.i18n.t("profiler.export_trace"), width=100,
+                      command=lambda: self._export(PROFILER.export_chrome_trace, "trace.json")
+                      ).pack(side=tk.RIGHT)
+        ctk.CTkButton(bottom, text=self.i18n.t("profiler.export_json"), width=100,
+                      command=lambda: self._export(PROFILER.export_json, "profile.json")
+                      ).pack(side=tk.RIGHT, padx=5)
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self._refresh()
+
+    def _refresh(self):
+        self.toggle_button.configure(text=self.i18n.t("profiler.stop" if PROFILER.enabled else "profiler.start"))
+        if PROFILER.enabled:
+            text = PROFILER.report()
+        else:
+            text = self.i18n.t("profiler.disabled").format(self.i18n.t("profiler.start"))
+        self.output.configure(state="normal")
+        self.output.delete("1.0", tk.END)
+        self.output.insert("1.0", text)
+        self.output.configure(state="disabled")
+        self._refresh_id = self.after(self.refresh_ms, self._refresh)
+
+    def _toggle(self):
+        if PROFILER.enabled:
+            PROFILER.disable()
+        else:
+            PROFILER.enable()
+            if self.on_enable:
+                self.on_enable()
+
+    def _reset(self):
+        PROFILER.reset()
+
+    def _export(self, export, default_name):
+        path = filedialog.asksaveasfilename(
+            parent=self, initialfile=default_name, defaultextension=".json",
+            filetypes=[("JSON files", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            export(path)
+        except OSError as e:
+            messagebox.showerror(self.i18n.t("dialog.error"), self.i18n.t("dialog.export_failed").format(e),
+                                 parent=self)
+
+    def close(self):
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        self.destroy()
+
+class VirtualListbox(tk.Canvas):
+    """虚拟化列表
+
+    只为可见行创建画布元素并循环复用, 数据按需从列表模型的窗口读取,
+    因此刷新和滚动的Tk调用次数只与可见行数有关. 对外提供与tk.Listbox
+    相同的curselection/selection_clear/nearest/yview接口和<<ListboxSelect>>事件.
+    """
+
+    def __init__(self, master, formatter, font=("Microsoft YaHei UI", 11),
+                 background="#2A2A2A", foreground="white", hoverbackground="#404040",
+                 selectbackground="#2980B9", selectforeground="white",
+                 yscrollcommand=None, **kwargs):
+        super().__init__(master, background=background, highlightthickness=0, bd=0, **kwargs)
+        self.formatter = formatter  # item -> (显示文本, 文字颜色或None)
+        self.font = font
+        self.colors = {
+            "bg": background, "fg": foreground, "hover": hoverbackground,
+            "select_bg": selectbackground, "select_fg": selectforeground,
+        }
+        self.yscrollcommand = yscrollcommand
+        self.row_height = tkfont.Font(font=font).metrics("linespace") + 6
         
-        # 更新搜索框占位符
-        if hasattr(self, 'search_entry'):
-            self.search_entry.configure(
-                placeholder_text=self.i18n.t("search.placeholder")
-            )
+        self._model = None       # 列表模型, 数据库打开前为None
+        self._top = 0            # 第一可见行的索引
+        self._rows = []          # 复用的(背景矩形, 文本)画布元素
+        self._selected = None
+        self._hover = None
         
-        # 更新过滤器按钮
-        if hasattr(self, 'filter_buttons'):
-            for original_text, btn in self.filter_buttons.items():
-                translated_text = self.i18n.t(f"filter.{original_text}")
-                btn.configure(text=translated_text)
-        
-        # 更新列表标题
-        if hasattr(self, 'list_label'):
-            self.list_label.configure(text=self.i18n.t("list.title"))
-        
-        # 更新按钮文本
-        if hasattr(self, 'buttons'):
-            button_texts = {
-                "新建": "btn.new",
-                "保存": "btn.save",
-                "删除": "btn.delete",
-                "导入": "btn.import",
-                "导出": "btn.export"
-            }
-            for original_text, translation_key in button_texts.items():
-                if original_text in self.buttons:
-                    self.buttons[original_text].configure(
-                        text=self.i18n.t(translation_key)
-                    )
-        
-        # 更新计数文本
-        if hasattr(self, 'count_label'):
-            count = len(self.prompt_cache)
-            self.count_label.configure(
-                text=self.i18n.t("list.count").format(count)
-            )
+        self.bind("<Configure>", lambda e: self._redraw())
+        self.bind("<Button-1>", self._on_click)
+        self.bind("<Motion>", self._on_motion)
+        self.bind("<Leave>", self._on_leave)
+        self.bind("<MouseWheel>", self._on_wheel)
+        self.bind("<Button-4>", lambda e: self.yview("scroll", -3, "units"))
+        self.bind("<Button-5>", lambda e: self.yview("scroll", 3, "units"))
+        self.bind("<Up>", lambda e: self._move_selection(-1))
+        self.bind("<Down>", lambda e: self._move_selection(1))
+
+    def set_model(self, model):
+        """替换数据模型并回到顶部"""
+        self._model = model
+        self._top = 0
+        self._selected = None
+        self._hover = None
+        self._redraw()
+
+    def size(self) -> int:
+        return len(self._model) if self._model is not None else 0
+
+    def refresh(self):
+        """模型被就地修改后重绘(保持滚动位置和选中行)"""
+        if self._selected is not None and self._selected >= self.size():
+            self._selected = None
+        self._clamp_top()
+        self._redraw()
+
+    def curselection(self):
+        return (self._selected,) if self._selected is not None else ()
+
+    def selection_clear(self, first=0, last=None):
+        self._selected = None
+        self._redraw()
+
+    def selection_set(self, index: int):
+        self._selected = index
+        self.see(index)
+        self._redraw()
+
+    def selection_includes(self, index: int) -> bool:
+        return index == self._selected
+
+    def nearest(self, y: int) -> int:
+        return min(self._top + max(int(y), 0) // self.row_height, max(self.size() - 1, 0))
+
+    def see(self, index: int):
+        visible = self._page_size()
+        if index < self._top:
+            self._top = index
+        elif index >= self._top + visible:
+            self._top = index - visible + 1
+        self._clamp_top()
+
+    def yview(self, *args):
+        """滚动条协议: moveto / scroll units / scroll pages"""
+        total = self.size()
+        if not args:
+            if not total:
+                return 0.0, 1.0
+            return self._top / total, min((self._top + self._page_size()) / total, 1.0)
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = self._page_size() if args[2] == "pages" else 1
+            self._top += int(args[1]) * step
+        self._clamp_top()
+        self._redraw()
+
+    def _page_size(self) -> int:
+        return max(self.winfo_height() // self.row_height, 1)
 
-        # 触发重绘
-        self.update()
+    def _clamp_top(self):
+        self._top = max(0, min(self._top, self.size() - self._page_size()))
+
+    def _redraw(self):
+        """只刷新可见行"""
+        width = self.winfo_width()
+        visible = self._page_size() + 1
+        while len(self._rows) < visible:
+            rect = self.create_rectangle(0, 0, 0, 0, width=0)
+            text = self.create_text(8, 0, anchor="w", font=self.font)
+            self._rows.append((rect, text))
+        
+        items = self._model.window(self._top, self._top + visible) if self._model is not None else []
+        for i, (rect, text) in enumerate(self._rows):
+            if i >= len(items):
+                self.itemconfigure(rect, state="hidden")
+                self.itemconfigure(text, state="hidden")
+                continue
+            index = self._top + i
+            label, fg = self.formatter(items[i])
+            if index == self._selected:
+                bg, fg = self.colors["select_bg"], self.colors["select_fg"]
+            elif index == self._hover:
+                bg = self.colors["hover"]
+            else:
+                bg = self.colors["bg"]
+            y = i * self.row_height
+            self.coords(rect, 0, y, width, y + self.row_height)
+            self.itemconfigure(rect, fill=bg, state="normal")
+            self.coords(text, 8, y + self.row_height // 2)
+            self.itemconfigure(text, text=label, fill=fg or self.colors["fg"], state="normal")
+        
+        if self.yscrollcommand:
+            self.yscrollcommand(*self.yview())
+
+    def _on_click(self, event):
+        self.focus_set()
+        if not self.size():
+            return
+        self._selected = self.nearest(event.y)
+        self._redraw()
+        self.event_generate("<<ListboxSelect>>")
+
+    def _move_selection(self, delta: int):
+        if not self.size():
+            return
+        current = self._selected if self._selected is not None else -delta
+        self.selection_set(max(0, min(current + delta, self.size() - 1)))
+        self.event_generate("<<ListboxSelect>>")
+
+    def _on_motion(self, event):
+        """鼠标悬停效果"""
+        index = self.nearest(event.y) if self.size() else None
+        if index != self._hover:
+            self._hover = index
+            self._redraw()
+
+    def _on_leave(self, event):
+        """鼠标离开效果"""
+        if self._hover is not None:
+            self._hover = None
+            self._redraw()
+
+    def _on_wheel(self, event):
+        self.yview("scroll", -3 if event.delta > 0 else 3, "units")
 
 class PromptListFrame(ctk.CTkFrame):
     def __init__(self, *args, callback=None, **kwargs):
         super().__init__(*args, **kwargs)
         
         self.callback = callback
+        light = ctk.get_appearance_mode() == "light"
         
         # 创建滚动条
         scrollbar = tk.Scrollbar(self)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        self.listbox = tk.Listbox(
+        self.listbox = VirtualListbox(
             self,
-            selectmode=tk.SINGLE,
-            activestyle='none',
-            background=("#F0F0F0" if ctk.get_appearance_mode()=="light" else "#2A2A2A"),
-            foreground=("black" if ctk.get_appearance_mode()=="light" else "white"),
-            selectbackground=("#3498DB" if ctk.get_appearance_mode()=="light" else "#2980B9"),
+            formatter=self._format_item,
+            background=("#F0F0F0" if light else "#2A2A2A"),
+            foreground=("black" if light else "white"),
+            hoverbackground=("#E0E0E0" if light else "#404040"),
+            selectbackground=("#3498DB" if light else "#2980B9"),
             selectforeground="white",
-            highlightthickness=0,
-            bd=0,
             font=("Microsoft YaHei UI", 11),
-            relief=tk.FLAT,
             cursor="hand2",
             yscrollcommand=scrollbar.set
         )
@@ -585,46 +1431,27 @@ class PromptListFrame(ctk.CTkFrame):
         
         # 绑定事件
         self.listbox.bind('<<ListboxSelect>>', self._on_select)
-        self.listbox.bind('<Motion>', self._on_motion)
-        self.listbox.bind('<Leave>', self._on_leave)
         
-        # 保存状态
-        self._hover_item = None
+    def _format_item(self, prompt):
+        """列表行文本及颜色, 内置项目使用特殊颜色"""
+        icon = "📌" if prompt.is_builtin else "📝"
+        color = None
+        if prompt.is_builtin:
+            color = "#4CAF50" if ctk.get_appearance_mode() == "light" else "#81C784"
+        tokens = getattr(prompt, 'tokens', None)
+        suffix = "" if tokens is None else f"  · {tokens / 1000:.1f}k" if tokens >= 1000 else f"  · {tokens}"
+        return f" {icon} {prompt.title}{suffix}", color
         
     def _on_select(self, event):
         """处理选择事件"""
         if self.callback:
             self.callback(event)
-    
-    def _on_motion(self, event):
-        """鼠标悬停效果"""
-        index = self.listbox.nearest(event.y)
-        if index != self._hover_item:
-            # 恢复之前的悬停项
-            if self._hover_item is not None:
-                self._restore_item_color(self._hover_item)
-            
-            # 设置新的悬停项
-            if not self.listbox.selection_includes(index):
-                self.listbox.itemconfig(
-                    index,
-                    bg="#404040" if ctk.get_appearance_mode()=="dark" else "#E0E0E0"
-                )
-            self._hover_item = index
-    
-    def _on_leave(self, event):
-        """鼠标离开效果"""
-        if self._hover_item is not None:
-            self._restore_item_color(self._hover_item)
-            self._hover_item = None
-    
-    def _restore_item_color(self, index):
-        """恢复项目原始颜色"""
-        if not self.listbox.selection_includes(index):
-            self.listbox.itemconfig(
-                index,
-                bg=self.listbox.cget("background")
-            )
+
+# 启用剖析时为界面刷新路径计时
+PROFILER.register(PromptManager, ['load_prompts', '_update_prompt_list', 'on_select_prompt',
+                                  '_on_search_results', 'save_prompt', 'delete_prompt',
+                                  '_on_write_done', '_update_stats_label'], category='ui')
+PROFILER.register(VirtualListbox, ['set_model', 'refresh', '_redraw'], category='tk')
 
 if __name__ == "__main__":
     app = PromptManager()
@@ -0,0 +1,638 @@
+import os
+import sqlite3
+import time
+import types
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from connection import ConnectionManager
+
+
+@dataclass
+class MigrationContext:
+    chunk_size: int = 5000      # 大表分批迁移时每批处理的行数
+
+
+@dataclass
+class Migration:
+    """一个数据库版本迁移
+
+    apply(conn, ctx) 可以是普通函数(在一个事务中完成), 也可以是生成器:
+    每次yield都会提交当前事务并短暂释放写锁, 让应用的其他写操作插队,
+    适合大表分批处理. 迁移必须是幂等的, 中途退出后重新执行不会出错.
+    """
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection, MigrationContext], object]
+
+
+@dataclass
+class MigrationReport:
+    version: int
+    name: str
+    seconds: float
+    chunks: int       # 提交的事务数
+    rows: int         # 分批步骤报告的处理行数
+
+
+FTS_TRIGGERS = (
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts BEGIN
+        INSERT INTO prompts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE OF title, content ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO prompts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+)
+
+
+# 正文可能压缩存放在content_z中, 全文索引通过prompt_text()读取原文(见compression.py);
+# 第13版起换成PLAIN_TRIGGERS和应用的临时触发器
+FTS_TEXT_TRIGGERS = (
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts BEGIN
+        INSERT INTO prompts_fts(rowid, title, content)
+        VALUES (new.id, new.title, prompt_text(new.content, new.content_z));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, prompt_text(old.content, old.content_z));
+    END''',
+    # 只改变存储方式(压缩/解压)时原文不变, 不需要更新索引
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE OF title, content, content_z ON prompts
+    WHEN old.title IS NOT new.title
+      OR prompt_text(old.content, old.content_z) IS NOT prompt_text(new.content, new.content_z)
+    BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, prompt_text(old.content, old.content_z));
+        INSERT INTO prompts_fts(rowid, title, content)
+        VALUES (new.id, new.title, prompt_text(new.content, new.content_z));
+    END''',
+)
+
+
+# 从第13版起, 保存在数据库中的触发器只处理未压缩的行, 只使用普通列, 任何SQLite客户端
+# (sqlite3命令行、备份/修复脚本)都可以修改prompts; 涉及压缩行的部分需要解压,
+# 由应用在自己的写连接上建立的临时触发器处理(TEMP_TRIGGERS, 不保存在数据库中)
+PLAIN_TRIGGERS = (
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts
+    WHEN new.content_z IS NULL
+    BEGIN
+        INSERT INTO prompts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts
+    WHEN old.content_z IS NULL
+    BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE OF title, content, content_z ON prompts
+    WHEN old.content_z IS NULL AND new.content_z IS NULL
+      AND (old.title IS NOT new.title OR old.content IS NOT new.content)
+    BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO prompts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+)
+PLAIN_HASH_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS prompts_content_hash_au AFTER UPDATE OF content, content_z ON prompts
+    WHEN new.content_hash IS old.content_hash
+         AND old.content_z IS NULL AND new.content_z IS NULL AND old.content IS NOT new.content
+    BEGIN
+        UPDATE prompts SET content_hash = NULL WHERE id = new.id;
+    END
+'''
+# 新旧行中有一个压缩存放时的对应部分; 只改变存储方式(压缩/解压)时原文不变, 什么也不做
+TEMP_FTS_TRIGGERS = (
+    '''CREATE TEMP TRIGGER IF NOT EXISTS prompts_fts_ai_z AFTER INSERT ON prompts
+    WHEN new.content_z IS NOT NULL
+    BEGIN
+        INSERT INTO prompts_fts(rowid, title, content)
+        VALUES (new.id, new.title, prompt_text(new.content, new.content_z));
+    END''',
+    '''CREATE TEMP TRIGGER IF NOT EXISTS prompts_fts_ad_z AFTER DELETE ON prompts
+    WHEN old.content_z IS NOT NULL
+    BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, prompt_text(old.content, old.content_z));
+    END''',
+    '''CREATE TEMP TRIGGER IF NOT EXISTS prompts_fts_au_z AFTER UPDATE OF title, content, content_z ON prompts
+    WHEN (old.content_z IS NOT NULL OR new.content_z IS NOT NULL)
+      AND (old.title IS NOT new.title
+           OR prompt_text(old.content, old.content_z) IS NOT prompt_text(new.content, new.content_z))
+    BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, prompt_text(old.content, old.content_z));
+        INSERT INTO prompts_fts(rowid, title, content)
+        VALUES (new.id, new.title, prompt_text(new.content, new.content_z));
+    END''',
+)
+TEMP_HASH_TRIGGER = '''
+    CREATE TEMP TRIGGER IF NOT EXISTS prompts_content_hash_au_z AFTER UPDATE OF content, content_z ON prompts
+    WHEN new.content_hash IS old.content_hash
+         AND (old.content_z IS NOT NULL OR new.content_z IS NOT NULL)
+         AND prompt_text(old.content, old.content_z) IS NOT prompt_text(new.content, new.content_z)
+    BEGIN
+        UPDATE prompts SET content_hash = NULL WHERE id = new.id;
+    END
+'''
+
+
+def install_temp_triggers(conn: sqlite3.Connection):
+    """在应用的写连接上建立处理压缩行的临时触发器(需要已迁移到第13版)"""
+    if table_exists(conn, 'prompts_fts'):
+        for trigger in TEMP_FTS_TRIGGERS:
+            conn.execute(trigger)
+    conn.execute(TEMP_HASH_TRIGGER)
+
+
+def table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+
+def _create_base_tables(conn, ctx):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prompts (
+            id INTEGER PRIMARY KEY,
+            uuid TEXT UNIQUE NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            category TEXT NOT NULL,
+            is_builtin BOOLEAN NOT NULL
+        )
+    ''')
+    # 键值元数据, 例如内置prompts的同步清单
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+
+def _create_filter_indexes(conn, ctx):
+    # 过滤器计数/分页和按分类统计可以只扫描索引
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prompts_builtin ON prompts(is_builtin)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prompts_category ON prompts(category, is_builtin)')
+
+
+def _create_fts_index(conn, ctx):
+    """FTS5全文索引及同步触发器; SQLite不支持FTS5/trigram时跳过, 搜索退回LIKE"""
+    exists = table_exists(conn, 'prompts_fts')
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+                title, content,
+                content='prompts', content_rowid='id',
+                tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 not available, falling back to LIKE search: {e}")
+        return
+    for trigger in FTS_TRIGGERS:
+        conn.execute(trigger)
+    # 触发器与重建在同一事务中完成, 避免分批期间的写入使索引与表不一致
+    if not exists:
+        conn.execute("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+
+
+def _add_content_length(conn, ctx):
+    """列表摘要使用的content_length列, 分批回填已有数据"""
+    if not column_exists(conn, 'prompts', 'content_length'):
+        conn.execute('ALTER TABLE prompts ADD COLUMN content_length INTEGER')
+    yield 0
+    while True:
+        cursor = conn.execute('''
+            UPDATE prompts SET content_length = length(content)
+            WHERE id IN (SELECT id FROM prompts WHERE content_length IS NULL LIMIT ?)
+        ''', (ctx.chunk_size,))
+        if cursor.rowcount <= 0:
+            break
+        yield cursor.rowcount
+
+
+def _create_revisions(conn, ctx):
+    """修订历史: blobs按内容哈希存放全文或反向差异, revisions记录每个prompt的修订"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            base TEXT,              -- NULL表示data是压缩全文, 否则是相对base的差异
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS revisions (
+            id INTEGER PRIMARY KEY,
+            prompt_uuid TEXT NOT NULL,
+            title TEXT NOT NULL,
+            category TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_revisions_prompt ON revisions(prompt_uuid, id)')
+
+
+def _add_content_compression(conn, ctx):
+    """content_z列和压缩字典表; 全文索引改为从解压视图prompts_text读取原文"""
+    if not column_exists(conn, 'prompts', 'content_z'):
+        conn.execute('ALTER TABLE prompts ADD COLUMN content_z BLOB')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS compression_dicts (
+            id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS prompts_text AS
+        SELECT id, title, prompt_text(content, content_z) AS content FROM prompts
+    ''')
+    if not table_exists(conn, 'prompts_fts'):
+        return  # 不支持FTS5, 搜索使用LIKE
+    for name in ('prompts_fts_ai', 'prompts_fts_ad', 'prompts_fts_au'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    conn.execute('DROP TABLE prompts_fts')
+    conn.execute('''
+        CREATE VIRTUAL TABLE prompts_fts USING fts5(
+            title, content,
+            content='prompts_text', content_rowid='id',
+            tokenize='trigram'
+        )
+    ''')
+    for trigger in FTS_TEXT_TRIGGERS:
+        conn.execute(trigger)
+    conn.execute("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+
+
+def _create_minhash_index(conn, ctx):
+    """近似重复检测的MinHash签名和LSH分桶(见dedup.py)
+
+    新增或正文变化的prompt由触发器记入minhash_pending, 之后只为这些prompt重算签名.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS minhash_signatures (
+            prompt_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS minhash_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            prompt_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, prompt_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_minhash_buckets_prompt ON minhash_buckets(prompt_id)')
+    conn.execute('CREATE TABLE IF NOT EXISTS minhash_pending (prompt_id INTEGER PRIMARY KEY)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_minhash_ai AFTER INSERT ON prompts BEGIN
+            INSERT OR IGNORE INTO minhash_pending (prompt_id) VALUES (new.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_minhash_au AFTER UPDATE OF content, content_z ON prompts
+        WHEN old.content IS NOT new.content OR old.content_z IS NOT new.content_z
+        BEGIN
+            DELETE FROM minhash_signatures WHERE prompt_id = old.id;
+            DELETE FROM minhash_buckets WHERE prompt_id = old.id;
+            INSERT OR IGNORE INTO minhash_pending (prompt_id) VALUES (old.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_minhash_ad AFTER DELETE ON prompts BEGIN
+            DELETE FROM minhash_signatures WHERE prompt_id = old.id;
+            DELETE FROM minhash_buckets WHERE prompt_id = old.id;
+            DELETE FROM minhash_pending WHERE prompt_id = old.id;
+        END
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO minhash_pending (prompt_id)
+        SELECT id FROM prompts WHERE id NOT IN (SELECT prompt_id FROM minhash_signatures)
+    ''')
+
+
+def _create_vector_queue(conn, ctx):
+    """语义索引(见semantic.py)的待处理队列
+
+    向量本身保存在数据库旁的NumPy文件中; 新增、标题或正文变化、删除的prompt由触发器
+    记入vector_pending. token每次变化都重新生成, 处理完一批后只删除token未变的行,
+    处理期间又被修改的prompt会留在队列中.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vector_pending (
+            prompt_id INTEGER PRIMARY KEY,
+            token INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_vector_ai AFTER INSERT ON prompts BEGIN
+            INSERT OR REPLACE INTO vector_pending (prompt_id, token) VALUES (new.id, random());
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_vector_au AFTER UPDATE OF title, content, content_z ON prompts
+        WHEN old.title IS NOT new.title OR old.content IS NOT new.content
+             OR old.content_z IS NOT new.content_z
+        BEGIN
+            INSERT OR REPLACE INTO vector_pending (prompt_id, token) VALUES (old.id, random());
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_vector_ad AFTER DELETE ON prompts BEGIN
+            INSERT OR REPLACE INTO vector_pending (prompt_id, token) VALUES (old.id, random());
+        END
+    ''')
+
+
+def _create_text_stats(conn, ctx):
+    """正文统计缓存(见textstats.py), 按正文sha1存放, prompts.content_hash指向它
+
+    content_hash由程序写入时计算; 其他途径改了正文而没有更新哈希时由触发器清空,
+    之后由回填任务重新计算, 不会指向旧正文的统计.
+    """
+    if not column_exists(conn, 'prompts', 'content_hash'):
+        conn.execute('ALTER TABLE prompts ADD COLUMN content_hash TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prompts_content_hash ON prompts(content_hash)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS text_stats (
+            content_hash TEXT PRIMARY KEY,
+            chars INTEGER NOT NULL,
+            words INTEGER NOT NULL,
+            lines INTEGER NOT NULL,
+            tokens INTEGER NOT NULL,
+            token_counts TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_text_stats_tokens ON text_stats(tokens)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_content_hash_au AFTER UPDATE OF content, content_z ON prompts
+        WHEN new.content_hash IS old.content_hash
+             AND prompt_text(old.content, old.content_z) IS NOT prompt_text(new.content, new.content_z)
+        BEGIN
+            UPDATE prompts SET content_hash = NULL WHERE id = new.id;
+        END
+    ''')
+
+
+def _create_import_checkpoints(conn, ctx):
+    """流水线导入(见importer.py)已完成单元的检查点, 与该单元的记录在同一事务中写入"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            unit TEXT PRIMARY KEY,
+            records INTEGER NOT NULL,
+            finished_at REAL NOT NULL
+        )
+    ''')
+
+
+def _create_facets(conn, ctx):
+    """分类计数、标签和prompt-标签关联表(见db.PromptFilter)
+
+    categories按分类保存prompt总数和内置prompt数, tags.prompt_count保存每个标签
+    的prompt数, 都由触发器在写入prompts/prompt_tags的同一事务中增量维护,
+    侧边栏和过滤器的计数不需要扫描prompts. 计数归零的分类和标签随之删除.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            name TEXT PRIMARY KEY,
+            prompt_count INTEGER NOT NULL DEFAULT 0,
+            builtin_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            prompt_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prompt_tags (
+            prompt_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (prompt_id, tag_id)
+        ) WITHOUT ROWID
+    ''')
+    # 按标签找prompt; 按prompt找标签使用主键
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prompt_tags_tag ON prompt_tags(tag_id, prompt_id)')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_categories_ai AFTER INSERT ON prompts BEGIN
+            INSERT OR IGNORE INTO categories (name) VALUES (new.category);
+            UPDATE categories SET prompt_count = prompt_count + 1,
+                                  builtin_count = builtin_count + (new.is_builtin != 0)
+            WHERE name = new.category;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_categories_au AFTER UPDATE OF category, is_builtin ON prompts
+        WHEN old.category IS NOT new.category OR old.is_builtin IS NOT new.is_builtin
+        BEGIN
+            UPDATE categories SET prompt_count = prompt_count - 1,
+                                  builtin_count = builtin_count - (old.is_builtin != 0)
+            WHERE name = old.category;
+            DELETE FROM categories WHERE name = old.category AND prompt_count <= 0;
+            INSERT OR IGNORE INTO categories (name) VALUES (new.category);
+            UPDATE categories SET prompt_count = prompt_count + 1,
+                                  builtin_count = builtin_count + (new.is_builtin != 0)
+            WHERE name = new.category;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompts_categories_ad AFTER DELETE ON prompts BEGIN
+            UPDATE categories SET prompt_count = prompt_count - 1,
+                                  builtin_count = builtin_count - (old.is_builtin != 0)
+            WHERE name = old.category;
+            DELETE FROM categories WHERE name = old.category AND prompt_count <= 0;
+            DELETE FROM prompt_tags WHERE prompt_id = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompt_tags_ai AFTER INSERT ON prompt_tags BEGIN
+            UPDATE tags SET prompt_count = prompt_count + 1 WHERE id = new.tag_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS prompt_tags_ad AFTER DELETE ON prompt_tags BEGIN
+            UPDATE tags SET prompt_count = prompt_count - 1 WHERE id = old.tag_id;
+            DELETE FROM tags WHERE id = old.tag_id AND prompt_count <= 0;
+        END
+    ''')
+    # 现有prompt的分类计数
+    conn.execute('DELETE FROM categories')
+    conn.execute('''
+        INSERT INTO categories (name, prompt_count, builtin_count)
+        SELECT category, COUNT(*), SUM(is_builtin != 0) FROM prompts GROUP BY category
+    ''')
+
+
+def _create_title_index(conn, ctx):
+    """按标题的键集分页(db.Database.page_summaries): 索引按(title, rowid)排序, 第一页不需要排序全表"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_prompts_title ON prompts(title)')
+
+
+def _plain_triggers(conn, ctx):
+    """把保存在数据库中的触发器换成不调用prompt_text()的版本(PLAIN_TRIGGERS)
+
+    之前的全文索引和content_hash触发器都调用应用注册的SQL函数prompt_text(),
+    其他SQLite客户端每次修改prompts都会失败("no such function").
+    限制: 其他客户端修改或删除压缩存放的行时全文索引不会更新(它们也无法写入压缩数据);
+    需要时在应用中执行 INSERT INTO prompts_fts(prompts_fts) VALUES('rebuild') 重建.
+    """
+    for name in ('prompts_fts_ai', 'prompts_fts_ad', 'prompts_fts_au', 'prompts_content_hash_au'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    if table_exists(conn, 'prompts_fts'):
+        for trigger in PLAIN_TRIGGERS:
+            conn.execute(trigger)
+    conn.execute(PLAIN_HASH_TRIGGER)
+
+
+# 按版本号排列; 新迁移只能追加到末尾
+MIGRATIONS = [
+    Migration(1, 'create base tables', _create_base_tables),
+    Migration(2, 'filter indexes', _create_filter_indexes),
+    Migration(3, 'fts5 trigram index', _create_fts_index),
+    Migration(4, 'content_length column', _add_content_length),
+    Migration(5, 'revision history', _create_revisions),
+    Migration(6, 'content compression', _add_content_compression),
+    Migration(7, 'minhash near-duplicate index', _create_minhash_index),
+    Migration(8, 'semantic vector queue', _create_vector_queue),
+    Migration(9, 'text stats cache', _create_text_stats),
+    Migration(10, 'import checkpoints', _create_import_checkpoints),
+    Migration(11, 'categories and tags', _create_facets),
+    Migration(12, 'title index', _create_title_index),
+    Migration(13, 'triggers without app functions', _plain_triggers),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+class MigrationRunner:
+    """用 PRAGMA user_version 记录版本, 按顺序执行未应用的迁移"""
+
+    def __init__(self, connections: ConnectionManager, migrations: List[Migration] = MIGRATIONS,
+                 chunk_size: int = 5000):
+        self.connections = connections
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self.ctx = MigrationContext(chunk_size=chunk_size)
+
+    def current_version(self) -> int:
+        if self.connections.readonly:
+            # 只读实例(例如--dry-run)不打开写连接, 不设置WAL等写连接PRAGMA
+            return self.connections.reader().execute('PRAGMA user_version').fetchone()[0]
+        with self.connections.write_lock:
+            return self.connections.writer.execute('PRAGMA user_version').fetchone()[0]
+
+    def pending(self) -> List[Migration]:
+        version = self.current_version()
+        return [m for m in self.migrations if m.version > version]
+
+    def run(self, progress: Optional[Callable[[Migration, int], None]] = None) -> List[MigrationReport]:
+        """执行所有未应用的迁移; progress(migration, 已处理行数)在每批提交后调用"""
+        reports = []
+        for migration in self.pending():
+            reports.append(self._apply(migration, progress))
+        return reports
+
+    def _apply(self, migration: Migration, progress) -> MigrationReport:
+        start = time.perf_counter()
+        chunks = rows = 0
+        steps = None
+        while True:
+            # 每批一个事务, 批之间释放写锁
+            with self.connections.write() as conn:
+                conn.execute('BEGIN')
+                if steps is None:
+                    steps = migration.apply(conn, self.ctx)
+                finished = True
+                if isinstance(steps, types.GeneratorType):
+                    try:
+                        rows += next(steps) or 0
+                        finished = False
+                    except StopIteration:
+                        pass
+                if finished:
+                    conn.execute(f'PRAGMA user_version = {migration.version}')
+            chunks += 1
+            if progress:
+                progress(migration, rows)
+            if finished:
+                break
+        return MigrationReport(migration.version, migration.name,
+                               time.perf_counter() - start, chunks, rows)
+
+
+def benchmark(db_path: str, chunk_size: int = 5000) -> List[MigrationReport]:
+    """演练模式: 在数据库副本上执行未应用的迁移并报告每个迁移的耗时, 原数据库不变"""
+    import tempfile
+
+    fd, copy_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(copy_path)
+        with target:
+            source.backup(target)
+        source.close()
+        target.close()
+        connections = ConnectionManager(copy_path)
+        try:
+            return MigrationRunner(connections, chunk_size=chunk_size).run()
+        finally:
+            connections.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(copy_path + suffix):
+                os.remove(copy_path + suffix)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="prompts.db schema migrations")
+    parser.add_argument('db_path', nargs='?',
+                        default=os.path.join(os.path.dirname(__file__), 'prompts.db'))
+    parser.add_argument('--benchmark', action='store_true',
+                        help="在副本上执行未应用的迁移并报告耗时, 不修改数据库")
+    parser.add_argument('--dry-run', action='store_true', help="只列出未应用的迁移")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        # 只读打开, 不修改数据库文件; 文件不存在时所有迁移都未应用(也不创建文件)
+        if os.path.exists(args.db_path):
+            connections = ConnectionManager(args.db_path, readonly=True)
+            pending = MigrationRunner(connections).pending()
+            connections.close()
+        else:
+            pending = MIGRATIONS
+        for m in pending:
+            print(f"pending: v{m.version} {m.name}")
+        return
+    if args.benchmark:
+        reports = benchmark(args.db_path, args.chunk_size)
+    else:
+        connections = ConnectionManager(args.db_path)
+        runner = MigrationRunner(connections, chunk_size=args.chunk_size)
+        print(f"current version: {runner.current_version()}, latest: {SCHEMA_VERSION}")
+        reports = runner.run()
+        connections.close()
+    for r in reports:
+        print(f"v{r.version} {r.name}: {r.seconds * 1000:.1f} ms, {r.chunks} chunks, {r.rows} rows")
+    if not reports:
+        print("no pending migrations")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""可选的性能剖析: Database方法和界面刷新的耗时直方图, 慢SQL的查询计划
+
+默认关闭, 关闭时没有任何开销: 不替换任何方法, 连接也是普通的sqlite3.Connection.
+设置环境变量 PROMPT_PROFILE=1(或在创建Database之前调用 PROFILER.enable())后:
+
+- register(cls, names) 登记的类方法被替换为计时包装, disable() 时恢复原方法;
+- 之后新建的SQLite连接使用 ProfiledConnection, 每条 execute/executemany 计时,
+  超过 slow_ms 的语句用 EXPLAIN QUERY PLAN 记录查询计划;
+- 每次调用同时记为一个trace事件(环形缓冲), export_chrome_trace() 写出
+  chrome://tracing 和 Perfetto 可以打开的JSON, export_json() 写出直方图和慢查询.
+
+    PROMPT_PROFILE=1 PROMPT_PROFILE_SLOW_MS=20 python main.py
+    python cli.py --trace trace.json search "code review"
+"""
+import functools
+import inspect
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence
+
+SLOW_MS = 50.0           # 超过这个耗时的SQL记录查询计划
+MAX_EVENTS = 200000      # trace环形缓冲的事件数, 约占几十MB
+MAX_SLOW_QUERIES = 200
+BUCKETS_PER_OCTAVE = 4   # 直方图每翻一倍分4个桶, 相对误差约19%
+MAX_BUCKET = 40 * BUCKETS_PER_OCTAVE   # 2^40微秒, 远超任何实际耗时
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class Histogram:
+    """对数分桶的耗时直方图(微秒), 记录一次只需要常数时间和常数内存"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_us = 0.0
+        self.min_us = math.inf
+        self.max_us = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, us: float):
+        self.count += 1
+        self.total_us += us
+        self.min_us = min(self.min_us, us)
+        self.max_us = max(self.max_us, us)
+        index = 0 if us < 1 else min(int(math.log2(us) * BUCKETS_PER_OCTAVE), MAX_BUCKET)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, q: float) -> float:
+        """第q百分位(0-100)所在桶的上界, 不超过实际最大值"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** ((index + 1) / BUCKETS_PER_OCTAVE), self.max_us)
+        return self.max_us
+
+    @property
+    def mean_us(self) -> float:
+        return self.total_us / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_us / 1000, 3),
+            'mean_ms': round(self.mean_us / 1000, 3),
+            'min_ms': round(self.min_us / 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50) / 1000, 3),
+            'p90_ms': round(self.percentile(90) / 1000, 3),
+            'p99_ms': round(self.percentile(99) / 1000, 3),
+            'max_ms': round(self.max_us / 1000, 3),
+            # 桶下界(微秒) -> 次数
+            'buckets': {f'{2 ** (i / BUCKETS_PER_OCTAVE):.0f}': n for i, n in sorted(self.buckets.items())},
+        }
+
+
+@dataclass
+class SlowQuery:
+    sql: str
+    params: str
+    ms: float
+    plan: List[str]
+    thread: str
+    at: float          # time.time()
+    start_us: float    # 相对 Profiler.origin, 与trace事件的时间轴一致
+
+
+class Profiler:
+    """收集耗时直方图、trace事件和慢查询; 进程内只使用模块级的 PROFILER"""
+
+    def __init__(self, enabled: bool = False, slow_ms: float = SLOW_MS):
+        self.enabled = False
+        self.slow_ms = slow_ms
+        self.histograms: Dict[str, Histogram] = {}
+        self.events = deque(maxlen=MAX_EVENTS)   # (name, category, start_us, dur_us, thread_id)
+        self.slow_queries = deque(maxlen=MAX_SLOW_QUERIES)
+        self.origin = time.perf_counter()
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._targets = []     # (cls, names, category)
+        self._patched = []     # (cls, name, 原方法)
+        if enabled:
+            self.enable()
+
+    # ---- 开关 ----
+    def enable(self, slow_ms: Optional[float] = None):
+        """开始记录; 已经打开的连接不受影响, 之后新建的连接才记录SQL"""
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if self.enabled:
+            return
+        self.enabled = True
+        for cls, names, category in self._targets:
+            self._patch(cls, names, category)
+
+    def disable(self):
+        """恢复所有被替换的方法"""
+        self.enabled = False
+        for cls, name, original in reversed(self._patched):
+            setattr(cls, name, original)
+        self._patched.clear()
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.events.clear()
+            self.slow_queries.clear()
+            self.origin = time.perf_counter()
+
+    # ---- 方法计时 ----
+    def register(self, cls, names: Optional[Sequence[str]] = None, category: str = 'app'):
+        """登记需要计时的方法, 省略names时为类中定义的全部公开方法; 启用时才替换"""
+        self._targets.append((cls, names, category))
+        if self.enabled:
+            self._patch(cls, names, category)
+        return cls
+
+    def _patch(self, cls, names, category):
+        if names is None:
+            names = [name for name, value in vars(cls).items()
+                     if not name.startswith('_') and inspect.isfunction(value)]
+        for name in names:
+            original = vars(cls).get(name)
+            # 生成器只能计到创建为止, 没有意义; 属性和静态方法不处理
+            if not inspect.isfunction(original) or inspect.isgeneratorfunction(original):
+                continue
+            setattr(cls, name, self._timed(f'{cls.__name__}.{name}', category, original))
+            self._patched.append((cls, name, original))
+
+    def _timed(self, label: str, category: str, func):
+        record = self.record
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, category, start, time.perf_counter())
+        return wrapper
+
+    def record(self, name: str, category: str, start: float, end: float):
+        """记录一次耗时, start/end 为 time.perf_counter() 的值"""
+        us = (end - start) * 1e6
+        thread_id = threading.get_ident()
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(us)
+            if thread_id not in self._threads:
+                self._threads[thread_id] = threading.current_thread().name
+        self.events.append((name, category, (start - self.origin) * 1e6, us, thread_id))
+
+    # ---- SQL ----
+    def record_query(self, conn: sqlite3.Connection, sql: str, params, start: float, end: float):
+        self.record(f'sql: {statement_label(sql)}', 'sql', start, end)
+        ms = (end - start) * 1000
+        if ms >= self.slow_ms:
+            self.slow_queries.append(SlowQuery(
+                sql=_WHITESPACE_RE.sub(' ', sql).strip(),
+                params=_short_repr(params),
+                ms=round(ms, 3),
+                plan=explain(conn, sql, params),
+                thread=threading.current_thread().name,
+                at=time.time(),
+                start_us=round((start - self.origin) * 1e6, 1),
+            ))
+
+    # ---- 导出 ----
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {name: h.to_dict() for name, h in self.histograms.items()}
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'histograms': histograms,
+            'slow_queries': [asdict(q) for q in list(self.slow_queries)],
+        }
+
+    def report(self, limit: int = 30) -> str:
+        """按总耗时排序的文本表格, 用于调试面板和命令行"""
+        with self._lock:
+            rows = sorted(self.histograms.items(), key=lambda item: item[1].total_us, reverse=True)[:limit]
+        lines = [f"{'name':<60} {'count':>7} {'total':>9} {'mean':>8} {'p50':>8} {'p99':>8} {'max':>8}"]
+        for name, h in rows:
+            lines.append(f"{name[:60]:<60} {h.count:>7} {h.total_us / 1000:>8.1f}ms "
+                         f"{h.mean_us / 1000:>7.2f} {h.percentile(50) / 1000:>8.2f} "
+                         f"{h.percentile(99) / 1000:>8.2f} {h.max_us / 1000:>8.2f}")
+        slow = list(self.slow_queries)
+        if slow:
+            lines.append('')
+            lines.append(f"慢查询 (≥{self.slow_ms:g}ms, 最近{len(slow)}条):")
+            for q in slow[-10:]:
+                lines.append(f"  {q.ms:8.1f}ms  {q.sql[:100]}")
+                lines.extend(f"      {step}" for step in q.plan)
+        return '\n'.join(lines)
+
+    def export_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def export_chrome_trace(self, path: str):
+        """Chrome Trace Event格式(完整事件'X'), 时间单位为微秒"""
+        pid = os.getpid()
+        with self._lock:
+            threads = dict(self._threads)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        trace.extend({'name': name, 'cat': category, 'ph': 'X', 'ts': round(ts, 1),
+                      'dur': round(dur, 1), 'pid': pid, 'tid': tid}
+                     for name, category, ts, dur, tid in list(self.events))
+        trace.extend({'name': 'slow query', 'cat': 'sql', 'ph': 'i', 's': 'p', 'pid': pid, 'tid': 0,
+                      'ts': q.start_us, 'args': {'sql': q.sql, 'ms': q.ms, 'plan': q.plan}}
+                     for q in list(self.slow_queries))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """为 execute/executemany 计时的连接; 只有启用剖析时才会被创建"""
+
+    def execute(self, sql, parameters=(), /):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            PROFILER.record_query(self, sql, parameters, start, time.perf_counter())
+
+    def executemany(self, sql, seq_of_parameters, /):
+        seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            PROFILER.record_query(self, sql, seq_of_parameters[0] if seq_of_parameters else (),
+                                  start, time.perf_counter())
+
+
+def connection_factory():
+    """sqlite3.connect 的factory参数: 未启用时是普通连接"""
+    return ProfiledConnection if PROFILER.enabled else sqlite3.Connection
+
+
+def statement_label(sql: str, width: int = 80) -> str:
+    """直方图名称: 压缩空白后截断的语句"""
+    label = _WHITESPACE_RE.sub(' ', sql).strip()
+    return label if len(label) <= width else label[:width - 1] + '…'
+
+
+def explain(conn: sqlite3.Connection, sql: str, params) -> List[str]:
+    """EXPLAIN QUERY PLAN 的各步骤; 语句不能解释(例如PRAGMA)时返回空列表"""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+        return []
+    try:
+        rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    except sqlite3.Error as e:
+        return [f'(explain failed: {e})']
+    return [row[-1] for row in rows]
+
+
+def _short_repr(params, width: int = 200) -> str:
+    text = repr(params)
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+
+PROFILER = Profiler(enabled=os.environ.get('PROMPT_PROFILE', '') not in ('', '0'),
+                    slow_ms=float(os.environ.get('PROMPT_PROFILE_SLOW_MS', SLOW_MS)))
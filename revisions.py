@@ -0,0 +1,149 @@
+"""Prompt正文的修订历史
+
+正文按sha1内容寻址存放在blobs表, 相同正文只存一份. 每个prompt最新的修订
+以zlib压缩的全文保存, 较旧的修订保存为相对下一修订的反向差异(按行), 因此
+反复编辑一个大prompt时增长的只是差异的大小. 每隔 KEYFRAME_INTERVAL 个修订
+保留一个全文关键帧, 恢复任意修订最多只需应用这么多个差异.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+KEYFRAME_INTERVAL = 32
+COMPRESS_LEVEL = 6
+
+
+@dataclass
+class Revision:
+    id: int
+    prompt_uuid: str
+    title: str
+    category: str
+    content_hash: str
+    size: int             # 正文字符数
+    created_at: float
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def make_delta(source: str, target: str) -> bytes:
+    """target相对source的按行差异: 复制source的[起,止)行或插入新文本"""
+    from difflib import SequenceMatcher   # 只有保存修订时才需要, 不拖慢启动
+    a = source.splitlines(True)
+    b = target.splitlines(True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j1 < j2:
+            ops.append(''.join(b[j1:j2]))
+    return zlib.compress(json.dumps(ops, ensure_ascii=False).encode('utf-8'), COMPRESS_LEVEL)
+
+
+def apply_delta(source: str, delta: bytes) -> str:
+    lines = source.splitlines(True)
+    return ''.join(op if isinstance(op, str) else ''.join(lines[op[0]:op[1]])
+                   for op in json.loads(zlib.decompress(delta)))
+
+
+def store_full(conn: sqlite3.Connection, digest: str, content: str):
+    data = zlib.compress(content.encode('utf-8'), COMPRESS_LEVEL)
+    conn.execute('''
+        INSERT INTO blobs (hash, base, data, size) VALUES (?, NULL, ?, ?)
+        ON CONFLICT(hash) DO UPDATE SET base = NULL, data = excluded.data
+    ''', (digest, data, len(content)))
+
+
+def load_content(conn: sqlite3.Connection, digest: str) -> Optional[str]:
+    """沿差异链找到全文, 再按相反顺序应用差异"""
+    deltas = []
+    while True:
+        row = conn.execute('SELECT base, data FROM blobs WHERE hash = ?', (digest,)).fetchone()
+        if row is None:
+            return None
+        base, data = row
+        if base is None:
+            content = zlib.decompress(data).decode('utf-8')
+            break
+        deltas.append(data)
+        digest = base
+    for delta in reversed(deltas):
+        content = apply_delta(content, delta)
+    return content
+
+
+def head_revision(conn: sqlite3.Connection, prompt_uuid: str) -> Optional[tuple]:
+    """(修订数, 最新修订的正文哈希)"""
+    row = conn.execute('''
+        SELECT COUNT(*), (SELECT content_hash FROM revisions WHERE prompt_uuid = ? ORDER BY id DESC LIMIT 1)
+        FROM revisions WHERE prompt_uuid = ?
+    ''', (prompt_uuid, prompt_uuid)).fetchone()
+    return row if row[0] else None
+
+
+def record_revision(conn: sqlite3.Connection, prompt_uuid: str, title: str, category: str,
+                    content: str, keyframe_interval: int = KEYFRAME_INTERVAL) -> bool:
+    """在调用方的写事务中追加一个修订; 正文与最新修订相同时只更新标题/分类不新增, 返回是否新增"""
+    digest = content_hash(content)
+    head = head_revision(conn, prompt_uuid)
+    if head and head[1] == digest:
+        conn.execute('''
+            UPDATE revisions SET title = ?, category = ?
+            WHERE id = (SELECT MAX(id) FROM revisions WHERE prompt_uuid = ?)
+        ''', (title, category, prompt_uuid))
+        return False
+    # 最新修订总是全文; 如果这段正文以前出现过并存成了差异, 重新存为全文
+    store_full(conn, digest, content)
+    if head:
+        count, old_digest = head
+        # 旧的最新修订改存为相对新正文的反向差异, 每keyframe_interval个保留一个全文
+        if count % keyframe_interval != 0:
+            old_content = load_content(conn, old_digest)
+            if old_content is not None:
+                conn.execute('UPDATE blobs SET base = ?, data = ? WHERE hash = ?',
+                             (digest, make_delta(content, old_content), old_digest))
+    conn.execute('''
+        INSERT INTO revisions (prompt_uuid, title, category, content_hash, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (prompt_uuid, title, category, digest, time.time()))
+    return True
+
+
+def list_revisions(conn: sqlite3.Connection, prompt_uuid: str) -> List[Revision]:
+    """最新的在前, 不读取正文"""
+    cursor = conn.execute('''
+        SELECT r.id, r.prompt_uuid, r.title, r.category, r.content_hash, b.size, r.created_at
+        FROM revisions r JOIN blobs b ON b.hash = r.content_hash
+        WHERE r.prompt_uuid = ? ORDER BY r.id DESC
+    ''', (prompt_uuid,))
+    return [Revision(*row) for row in cursor]
+
+
+def get_revision(conn: sqlite3.Connection, revision_id: int) -> Optional[Revision]:
+    row = conn.execute('''
+        SELECT r.id, r.prompt_uuid, r.title, r.category, r.content_hash, b.size, r.created_at
+        FROM revisions r JOIN blobs b ON b.hash = r.content_hash WHERE r.id = ?
+    ''', (revision_id,)).fetchone()
+    return Revision(*row) if row else None
+
+
+def storage_stats(conn: sqlite3.Connection) -> dict:
+    revisions, = conn.execute('SELECT COUNT(*) FROM revisions').fetchone()
+    blobs, full, stored, logical = conn.execute('''
+        SELECT COUNT(*), COALESCE(SUM(base IS NULL), 0), COALESCE(SUM(length(data)), 0),
+               COALESCE(SUM(size), 0)
+        FROM blobs
+    ''').fetchone()
+    return {
+        'revisions': revisions,
+        'blobs': blobs,
+        'keyframes': full,
+        'stored_bytes': stored,
+        'content_chars': logical,
+    }
@@ -0,0 +1,187 @@
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from db import Database, PromptSummary
+
+
+@dataclass
+class SearchStats:
+    """搜索耗时统计(毫秒)"""
+    queries: int = 0          # 实际执行的查询数
+    dropped: int = 0          # 因有更新的输入而被丢弃的查询/结果数
+    cancelled: int = 0        # 执行中被中断的查询数
+    query_ms_last: float = 0.0
+    query_ms_max: float = 0.0
+    query_ms_total: float = 0.0
+    repaints: int = 0
+    repaint_ms_last: float = 0.0
+    repaint_ms_max: float = 0.0
+    repaint_ms_total: float = 0.0
+
+    @property
+    def query_ms_avg(self) -> float:
+        return self.query_ms_total / self.queries if self.queries else 0.0
+
+    @property
+    def repaint_ms_avg(self) -> float:
+        return self.repaint_ms_total / self.repaints if self.repaints else 0.0
+
+    def record_query(self, ms: float):
+        self.queries += 1
+        self.query_ms_last = ms
+        self.query_ms_max = max(self.query_ms_max, ms)
+        self.query_ms_total += ms
+
+    def record_repaint(self, ms: float):
+        self.repaints += 1
+        self.repaint_ms_last = ms
+        self.repaint_ms_max = max(self.repaint_ms_max, ms)
+        self.repaint_ms_total += ms
+
+
+def default_query(db: Database, keyword: str) -> List[PromptSummary]:
+    return db.search_summaries(keyword)
+
+
+class SearchScheduler:
+    """防抖的后台搜索调度器
+
+    输入先经过防抖, 再交给工作线程执行(使用该线程自己的只读SQLite连接).
+    新查询发出后旧查询会被丢弃(执行中的通过 conn.interrupt() 中断),
+    结果由主线程通过 after() 轮询取回并回调, Tk只在主线程被访问.
+    """
+
+    def __init__(self, widget, db: Database, on_results: Callable[[str, list], None],
+                 query: Callable[[Database, str], list] = default_query,
+                 delay_ms: int = 150, poll_ms: int = 15):
+        self.widget = widget
+        self.db = db
+        self.on_results = on_results
+        self.query = query
+        self.delay_ms = delay_ms
+        self.poll_ms = poll_ms
+        self.stats = SearchStats()
+
+        self._generation = 0          # 最新一次输入的编号
+        self._delivered = 0           # 已回调给UI的编号
+        self._debounce_id = None
+        self._poll_id = None
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._running: Optional[int] = None   # 工作线程正在执行的查询编号
+        self._conn: Optional[sqlite3.Connection] = None  # 工作线程的读连接
+
+        self._worker = threading.Thread(target=self._run, name="search-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, keyword: str):
+        """提交新的搜索词, 之前未完成的搜索全部作废"""
+        self._generation += 1
+        generation = self._generation
+        if self._debounce_id is not None:
+            self.widget.after_cancel(self._debounce_id)
+        self._debounce_id = self.widget.after(
+            self.delay_ms, lambda: self._dispatch(generation, keyword)
+        )
+
+    def cancel(self):
+        """作废所有待执行和执行中的搜索(例如搜索框被清空)"""
+        self._generation += 1
+        self._delivered = self._generation
+        if self._debounce_id is not None:
+            self.widget.after_cancel(self._debounce_id)
+            self._debounce_id = None
+        self._interrupt_stale(self._generation)
+
+    def close(self):
+        """停止工作线程"""
+        self.cancel()
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._requests.put(None)
+
+    def _dispatch(self, generation: int, keyword: str):
+        self._debounce_id = None
+        self._interrupt_stale(generation)
+        self._requests.put((generation, keyword))
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+
+    def _interrupt_stale(self, generation: int):
+        with self._lock:
+            if self._running is not None and self._running < generation and self._conn:
+                self._conn.interrupt()
+
+    def _run(self):
+        """工作线程: 只执行队列中最新的查询"""
+        self._conn = self.db.reader
+        while True:
+            item = self._requests.get()
+            # 只保留最新的请求
+            while item is not None:
+                try:
+                    newer = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                self.stats.dropped += 1
+                item = newer
+            if item is None:
+                break
+
+            generation, keyword = item
+            if generation != self._generation:
+                self.stats.dropped += 1
+                continue
+
+            with self._lock:
+                self._running = generation
+            start = time.perf_counter()
+            results = None
+            try:
+                results = self.query(self.db, keyword)
+                self.stats.record_query((time.perf_counter() - start) * 1000)
+            except sqlite3.OperationalError as e:
+                if "interrupted" in str(e):
+                    self.stats.cancelled += 1
+                else:
+                    print(f"Error searching prompts: {e}")
+            except Exception as e:
+                # 其他异常(如语义索引正在重建)也不能结束工作线程, 否则之后的搜索都没有结果
+                print(f"Error searching prompts: {e}")
+            finally:
+                with self._lock:
+                    self._running = None
+            # 失败时也回传None, 让主线程停止轮询
+            self._results.put((generation, keyword, results))
+
+        self.db.connections.close_reader()
+
+    def _poll(self):
+        """主线程: 取回结果, 只把最新一次输入的结果交给UI"""
+        self._poll_id = None
+        latest = None
+        while True:
+            try:
+                generation, keyword, results = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._generation:
+                latest = (keyword, results)
+                self._delivered = generation
+            else:
+                self.stats.dropped += 1
+
+        if latest is not None and latest[1] is not None:
+            start = time.perf_counter()
+            self.on_results(*latest)
+            self.stats.record_repaint((time.perf_counter() - start) * 1000)
+
+        # 还有未完成的查询时继续轮询
+        if self._delivered < self._generation and self._debounce_id is None:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
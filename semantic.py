@@ -0,0 +1,308 @@
+"""离线语义搜索: 本地嵌入 + 内存映射的向量索引
+
+向量保存在 prompts.db 旁边的两个NumPy文件中(以内存映射方式打开):
+    prompts.db.vectors.npy      float32 [容量, 维度], 每行一个已归一化的向量
+    prompts.db.vector_ids.npy   int64   [容量], 每行对应的prompt id, 0表示空行
+搜索时对整个矩阵做一次矩阵乘法求余弦相似度, 再用argpartition取top-k.
+
+prompts的新增、修改、删除由触发器记入vector_pending(见migrations.py),
+refresh() 只处理这些行; save_prompt/delete_prompt 之后立即刷新.
+嵌入器可替换, 默认的 HashedNgramEmbedder 只用CPU且不访问网络.
+NumPy是可选依赖, 未安装时语义搜索不可用, 混合搜索退回关键词结果.
+"""
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:   # 可选依赖
+    np = None
+
+from db import CONTENT_TEXT, SUMMARY_COLUMNS, Database, PromptSummary
+
+INDEX_META_KEY = 'vector_index'
+INITIAL_CAPACITY = 1024
+RRF_K = 60                  # 混合排序的倒数排名融合常数
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+CJK_RE = re.compile(r'[㐀-鿿]+')
+
+# 中英文常用术语映射到共同的概念特征, 使"code review"与"审查代码"能够互相命中
+CONCEPTS = {
+    'code': ('code', 'coding', 'program', 'programming', '代码', '编程', '程序'),
+    'review': ('review', 'audit', 'inspect', '审查', '审核', '检查', '评审'),
+    'translate': ('translate', 'translation', 'translator', '翻译', '译文', '互译'),
+    'document': ('document', 'documentation', 'docs', 'doc', '文档', '说明书'),
+    'write': ('write', 'writing', 'writer', 'compose', '写作', '撰写', '编写'),
+    'summary': ('summary', 'summarize', 'summarise', 'abstract', '总结', '摘要', '概括'),
+    'optimize': ('optimize', 'optimise', 'improve', 'refactor', '优化', '改进', '重构'),
+    'analyze': ('analyze', 'analyse', 'analysis', '分析', '解析'),
+    'explain': ('explain', 'explanation', 'clarify', '解释', '说明', '讲解'),
+    'think': ('think', 'thinking', 'reasoning', 'reason', '思考', '推理', '思维'),
+    'question': ('question', 'questions', 'ask', 'answer', 'qa', '问题', '提问', '回答'),
+    'teach': ('teach', 'teacher', 'tutor', 'education', 'learn', '教学', '教育', '学习', '老师'),
+    'english': ('english', '英文', '英语'),
+    'chinese': ('chinese', '中文', '汉语'),
+    'test': ('test', 'testing', 'unittest', '测试', '单元测试'),
+    'bug': ('bug', 'bugs', 'debug', 'error', 'fix', '错误', '调试', '修复'),
+    'marketing': ('marketing', 'advertising', 'copywriting', '营销', '广告', '文案'),
+    'research': ('research', 'paper', 'study', '研究', '论文'),
+    'email': ('email', 'mail', 'letter', '邮件', '信件'),
+    'story': ('story', 'fiction', 'novel', '故事', '小说'),
+}
+
+
+def _stable_hash(token: str) -> int:
+    return zlib.crc32(token.encode('utf-8'))
+
+
+class HashedNgramEmbedder:
+    """哈希技巧的词袋嵌入: 英文单词 + 中文字二元组 + 跨语言概念特征
+
+    每个特征按哈希映射到固定维度并带随机符号, 词频取对数, 最后L2归一化.
+    """
+    name = 'hashed-ngram-v1'
+
+    def __init__(self, dim: int = 512, concept_weight: float = 2.0):
+        self.dim = dim
+        self.concept_weight = concept_weight
+        self._word_concepts = {}
+        self._cjk_concepts = []
+        for concept, terms in CONCEPTS.items():
+            for term in terms:
+                if CJK_RE.fullmatch(term):
+                    self._cjk_concepts.append((term, concept))
+                else:
+                    self._word_concepts[term] = concept
+
+    def features(self, text: str) -> Counter:
+        text = text.lower()
+        counts = Counter()
+        for word in WORD_RE.findall(text):
+            counts['w:' + word] += 1.0
+            concept = self._word_concepts.get(word)
+            if concept:
+                counts['c:' + concept] += self.concept_weight
+        for run in CJK_RE.findall(text):
+            if len(run) == 1:
+                counts['z:' + run] += 1.0
+            for i in range(len(run) - 1):
+                counts['z:' + run[i:i + 2]] += 1.0
+        for term, concept in self._cjk_concepts:
+            n = text.count(term)
+            if n:
+                counts['c:' + concept] += self.concept_weight * n
+        return counts
+
+    def embed(self, texts: Sequence[str]):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self.features(text).items():
+                h = _stable_hash(feature)
+                vectors[row, h % self.dim] += (1.0 + math.log(count)) * (1 if h & 0x80000000 else -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class VectorIndex:
+    """内存映射的向量矩阵; 同一进程内的写入由调用方串行化(数据库写锁)"""
+
+    def __init__(self, db_path: str, dim: int):
+        self.vectors_path = db_path + '.vectors.npy'
+        self.ids_path = db_path + '.vector_ids.npy'
+        self.dim = dim
+        self.vectors = None
+        self.ids = None
+        self._stamp = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.vectors_path) and os.path.exists(self.ids_path)
+
+    def _file_stamp(self):
+        st = os.stat(self.vectors_path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def open(self):
+        """打开(必要时创建)文件; 其他进程扩容替换了文件时重新映射"""
+        if not self.exists():
+            self._create(INITIAL_CAPACITY)
+        stamp = self._file_stamp()
+        if self.vectors is None or stamp[:2] != self._stamp[:2]:
+            self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+            self.ids = np.load(self.ids_path, mmap_mode='r+')
+            self._stamp = stamp
+            if self.vectors.shape[1] != self.dim:
+                raise ValueError(f"vector index dim {self.vectors.shape[1]} != embedder dim {self.dim}")
+
+    def _create(self, capacity: int, vectors=None, ids=None):
+        # 先写临时文件再替换, 其他进程不会读到写了一半的文件
+        for path, dtype, shape, data in ((self.vectors_path, np.float32, (capacity, self.dim), vectors),
+                                         (self.ids_path, np.int64, (capacity,), ids)):
+            tmp = path + '.tmp.npy'
+            array = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+            if data is not None:
+                array[:len(data)] = data
+            array.flush()
+            del array
+            os.replace(tmp, path)
+        self.vectors = self.ids = None
+
+    def reset(self):
+        self.close()
+        self._create(INITIAL_CAPACITY)
+        self.open()
+
+    def _grow(self, needed: int):
+        capacity = len(self.ids)
+        while capacity < needed:
+            capacity *= 2
+        vectors, ids = np.array(self.vectors), np.array(self.ids)
+        self.close()
+        self._create(capacity, vectors, ids)
+        self.open()
+
+    def upsert(self, prompt_ids: Sequence[int], vectors):
+        self.open()
+        rows = []
+        existing = {int(i): int(r) for r, i in zip(*self._find_rows(prompt_ids))}
+        free = np.flatnonzero(self.ids == 0).tolist()
+        missing = sum(1 for i in prompt_ids if i not in existing)
+        if missing > len(free):
+            self._grow(len(self.ids) - len(free) + missing)
+            free = np.flatnonzero(self.ids == 0).tolist()
+        free.reverse()
+        for prompt_id in prompt_ids:
+            rows.append(existing[prompt_id] if prompt_id in existing else free.pop())
+        self.vectors[rows] = vectors
+        self.ids[rows] = prompt_ids
+
+    def remove(self, prompt_ids: Sequence[int]):
+        self.open()
+        rows, _ = self._find_rows(prompt_ids)
+        self.vectors[rows] = 0
+        self.ids[rows] = 0
+
+    def _find_rows(self, prompt_ids: Sequence[int]) -> Tuple:
+        rows = np.flatnonzero(np.isin(self.ids, np.asarray(prompt_ids, dtype=np.int64)))
+        return rows, self.ids[rows]
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.ids.flush()
+
+    def search(self, query, k: int) -> List[Tuple[int, float]]:
+        """[(prompt_id, 余弦相似度)], 按相似度从高到低, 只返回正相关的结果"""
+        self.open()
+        if k <= 0:
+            return []
+        scores = self.vectors @ query
+        scores[self.ids == 0] = -1.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[r]), float(scores[r])) for r in top if scores[r] > 0]
+
+    def __len__(self) -> int:
+        self.open()
+        return int(np.count_nonzero(self.ids))
+
+    def close(self):
+        self.flush()
+        self.vectors = self.ids = None
+
+
+class SemanticIndex:
+    def __init__(self, db: Database, embedder=None):
+        if np is None:
+            raise RuntimeError("semantic search requires numpy")
+        self.db = db
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.vectors = VectorIndex(db.db_path, self.embedder.dim)
+
+    def enabled(self) -> bool:
+        """向量文件存在时才在保存/删除后维护索引"""
+        return self.vectors.exists()
+
+    def _check_embedder(self, conn):
+        # 更换嵌入器或维度后旧向量不可比较, 清空索引并让所有prompt重新嵌入
+        meta = {'embedder': self.embedder.name, 'dim': self.embedder.dim}
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (INDEX_META_KEY,)).fetchone()
+        if not self.vectors.exists() or row is None or json.loads(row[0]) != meta:
+            self.vectors.reset()
+            conn.execute('INSERT OR REPLACE INTO vector_pending (prompt_id, token) '
+                         'SELECT id, random() FROM prompts')
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                         (INDEX_META_KEY, json.dumps(meta)))
+
+    def refresh(self, chunk_size: int = 256, progress=None) -> int:
+        """处理vector_pending中的新增/修改/删除, 返回处理的数量
+
+        每批在 BEGIN IMMEDIATE 事务中完成, 数据库写锁同时保护向量文件,
+        其他进程不会同时修改它.
+        """
+        done = 0
+        while True:
+            with self.db.connections.write() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                self._check_embedder(conn)
+                rows = conn.execute(f'''
+                    SELECT v.prompt_id, v.token, p.id, p.title || char(10) || {CONTENT_TEXT}
+                    FROM vector_pending v LEFT JOIN prompts p ON p.id = v.prompt_id
+                    ORDER BY v.prompt_id LIMIT ?
+                ''', (chunk_size,)).fetchall()
+                if not rows:
+                    return done
+                live = [(pid, text) for pid, _, exists, text in rows if exists is not None]
+                deleted = [pid for pid, _, exists, _ in rows if exists is None]
+                if live:
+                    self.vectors.upsert([pid for pid, _ in live],
+                                        self.embedder.embed([text for _, text in live]))
+                if deleted:
+                    self.vectors.remove(deleted)
+                self.vectors.flush()
+                conn.executemany('DELETE FROM vector_pending WHERE prompt_id = ? AND token = ?',
+                                 [(pid, token) for pid, token, _, _ in rows])
+            done += len(rows)
+            if progress:
+                progress(done)
+
+    def rebuild(self, progress=None) -> int:
+        """丢弃现有向量, 为所有prompt重新嵌入"""
+        with self.db.connections.write() as conn:
+            conn.execute('DELETE FROM meta WHERE key = ?', (INDEX_META_KEY,))
+        return self.refresh(progress=progress)
+
+    def search(self, query: str, limit: int = 50, refresh: bool = True) -> List[Tuple[int, float]]:
+        """[(prompt_id, 相似度)]; 只读实例传refresh=False, 使用其他进程维护好的索引"""
+        if refresh:
+            self.refresh()
+        elif not self.vectors.exists():
+            return []
+        return self.vectors.search(self.embedder.embed([query])[0], limit)
+
+    def close(self):
+        self.vectors.close()
+
+
+def load_summaries(db: Database, ids: List[int]) -> Dict[int, PromptSummary]:
+    if not ids:
+        return {}
+    cursor = db.reader.execute(
+        f"SELECT {SUMMARY_COLUMNS} FROM prompts WHERE id IN ({','.join('?' * len(ids))})", ids)
+    return {row[0]: PromptSummary(*row) for row in cursor}
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """合并多个排名列表: 每个列表中排第r名贡献 1/(k+r)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])
@@ -0,0 +1,390 @@
+"""本地HTTP/JSON服务, 供其他服务按uuid高频读取prompt
+
+    python server.py --port 8765
+
+    GET  /prompts/<uuid>                          完整prompt
+    GET  /prompts?uuids=<uuid>,<uuid>,...         批量读取
+    POST /prompts/batch  {"uuids": [...]}         批量读取(uuid较多时)
+    GET  /prompts?filter=custom&limit=100&after_id=0   按id分页的摘要列表
+    GET  /prompts?order=title&limit=100&cursor=...  按标题(或id)键集分页, 下一页用返回的next_cursor
+    GET  /prompts?category=写作&tag=email,draft    分类/标签(同时带有)过滤, 可与filter组合
+    GET  /facets?filter=custom&tag=email          过滤结果按分类和标签的计数
+    GET  /search?q=翻译&limit=50&cursor=...        按相关度分页的搜索摘要
+    GET  /stats                                   服务计数
+
+所有200响应都带ETag, 请求带If-None-Match且未变化时返回304.
+只实现了HTTP/1.1的必要子集(keep-alive, Content-Length请求体), 面向本机或内网调用.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import List
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from cli import FILTERS
+from db import KEYSET_ORDERS, Database, LRUCache, Page, Prompt, PromptFilter, decode_cursor
+
+MAX_BODY_BYTES = 1 << 20
+MAX_BATCH = 1000
+MAX_PAGE = 1000
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Response:
+    status: int
+    body: bytes = b''
+    etag: str = ''
+
+
+def json_body(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match or not etag:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def int_param(query: dict, name: str, default: int, maximum: int) -> int:
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer")
+    return max(0, min(value, maximum))
+
+
+def filter_param(query: dict):
+    """filter/category/tag查询参数 -> 过滤器名或PromptFilter"""
+    filter_name = query.get('filter', ['all'])[0]
+    if filter_name not in FILTERS:
+        raise HTTPError(400, f"filter must be one of {', '.join(FILTERS)}")
+    category = query.get('category', [None])[0]
+    tags = [tag for value in query.get('tag', []) for tag in value.split(',') if tag.strip()]
+    if category is None and not tags:
+        return FILTERS[filter_name]
+    return PromptFilter.from_filter_type(FILTERS[filter_name], category=category, tags=tags)
+
+
+def cursor_param(query: dict, order: str, size: int):
+    """cursor查询参数, 在进入线程池之前检查它属于这种排序"""
+    cursor = query.get('cursor', [None])[0]
+    if cursor is not None:
+        try:
+            decode_cursor(cursor, order, size)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+    return cursor
+
+
+class PromptServer:
+    """asyncio HTTP服务: 事件循环只负责协议和缓存, SQLite查询交给线程池
+
+    线程池中每个线程使用 Database 为它创建的只读连接, 相当于一个读连接池.
+    缓存只在事件循环线程访问, 不需要加锁. 任何连接(本进程或桌面程序)
+    提交写入后 PRAGMA data_version 都会变化, 每个请求先检查它, 变化时清空缓存.
+    """
+
+    def __init__(self, db: Database, workers: int = 8, cache_size: int = 4096,
+                 query_cache_size: int = 256):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prompt-reader')
+        # uuid -> (序列化后的prompt, ETag)
+        self.prompt_cache = LRUCache(maxsize=cache_size)
+        # 请求路径 -> (响应体, ETag), 用于列表和搜索
+        self.query_cache = LRUCache(maxsize=query_cache_size)
+        self.requests = 0
+        self.cache_hits = 0
+        self.not_modified = 0
+        self.started = time.time()
+        self._version_conn = None
+        self._data_version = None
+        self._generation = 0  # 每次失效加一, 防止失效前发出的查询把旧数据放回缓存
+
+    def invalidate(self):
+        self.prompt_cache.clear()
+        self.query_cache.clear()
+        self._generation += 1
+
+    def _check_data_version(self):
+        if self._version_conn is None:
+            uri = f"file:{quote(os.path.abspath(self.db.db_path))}?mode=ro"
+            self._version_conn = sqlite3.connect(uri, uri=True)
+        version = self._version_conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self.invalidate()
+
+    async def _read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _cache_prompt(self, prompt: Prompt, generation: int) -> tuple:
+        body = json_body(asdict(prompt))
+        entry = (body, make_etag(body))
+        if generation == self._generation:
+            self.prompt_cache.put(prompt.uuid, entry)
+        return entry
+
+    async def _cached_query(self, key: str, fn, *args) -> Response:
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return Response(200, *cached)
+        generation = self._generation
+        body = json_body(await self._read(fn, *args))
+        entry = (body, make_etag(body))
+        if generation == self._generation:
+            self.query_cache.put(key, entry)
+        return Response(200, *entry)
+
+    # ---- 接口 ----
+
+    async def get_prompt(self, prompt_uuid: str) -> Response:
+        cached = self.prompt_cache.get(prompt_uuid)
+        if cached is not None:
+            self.cache_hits += 1
+            return Response(200, *cached)
+        generation = self._generation
+        prompts = await self._read(self.db.get_prompts_by_uuids, [prompt_uuid])
+        if not prompts:
+            raise HTTPError(404, f"prompt not found: {prompt_uuid}")
+        return Response(200, *self._cache_prompt(prompts[0], generation))
+
+    async def get_batch(self, uuids: List[str]) -> Response:
+        """{"prompts": [...按请求顺序...], "missing": [...]}, 一次查询读取所有未缓存的uuid"""
+        if len(uuids) > MAX_BATCH:
+            raise HTTPError(413, f"at most {MAX_BATCH} uuids per request")
+        found = {}
+        misses = []
+        for u in uuids:
+            cached = self.prompt_cache.get(u)
+            if cached is not None:
+                self.cache_hits += 1
+                found[u] = cached[0]
+            elif u not in found:
+                misses.append(u)
+        if misses:
+            generation = self._generation
+            for prompt in await self._read(self.db.get_prompts_by_uuids, misses):
+                found[prompt.uuid] = self._cache_prompt(prompt, generation)[0]
+        bodies = [found[u] for u in uuids if u in found]
+        missing = [u for u in uuids if u not in found]
+        body = b'{"prompts":[' + b','.join(bodies) + b'],"missing":' + json_body(missing) + b'}'
+        return Response(200, body, make_etag(body))
+
+    def _facets(self, query: PromptFilter) -> dict:
+        return asdict(self.db.facets(query))
+
+    def _list_page(self, filter_type, limit: int, after_id: int) -> dict:
+        items = self.db.get_summaries_page(filter_type, limit, after_id=after_id)
+        return {
+            'items': [asdict(s) for s in items],
+            'next_after_id': items[-1].id if len(items) == limit else None,
+        }
+
+    def _keyset_page(self, filter_type, order_by: str, limit: int, cursor) -> dict:
+        return self._page_body(self.db.page_summaries(filter_type, order_by, limit, cursor))
+
+    def _search(self, keyword: str, limit: int, cursor) -> dict:
+        return self._page_body(self.db.page_search_summaries(keyword, limit, cursor))
+
+    @staticmethod
+    def _page_body(page: Page) -> dict:
+        return {'items': [asdict(s) for s in page.items], 'next_cursor': page.next_cursor}
+
+    def _stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'not_modified': self.not_modified,
+            'cached_prompts': len(self.prompt_cache),
+            'cached_queries': len(self.query_cache),
+            'uptime': round(time.time() - self.started, 3),
+            'total': self.db.count_prompts(FILTERS['all']),
+        }
+
+    async def handle(self, method: str, target: str, body: bytes) -> Response:
+        self._check_data_version()
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        query = parse_qs(url.query)
+
+        if parts[0] == 'prompts' and len(parts) == 1:
+            if method != 'GET':
+                raise HTTPError(405, "method not allowed")
+            if 'uuids' in query:
+                return await self.get_batch([u for v in query['uuids'] for u in v.split(',') if u])
+            filter_type = filter_param(query)
+            limit = int_param(query, 'limit', 100, MAX_PAGE)
+            if 'order' in query or 'cursor' in query:
+                order_by = query.get('order', ['id'])[0]
+                if order_by not in KEYSET_ORDERS:
+                    raise HTTPError(400, f"order must be one of {', '.join(KEYSET_ORDERS)}")
+                cursor = cursor_param(query, order_by, len(KEYSET_ORDERS[order_by]))
+                return await self._cached_query(target, self._keyset_page, filter_type, order_by,
+                                                limit or 1, cursor)
+            after_id = int_param(query, 'after_id', 0, 2 ** 63 - 1)
+            return await self._cached_query(target, self._list_page, filter_type, limit or 1, after_id)
+        if parts[0] == 'prompts' and parts[1:] == ['batch']:
+            if method != 'POST':
+                raise HTTPError(405, "method not allowed")
+            try:
+                uuids = json.loads(body.decode('utf-8'))['uuids']
+            except (ValueError, KeyError, TypeError):
+                raise HTTPError(400, 'body must be {"uuids": [...]}')
+            if not isinstance(uuids, list) or not all(isinstance(u, str) for u in uuids):
+                raise HTTPError(400, "uuids must be a list of strings")
+            return await self.get_batch(uuids)
+        if parts[0] == 'prompts' and len(parts) == 2:
+            if method != 'GET':
+                raise HTTPError(405, "method not allowed")
+            return await self.get_prompt(parts[1])
+        if parts == ['search']:
+            keyword = query.get('q', [''])[0].strip()
+            if not keyword:
+                raise HTTPError(400, "missing q")
+            limit = int_param(query, 'limit', 50, MAX_PAGE)
+            cursor = cursor_param(query, 'rank', 2)
+            return await self._cached_query(target, self._search, keyword, limit or 1, cursor)
+        if parts == ['facets']:
+            filter_type = filter_param(query)
+            if not isinstance(filter_type, PromptFilter):
+                filter_type = PromptFilter.from_filter_type(filter_type)
+            return await self._cached_query(target, self._facets, filter_type)
+        if parts == ['stats']:
+            return Response(200, json_body(await self._read(self._stats)))
+        raise HTTPError(404, f"no route for {url.path}")
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> Response:
+        self.requests += 1
+        try:
+            return await self.handle(method, target, body)
+        except HTTPError as e:
+            return Response(e.status, json_body({'error': e.message}))
+        except Exception as e:
+            print(f"Error handling {method} {target}: {e}")
+            return Response(500, json_body({'error': 'internal error'}))
+
+    def _write_response(self, writer, response: Response, if_none_match: str, keep_alive: bool):
+        status, body = response.status, response.body
+        if status == 200 and etag_matches(if_none_match, response.etag):
+            self.not_modified += 1
+            status, body = 304, b''
+        lines = [f'HTTP/1.1 {status} {STATUS_TEXT[status]}']
+        if status != 304:
+            lines.append('Content-Type: application/json; charset=utf-8')
+        lines.append(f'Content-Length: {len(body)}')
+        if response.etag:
+            lines.append(f'ETag: {response.etag}')
+            lines.append('Cache-Control: no-cache')
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    self._write_response(writer, Response(400, json_body({'error': 'bad request line'})),
+                                         '', False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_BYTES:
+                    self._write_response(writer, Response(413, json_body({'error': 'body too large'})),
+                                         '', False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                response = await self._dispatch(method.upper(), target, body)
+                self._write_response(writer, response, headers.get('if-none-match', ''), keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # 客户端断开, 或请求行/头超过StreamReader的长度限制
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._serve_connection, host, port, backlog=1024)
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8765):
+        server = await self.start(host, port)
+        print(f"serving {self.db.db_path} on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self._version_conn is not None:
+            self._version_conn.close()
+            self._version_conn = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prompt Management HTTP/JSON server")
+    parser.add_argument('--db', help="数据库路径, 默认使用程序目录下的prompts.db")
+    parser.add_argument('--no-sync', action='store_true', help="不同步内置prompts")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=8, help="读线程(读连接)数量")
+    parser.add_argument('--cache-size', type=int, default=4096, help="缓存的prompt数量")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db, sync_builtins=not args.no_sync)
+    server = PromptServer(db, workers=args.workers, cache_size=args.cache_size)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
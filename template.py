@@ -0,0 +1,164 @@
+"""Prompt正文的 {{变量}} 模板渲染
+
+    {{name}}             替换为变量name的值
+    {{ name | 默认值 }}   变量未提供时使用默认值
+
+变量名可以包含中文; 不符合以上格式的花括号原样保留.
+模板只解析一次, 编译结果按 (uuid, 正文哈希) 缓存, 正文修改后自动重新编译.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db import LRUCache, RecordError
+from revisions import content_hash
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*([^{}|]+?)\s*(?:\|([^{}]*))?\}\}')
+
+
+class TemplateError(ValueError):
+    pass
+
+
+@dataclass
+class TemplateStats:
+    """模板编译/渲染耗时统计(毫秒)"""
+    compiles: int = 0
+    cache_hits: int = 0
+    compile_ms_last: float = 0.0
+    compile_ms_total: float = 0.0
+    renders: int = 0
+    render_ms_last: float = 0.0      # 最近一次render/render_batch调用的总耗时
+    render_ms_total: float = 0.0
+
+    @property
+    def render_us_avg(self) -> float:
+        """平均每次渲染的耗时(微秒)"""
+        return self.render_ms_total * 1000 / self.renders if self.renders else 0.0
+
+    def record_compile(self, ms: float):
+        self.compiles += 1
+        self.compile_ms_last = ms
+        self.compile_ms_total += ms
+
+    def record_render(self, count: int, ms: float):
+        self.renders += count
+        self.render_ms_last = ms
+        self.render_ms_total += ms
+
+
+@dataclass
+class RenderBatch:
+    outputs: List[Optional[str]] = field(default_factory=list)   # 渲染失败的位置为None
+    errors: List[RecordError] = field(default_factory=list)
+    cached: bool = False          # 编译结果是否来自缓存
+    compile_ms: float = 0.0
+    render_ms: float = 0.0
+
+
+class CompiledTemplate:
+    """编译后的模板: 正文转换为只含位置参数的str.format格式串, 渲染时不再解析"""
+
+    def __init__(self, content: str):
+        self.names: Tuple[str, ...] = ()
+        self.defaults: Dict[str, str] = {}
+        slots = {}       # 变量名 -> 位置参数序号
+        fallbacks = []   # 每个变量未提供时使用的值: 默认值, 否则保留原占位符
+        parts = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(content):
+            parts.append(self._escape(content[pos:match.start()]))
+            name, default = match.group(1), match.group(2)
+            if name not in slots:
+                slots[name] = len(slots)
+                fallbacks.append(match.group(0) if default is None else default.strip())
+            if default is not None and name not in self.defaults:
+                self.defaults[name] = default.strip()
+                fallbacks[slots[name]] = self.defaults[name]
+            parts.append(f'{{{slots[name]}}}')
+            pos = match.end()
+        parts.append(self._escape(content[pos:]))
+        self.names = tuple(slots)
+        self._slots = tuple(zip(self.names, fallbacks))
+        self._format = ''.join(parts).format
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        return text.replace('{', '{{').replace('}', '}}')
+
+    def missing(self, variables: dict) -> List[str]:
+        """没有提供且没有默认值的变量"""
+        return [n for n in self.names if n not in variables and n not in self.defaults]
+
+    def render(self, variables: dict, strict: bool = False) -> str:
+        """strict为True时缺少变量抛出TemplateError, 否则保留原占位符"""
+        if strict:
+            missing = self.missing(variables)
+            if missing:
+                raise TemplateError(f"missing variables: {', '.join(missing)}")
+        get = variables.get
+        return self._format(*[get(name, fallback) for name, fallback in self._slots])
+
+
+class TemplateEngine:
+    """编译缓存 + 渲染耗时统计, 可在多个线程中使用"""
+
+    def __init__(self, cache_size: int = 256):
+        self.cache = LRUCache(maxsize=cache_size)
+        self.stats = TemplateStats()
+        self._lock = threading.Lock()
+
+    def compile(self, content: str, key: Optional[str] = None) -> Tuple[CompiledTemplate, bool]:
+        """返回 (编译结果, 是否命中缓存); key通常为prompt的uuid, 编辑器中未保存的正文可以不传"""
+        cache_key = (key, content_hash(content))
+        with self._lock:
+            compiled = self.cache.get(cache_key)
+            if compiled is not None:
+                self.stats.cache_hits += 1
+                return compiled, True
+        start = time.perf_counter()
+        compiled = CompiledTemplate(content)
+        ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.cache.put(cache_key, compiled)
+            self.stats.record_compile(ms)
+        return compiled, False
+
+    def variables(self, content: str, key: Optional[str] = None) -> Tuple[str, ...]:
+        return self.compile(content, key)[0].names
+
+    def render(self, content: str, variables: dict, key: Optional[str] = None,
+               strict: bool = False) -> str:
+        compiled, _ = self.compile(content, key)
+        start = time.perf_counter()
+        text = compiled.render(variables, strict)
+        with self._lock:
+            self.stats.record_render(1, (time.perf_counter() - start) * 1000)
+        return text
+
+    def render_batch(self, content: str, variable_sets: Iterable[dict], key: Optional[str] = None,
+                     strict: bool = False) -> RenderBatch:
+        """用同一模板渲染多组变量; 单组出错记录在errors中, 不影响其他组"""
+        start = time.perf_counter()
+        compiled, cached = self.compile(content, key)
+        result = RenderBatch(cached=cached, compile_ms=(time.perf_counter() - start) * 1000)
+        render = compiled.render
+        outputs = result.outputs
+        start = time.perf_counter()
+        for index, variables in enumerate(variable_sets):
+            try:
+                # 与bulk_upsert一样, 解析失败的记录以ValueError实例传入
+                if isinstance(variables, ValueError):
+                    raise variables
+                if not isinstance(variables, dict):
+                    raise TemplateError("variables must be an object")
+                outputs.append(render(variables, strict))
+            except ValueError as e:
+                outputs.append(None)
+                result.errors.append(RecordError(index, key or '', str(e)))
+        result.render_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.stats.record_render(len(outputs), result.render_ms)
+        return result
@@ -0,0 +1,219 @@
+"""Prompt正文统计: 字符数、词数、行数和各分词器的近似token数
+
+统计按正文sha1缓存在text_stats表中, 相同正文只算一次. prompts.content_hash
+指向这张表; 单条保存时立即计算, 批量导入/同步的记录由 backfill() 补齐,
+数量较多时交给进程池并行计算.
+
+token计数器可替换: register_counter(name, fn) 注册 fn(text) -> int.
+内置的 'approx' 按cl100k一类BPE分词器的切分规律估算(英文单词、数字每3位、
+中日韩字符、标点), 不需要任何模型文件; 安装了tiktoken时额外注册
+'cl100k_base' 和 'o200k_base' 的精确计数.
+"""
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from db import CONTENT_TEXT
+from revisions import content_hash
+
+DEFAULT_COUNTER = 'approx'   # text_stats.tokens 使用的计数器, 排序和过滤按它进行
+POOL_THRESHOLD = 2000        # 待计算的正文少于这个数量时直接在当前进程计算
+CHUNK_SIZE = 500
+
+CJK = '぀-ヿ㐀-鿿가-힯豈-﫿'
+LONG_WORD_RE = re.compile(r'[A-Za-z]{7,}')
+LATIN_RE = re.compile(r'[A-Za-z]+')
+DIGITS_RE = re.compile(r'\d+')
+CJK_RE = re.compile(f'[{CJK}]')
+NEWLINES_RE = re.compile(r'\n+')
+SPACES_RE = re.compile(r'[^\S\n]{2,}')
+SYMBOLS_RE = re.compile(f'[^\\sA-Za-z\\d{CJK}]+')
+ALNUM_RE = re.compile(r'[A-Za-z\d]+')
+
+
+@dataclass
+class TextStats:
+    chars: int
+    words: int     # 英文单词/数字按空白切分, 中日韩文字每个字算一个词
+    lines: int
+    tokens: Dict[str, int]   # 计数器名 -> token数
+
+    @property
+    def approx_tokens(self) -> int:
+        return self.tokens.get(DEFAULT_COUNTER, 0)
+
+
+def approx_tokens(text: str) -> int:
+    """按BPE分词器的常见切分估算token数, 英文/中文混合文本误差约在15%以内
+
+    每类片段用一个正则统计, 不在Python中逐个片段循环.
+    """
+    total = len(LATIN_RE.findall(text))   # 常见短词是一个token
+    total += sum(len(w) - 6 for w in LONG_WORD_RE.findall(text)) / 4   # 长词大约每4个字母一个
+    total += sum((len(d) + 2) // 3 for d in DIGITS_RE.findall(text))
+    total += len(CJK_RE.findall(text)) * 1.3   # 生僻字会被拆成多个字节token
+    total += len(NEWLINES_RE.findall(text))
+    total += len(SPACES_RE.findall(text))      # 单个空格并入下一个词
+    total += sum((len(p) + 1) // 2 for p in SYMBOLS_RE.findall(text))
+    return int(round(total))
+
+
+COUNTERS: Dict[str, Callable[[str], int]] = {
+    DEFAULT_COUNTER: approx_tokens,
+}
+
+
+def register_counter(name: str, counter: Callable[[str], int]):
+    """注册token计数器; 进程池回填需要counter可以被pickle(模块级函数)"""
+    COUNTERS[name] = counter
+
+
+try:
+    import tiktoken
+except ImportError:   # 可选依赖
+    tiktoken = None
+
+if tiktoken is not None:
+    class TiktokenCounter:
+        def __init__(self, encoding: str):
+            self.encoding = encoding
+            self._encoder = None
+
+        def __call__(self, text: str) -> int:
+            if self._encoder is None:
+                self._encoder = tiktoken.get_encoding(self.encoding)
+            return len(self._encoder.encode(text, disallowed_special=()))
+
+        def __getstate__(self):
+            return {'encoding': self.encoding, '_encoder': None}
+
+    for _encoding in ('cl100k_base', 'o200k_base'):
+        register_counter(_encoding, TiktokenCounter(_encoding))
+
+
+def compute(text: str, counters: Optional[Dict[str, Callable[[str], int]]] = None) -> TextStats:
+    counters = COUNTERS if counters is None else counters
+    return TextStats(
+        chars=len(text),
+        words=len(ALNUM_RE.findall(text)) + len(CJK_RE.findall(text)),
+        lines=text.count('\n') + 1 if text else 0,
+        tokens={name: counter(text) for name, counter in counters.items()},
+    )
+
+
+def store(conn: sqlite3.Connection, digest: str, stats: TextStats):
+    """在调用方的写事务中缓存统计; 相同正文的统计不会变化, 已存在时跳过"""
+    conn.execute('''
+        INSERT OR IGNORE INTO text_stats (content_hash, chars, words, lines, tokens, token_counts)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (digest, stats.chars, stats.words, stats.lines, stats.approx_tokens,
+          json.dumps(stats.tokens)))
+
+
+def record(conn: sqlite3.Connection, prompt_id: int, text: str) -> str:
+    """保存单条prompt时在同一事务中记录正文哈希和统计, 返回哈希"""
+    digest = content_hash(text)
+    conn.execute('UPDATE prompts SET content_hash = ? WHERE id = ?', (digest, prompt_id))
+    if not conn.execute('SELECT 1 FROM text_stats WHERE content_hash = ?', (digest,)).fetchone():
+        store(conn, digest, compute(text))
+    return digest
+
+
+def load(conn: sqlite3.Connection, digest: str) -> Optional[TextStats]:
+    row = conn.execute('SELECT chars, words, lines, token_counts FROM text_stats WHERE content_hash = ?',
+                       (digest,)).fetchone()
+    if not row:
+        return None
+    return TextStats(row[0], row[1], row[2], json.loads(row[3]))
+
+
+_worker_counters = None
+
+
+def _init_worker(counters):
+    global _worker_counters
+    _worker_counters = counters
+
+
+def _compute_chunk(items: List[Tuple[str, str]]) -> List[Tuple[str, TextStats]]:
+    return [(digest, compute(text, _worker_counters)) for digest, text in items]
+
+
+def _fill_hashes(db, chunk_size: int) -> int:
+    """为content_hash为空的prompt(批量写入或外部修改过正文)补上哈希"""
+    filled = 0
+    while True:
+        with db.connections.write() as conn:
+            rows = conn.execute(f'SELECT id, {CONTENT_TEXT} FROM prompts WHERE content_hash IS NULL LIMIT ?',
+                                (chunk_size,)).fetchall()
+            conn.executemany('UPDATE prompts SET content_hash = ? WHERE id = ?',
+                             [(content_hash(text), prompt_id) for prompt_id, text in rows])
+        filled += len(rows)
+        if len(rows) < chunk_size:
+            return filled
+
+
+def _missing(db, chunk_size: int) -> Iterable[List[Tuple[str, str]]]:
+    """每个还没有统计的正文哈希取一条prompt的正文, 分块产出"""
+    cursor = db.reader.execute(f'''
+        SELECT p.content_hash, {CONTENT_TEXT} FROM prompts p
+        WHERE p.content_hash IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM text_stats s WHERE s.content_hash = p.content_hash)
+        GROUP BY p.content_hash
+    ''')
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def backfill(db, workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE,
+             progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """补齐缺少统计的prompt, 返回新计算的正文数
+
+    计算结果按正文哈希写入, 与计算期间prompt是否又被修改无关, 因此计算可以在
+    写事务之外并行进行. 待计算的数量超过POOL_THRESHOLD且有多个CPU时使用进程池.
+    """
+    _fill_hashes(db, chunk_size)
+    total = db.reader.execute('''
+        SELECT COUNT(DISTINCT content_hash) FROM prompts p
+        WHERE content_hash IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM text_stats s WHERE s.content_hash = p.content_hash)
+    ''').fetchone()[0]
+    done = 0
+
+    def save(results):
+        nonlocal done
+        with db.connections.write() as conn:
+            for digest, stats in results:
+                store(conn, digest, stats)
+        done += len(results)
+        if progress:
+            progress(done, total)
+
+    workers = workers or os.cpu_count() or 1
+    if total < POOL_THRESHOLD or workers == 1:
+        _init_worker(dict(COUNTERS))
+        for chunk in _missing(db, chunk_size):
+            save(_compute_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(dict(COUNTERS),)) as pool:
+            for results in pool.map(_compute_chunk, _missing(db, chunk_size)):
+                save(results)
+    prune(db)
+    return done
+
+
+def prune(db) -> int:
+    """删除没有prompt再引用的统计"""
+    with db.connections.write() as conn:
+        return conn.execute('''
+            DELETE FROM text_stats WHERE NOT EXISTS
+                (SELECT 1 FROM prompts p WHERE p.content_hash = text_stats.content_hash)
+        ''').rowcount
@@ -0,0 +1,184 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from db import Database, Prompt
+
+
+@dataclass
+class WriteOp:
+    """排队中的写操作, 同一个prompt(按uuid)只保留最后一次"""
+    kind: str                      # 'save' / 'delete'
+    key: str                       # prompt uuid
+    prompt: Optional[Prompt] = None
+    prompt_id: Optional[int] = None
+    submitted: int = 1             # 合并进这个操作的提交次数
+    ok: bool = False
+
+
+@dataclass
+class WriteStats:
+    """写队列统计(毫秒)"""
+    submitted: int = 0
+    coalesced: int = 0             # 被后来的提交取代而没有执行的操作数
+    written: int = 0
+    failed: int = 0
+    write_ms_last: float = 0.0
+    write_ms_max: float = 0.0
+    write_ms_total: float = 0.0
+
+    @property
+    def write_ms_avg(self) -> float:
+        done = self.written + self.failed
+        return self.write_ms_total / done if done else 0.0
+
+    def record_write(self, ms: float, ok: bool):
+        if ok:
+            self.written += 1
+        else:
+            self.failed += 1
+        self.write_ms_last = ms
+        self.write_ms_max = max(self.write_ms_max, ms)
+        self.write_ms_total += ms
+
+
+class WriteQueue:
+    """后台写队列
+
+    保存/删除只是入队, 由工作线程在合并窗口(delay_ms)结束后执行; 窗口内对同一个
+    prompt的多次保存合并为一次, 保存后又删除则只执行删除. 完成结果由主线程通过
+    after() 轮询取回并回调 on_done(op), Tk只在主线程被访问.
+    """
+
+    def __init__(self, widget, db: Database, on_done: Callable[[WriteOp], None],
+                 delay_ms: int = 150, poll_ms: int = 30):
+        self.widget = widget
+        self.db = db
+        self.on_done = on_done
+        self.delay = delay_ms / 1000
+        self.poll_ms = poll_ms
+        self.stats = WriteStats()
+
+        self._pending: "OrderedDict[str, WriteOp]" = OrderedDict()
+        self._running = 0                 # 工作线程已取出但还没完成的操作数
+        self._cond = threading.Condition()
+        self._results = queue.Queue()
+        self._poll_id = None
+        self._closed = False
+        self._urgent = False              # flush/close请求跳过合并窗口
+
+        self._worker = threading.Thread(target=self._run, name="write-worker", daemon=True)
+        self._worker.start()
+
+    def save(self, prompt: Prompt):
+        """排队保存(按uuid插入或更新), prompt.uuid必须已经确定"""
+        self._submit(WriteOp('save', prompt.uuid, prompt=prompt, prompt_id=prompt.id))
+
+    def delete(self, prompt_uuid: str, prompt_id: Optional[int] = None):
+        self._submit(WriteOp('delete', prompt_uuid, prompt_id=prompt_id))
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending) + self._running
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中的操作全部写完(不等待合并窗口), 返回是否在超时前完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        self._deliver()
+        return True
+
+    def close(self, timeout: Optional[float] = 5.0) -> bool:
+        """写完剩余操作后停止工作线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        done = self.flush(timeout)
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        return done
+
+    def _submit(self, op: WriteOp):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write queue is closed")
+            self.stats.submitted += 1
+            previous = self._pending.get(op.key)
+            if previous is not None:
+                # 保留原来的排队位置, 内容以最后一次提交为准
+                op.submitted += previous.submitted
+                self.stats.coalesced += 1
+                if op.kind == 'delete' and op.prompt_id is None:
+                    op.prompt_id = previous.prompt_id
+            self._pending[op.key] = op
+            self._cond.notify_all()
+        if self._poll_id is None:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # 合并窗口: 从第一个操作入队起等待delay, 期间的提交合并; 关闭或flush时立即写入
+                deadline = time.monotonic() + self.delay
+                while not (self._closed or self._urgent):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                ops = list(self._pending.values())
+                self._pending.clear()
+                self._urgent = False
+                self._running = len(ops)
+            for op in ops:
+                start = time.perf_counter()
+                try:
+                    op.ok = self._execute(op)
+                except Exception as e:
+                    print(f"Error writing prompt: {e}")
+                    op.ok = False
+                self.stats.record_write((time.perf_counter() - start) * 1000, op.ok)
+                self._results.put(op)
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def _execute(self, op: WriteOp) -> bool:
+        if op.kind == 'save':
+            return self.db.save_prompt(op.prompt)
+        prompt_id = op.prompt_id
+        if prompt_id is None:
+            row = self.db.reader.execute('SELECT id FROM prompts WHERE uuid = ?', (op.key,)).fetchone()
+            if not row:
+                return True     # 还没写入就被删除
+            prompt_id = row[0]
+        return self.db.delete_prompt(prompt_id)
+
+    def _deliver(self):
+        while True:
+            try:
+                op = self._results.get_nowait()
+            except queue.Empty:
+                return
+            self.on_done(op)
+
+    def _poll(self):
+        """主线程: 把完成的操作交给UI, 还有未完成的操作时继续轮询"""
+        self._poll_id = None
+        self._deliver()
+        if self.pending() or not self._results.empty():
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)